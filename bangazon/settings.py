@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -46,7 +47,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'bangazonapi.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
@@ -59,16 +60,64 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'bangazonapi.metrics.MetricsMiddleware',
+    'bangazonapi.querybudget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bangazonapi.replicas.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'bangazonapi.profiling.RequestProfilingMiddleware',
 ]
 
+# Resolved tokens, with their user and customer, cached per worker process
+TOKEN_CACHE_SIZE = 1024
+TOKEN_CACHE_TTL = 60
+
+# SQL queries allowed per request, by method and URL name. Requests over budget are
+# logged, or raise with BANGAZON_QUERY_BUDGET_ACTION=raise, and query shapes
+# repeated QUERY_REPEAT_THRESHOLD times in one request are logged as likely
+# N+1s. Tests assert the same budgets with QueryBudgetTestMixin.
+QUERY_BUDGETS = {
+    'GET product-list': 6,
+    'GET product-detail': 6,
+    'GET product-export': 6,
+    'GET productcategory-list': 4,
+    'GET cart-list': 8,
+    'GET cart-summary': 2,
+    'GET order-list': 8,
+    'GET order-detail': 8,
+    'GET store-list': 6,
+    'GET store-detail': 6,
+    'GET profile-list': 10,
+    'GET order-reports': 4,
+    'GET expensive_products_report': 4,
+    'GET inexpensive_products_report': 4,
+    'GET favorite_sellers_report': 4,
+}
+QUERY_BUDGET_DEFAULT = None
+QUERY_BUDGET_ACTION = os.environ.get('BANGAZON_QUERY_BUDGET_ACTION', 'log')
+QUERY_REPEAT_THRESHOLD = 5
+
+# Each worker process keeps its Prometheus counters in its own mmap'd file
+# here; /metrics adds them up. Tests write to a temporary directory instead.
+METRICS_DIR = os.environ.get(
+    'BANGAZON_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'bangazon-metrics')
+)
+TEST_RUNNER = 'bangazonapi.testrunner.TemporaryDirectoryRunner'
+
+# Requests sent with an X-Profile header by staff users, or with one of
+# these tokens, are profiled into REQUEST_PROFILE_DIR.
+REQUEST_PROFILE_TOKENS = [
+    token for token in os.environ.get('BANGAZON_PROFILE_TOKENS', '').split(',') if token
+]
+REQUEST_PROFILE_DIR = os.environ.get('BANGAZON_PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+REQUEST_PROFILE_INTERVAL = 0.001
+
 CORS_ORIGIN_WHITELIST = (
     'http://localhost:3000',
     'http://127.0.0.1:3000'
@@ -97,6 +146,12 @@ WSGI_APPLICATION = 'bangazon.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
+#
+# BANGAZON_DB_PROFILE=production applies SQLITE_PRODUCTION for several
+# worker processes sharing the file: WAL lets reads run alongside the one
+# writer, IMMEDIATE transactions take the write lock when they begin rather
+# than deadlocking on upgrade, writers wait up to timeout seconds for the
+# lock, and connections persist between requests.
 
 DATABASES = {
     'default': {
@@ -105,9 +160,79 @@ DATABASES = {
 
     }
 }
+SQLITE_PRODUCTION = {
+    'CONN_MAX_AGE': None,
+    'CONN_HEALTH_CHECKS': True,
+    'OPTIONS': {
+        'init_command': (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            'PRAGMA mmap_size=268435456;'
+            'PRAGMA cache_size=-65536'
+        ),
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 5,
+    },
+}
+DB_PROFILE = os.environ.get('BANGAZON_DB_PROFILE', 'default')
+if DB_PROFILE == 'production':
+    DATABASES['default'].update(SQLITE_PRODUCTION)
+
+# Read replicas, as a comma-separated list of SQLite files in
+# BANGAZON_REPLICAS, serve the safe requests of views using
+# bangazonapi.replicas. `manage.py refresh_replicas --interval 5` keeps
+# local copies of the primary. Users read from the primary for
+# REPLICA_PIN_SECONDS after they write.
+DATABASE_REPLICAS = []
+for number, path in enumerate(
+    (path for path in os.environ.get('BANGAZON_REPLICAS', '').split(',') if path), 1
+):
+    DATABASES[f'replica{number}'] = dict(
+        DATABASES['default'], NAME=path, TEST={'MIRROR': 'default'}
+    )
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['bangazonapi.replicas.ReplicaRouter']
+REPLICA_PIN_SECONDS = 5
+
+# Views marked with retry_on_lock run again this many times when SQLite is
+# locked, after jittered delays doubling from DB_LOCK_RETRY_DELAY seconds.
+DB_LOCK_RETRIES = 5
+DB_LOCK_RETRY_DELAY = 0.01
+DB_LOCK_RETRY_MAX_DELAY = 0.5
+
+# Adding to a cart holds the units this long; `manage.py sweep_stock_holds
+# --interval 30` releases expired holds.
+INVENTORY_HOLD_SECONDS = 15 * 60
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
 
+# Caches
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+#
+# The response cache holds the category list and the product landing page.
+# Set BANGAZON_RESPONSE_CACHE_BACKEND to
+# django.core.cache.backends.filebased.FileBasedCache and
+# BANGAZON_RESPONSE_CACHE_LOCATION to a directory to share it, and its
+# invalidation versions, between worker processes.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': os.environ.get(
+            'BANGAZON_RESPONSE_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('BANGAZON_RESPONSE_CACHE_LOCATION', 'bangazon-responses'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -139,3 +264,12 @@ APPEND_SLASH = False
 
 MEDIA_ROOT = 'media'
 MEDIA_URL = '/media/'
+
+# Resized copies of uploaded product images, as maximum (width, height).
+# They are generated by a pool of PRODUCT_IMAGE_WORKERS threads, or inline
+# when it is 0.
+PRODUCT_IMAGE_VARIANTS = {
+    'thumbnail': (150, 150),
+    'medium': (600, 600),
+}
+PRODUCT_IMAGE_WORKERS = int(os.environ.get('BANGAZON_IMAGE_WORKERS', 2))
@@ -4,7 +4,7 @@ from django.conf.urls.static import static
 from rest_framework import routers
 from rest_framework.authtoken.views import obtain_auth_token
 from bangazonapi.models import *
-from bangazonapi.views import register_user,login_user,Orders,Payments,Products,Cart,Profile,ProductCategories,LineItems,Customers,Users,StoreViewSet
+from bangazonapi.views import register_user,login_user,Orders,Payments,Products,Cart,Profile,ProductCategories,LineItems,Customers,Users,StoreViewSet,cache_stats,prometheus_metrics
 from bangazonapi.views.product import (
     expensive_products_report,
     inexpensive_products_report,
@@ -45,4 +45,6 @@ urlpatterns = [
         name="inexpensive_products_report",
     ),
     path('reports/favoritesellers', Customers.as_view({'get': 'favorite_sellers_report'}), name='favorite_sellers_report'),
+    path("cache-stats", cache_stats, name="cache_stats"),
+    path("metrics", prometheus_metrics, name="metrics"),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
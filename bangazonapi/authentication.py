@@ -0,0 +1,131 @@
+"""Token authentication backed by a per-process LRU cache"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from bangazonapi.models import Customer
+
+
+class TokenCache:
+    """Bounded LRU of token key -> Token with its user, customer and store, expiring after ttl
+
+    Entries are evicted by user through signals when a token is deleted or
+    its user or customer is saved. The cache lives in each worker process,
+    so other workers may serve a stale entry for up to ttl seconds.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, token = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return token
+
+    def set(self, key, token):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, token)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def evict_user(self, user_id):
+        with self._lock:
+            for key in [key for key, (_, token) in self._entries.items() if token.user_id == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_UNRESOLVED = object()
+
+token_cache = TokenCache(
+    maxsize=getattr(settings, "TOKEN_CACHE_SIZE", 1024),
+    ttl=getattr(settings, "TOKEN_CACHE_TTL", 60),
+)
+
+
+def _detached(token):
+    """Copy a cached token, user, customer and store, so requests never share instances"""
+    token = copy.copy(token)
+    user = copy.copy(token.user)
+    customer = getattr(user, "customer", None)
+    if customer is not None:
+        customer = copy.copy(customer)
+        store = getattr(customer, "store", None)
+        if store is not None:
+            customer.store = copy.copy(store)
+        user.customer = customer
+    token.user = user
+    return token
+
+
+def current_customer(request):
+    """The requesting user's customer, with user and store joined, loaded once per request
+
+    Token requests get it from authentication; others query it on first use.
+    Nested serializers reach it through their context's request.
+
+    Raises:
+        Customer.DoesNotExist -- The user has no customer, as Customer.objects.get would
+    """
+    user = request.user
+    customer = getattr(request, "customer", _UNRESOLVED)
+    if customer is _UNRESOLVED:
+        customer = None
+        if user.is_authenticated:
+            customer = Customer.objects.select_related("user", "store").filter(user=user).first()
+        request.customer = customer
+
+    if customer is None:
+        raise Customer.DoesNotExist("The requesting user has no customer")
+    return customer
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication resolving token, user, customer and store in one cached query
+
+    The customer, or None for users without one, is attached to the
+    request as `request.customer`.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            request.customer = getattr(result[0], "customer", None)
+        return result
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related(
+                    "user", "user__customer", "user__customer__store"
+                ).get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_("Invalid token."))
+            token_cache.set(key, token)
+
+        token = _detached(token)
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+
+        return (token.user, token)
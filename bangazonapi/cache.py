@@ -0,0 +1,122 @@
+"""Response data cache with version-counter invalidation
+
+Cached entries are keyed by a namespace version. Model signals bump the
+version instead of deleting keys, so every entry built from older data
+becomes unreachable at once and ages out of the backend on its own.
+Versions live in the cache backend itself, which makes the file backend
+consistent across worker processes.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+from django.core.cache import caches
+from django.db import transaction
+from bangazonapi import metrics
+
+RESPONSE_CACHE = "responses"
+
+CATALOG = "catalog"
+CATEGORIES = "categories"
+CARTS = "carts"
+
+_lock = threading.Lock()
+_counters = {}
+
+
+def _cache():
+    return caches[RESPONSE_CACHE]
+
+
+def _count(namespace, outcome):
+    with _lock:
+        key = (namespace, outcome)
+        _counters[key] = _counters.get(key, 0) + 1
+    metrics.inc(
+        "bangazon_cache_requests",
+        {"namespace": namespace, "outcome": "hit" if outcome == "hits" else "miss"},
+    )
+
+
+def get_version(namespace):
+    """Current version of a namespace
+
+    Versions are nanosecond timestamps of the last change, so they double
+    as Last-Modified values and never repeat after an eviction.
+    """
+    key = f"version:{namespace}"
+    version = _cache().get(key)
+    if version is None:
+        _cache().add(key, time.time_ns(), timeout=None)
+        version = _cache().get(key)
+    return version
+
+
+def bump_version(namespace, scope=None):
+    """Invalidate every cached entry of a namespace, or of one scope within it"""
+    if scope is not None:
+        namespace = f"{namespace}:{scope}"
+    key = f"version:{namespace}"
+    current = _cache().get(key) or 0
+    _cache().set(key, max(time.time_ns(), current + 1), timeout=None)
+
+
+def bump_version_on_commit(namespace, scope=None):
+    """Bump a version once the current transaction commits, or never if it rolls back
+
+    A read between an early bump and the commit would cache the old data
+    under the new version.
+    """
+    transaction.on_commit(lambda: bump_version(namespace, scope))
+
+
+def version_datetime(namespace):
+    """The namespace version as the datetime of its last change"""
+    return datetime.fromtimestamp(get_version(namespace) / 1e9, tz=timezone.utc)
+
+
+def cached(namespace, variant, build, scope=None):
+    """Return the cached value for variant, building and storing it on a miss
+
+    Arguments:
+        namespace -- Invalidation namespace such as CATALOG
+        variant -- String distinguishing entries within the namespace
+        build -- Callable producing the value on a miss
+        scope -- Optional key, such as a customer id, with its own version
+                 within the namespace; counters still add up per namespace
+
+    Returns:
+        The cached or freshly built value
+    """
+    versioned = namespace if scope is None else f"{namespace}:{scope}"
+    key = f"{versioned}:{get_version(versioned)}:{variant}"
+    value = _cache().get(key)
+    if value is not None:
+        _count(namespace, "hits")
+        return value
+
+    _count(namespace, "misses")
+    value = build()
+    _cache().set(key, value)
+    return value
+
+
+def stats():
+    """Hit and miss counters of this process
+
+    Returns:
+        dict -- {namespace: {"hits": int, "misses": int, "hit_ratio": float}}
+    """
+    with _lock:
+        counters = dict(_counters)
+
+    summary = {}
+    for namespace in {namespace for namespace, _ in counters}:
+        hits = counters.get((namespace, "hits"), 0)
+        misses = counters.get((namespace, "misses"), 0)
+        summary[namespace] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+        }
+    return summary
@@ -0,0 +1,50 @@
+"""Conditional GET support from cheap per-object versions
+
+Views compute validators from updated-at columns or version counters
+before loading or serializing anything, so a matching `If-None-Match` or
+`If-Modified-Since` costs a single narrow query.
+"""
+
+import hashlib
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+def validators(request, *versions):
+    """Build a strong ETag and Last-Modified timestamp for a representation
+
+    The ETag also covers the requesting user and host, since payloads
+    contain per-user flags such as `is_liked` and absolute URLs.
+
+    Arguments:
+        versions -- datetimes or counters that change whenever the payload does
+
+    Returns:
+        tuple -- (quoted ETag, Last-Modified as a Unix timestamp or None)
+    """
+    user_id = request.user.pk if request.user.is_authenticated else None
+    fingerprint = repr((request.get_host(), user_id) + versions)
+    etag = f'"{hashlib.sha1(fingerprint.encode()).hexdigest()}"'
+
+    timestamps = [
+        int(version.timestamp()) for version in versions if hasattr(version, "timestamp")
+    ]
+    last_modified = max(timestamps) if timestamps else None
+
+    return etag, last_modified
+
+
+def not_modified(request, etag, last_modified):
+    """A 304 (or 412) response when the client's copy is current, otherwise None"""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        add_validators(response, etag, last_modified)
+    return response
+
+
+def add_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    patch_vary_headers(response, ("Authorization",))
+    return response
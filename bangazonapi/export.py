@@ -0,0 +1,67 @@
+"""Streaming NDJSON and CSV renditions of serialized rows
+
+The writers consume an iterator of serialized chunks and yield encoded
+lines, so a response built on them holds one chunk in memory at a time
+however many rows it covers.
+"""
+
+import csv
+import json
+from itertools import islice
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+CHUNK_SIZE = 500
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Lets `?format=ndjson` and `Accept: application/x-ndjson` negotiate"""
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder).encode() + b"\n"
+
+
+class CSVRenderer(BaseRenderer):
+    """Lets `?format=csv` and `Accept: text/csv` negotiate"""
+
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def chunks(queryset, chunk_size=CHUNK_SIZE):
+    """Lists of at most chunk_size rows streamed from a server-side iterator"""
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def ndjson_lines(serialized_chunks):
+    """One JSON document per row"""
+    for rows in serialized_chunks:
+        yield "".join(json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in rows)
+
+
+def csv_lines(serialized_chunks, columns):
+    """A header line, then one line per row restricted to columns"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for rows in serialized_chunks:
+        yield "".join(writer.writerow([row.get(column) for column in columns]) for row in rows)
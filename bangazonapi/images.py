@@ -0,0 +1,148 @@
+"""Content-addressed product image ingestion with background thumbnails"""
+
+import base64
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_TO = "products"
+ALLOWED_EXTENSIONS = {"jpeg", "jpg", "png", "gif", "webp"}
+
+# Multiple of 4 so every slice decodes on its own
+CHUNK_CHARS = 4 * 64 * 1024
+
+CONTENT_ADDRESSED = re.compile(rf"^{UPLOAD_TO}/[0-9a-f]{{2}}/[0-9a-f]{{64}}\.\w+$")
+
+_executor = None
+
+
+def _variants():
+    return settings.PRODUCT_IMAGE_VARIANTS
+
+
+def _pool():
+    """Lazily started pool, so management commands don't spawn threads"""
+    global _executor  # pylint: disable=global-statement
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.PRODUCT_IMAGE_WORKERS,
+            thread_name_prefix="thumbnails",
+        )
+    return _executor
+
+
+def ingest_data_uri(data_uri):
+    """Store a base64 `data:` URI image under the hash of its contents
+
+    The payload is decoded slice by slice into a temporary file while it
+    is hashed, so the decoded image is never held in memory at once.
+    Identical images map to the same file and are stored only once.
+
+    Arguments:
+        data_uri -- String such as "data:image/png;base64,iVBORw0..."
+
+    Returns:
+        str -- Storage name of the image
+
+    Raises:
+        ValueError -- The payload isn't a base64 image of an allowed type
+    """
+    try:
+        header, encoded = data_uri.split(";base64,")
+    except (AttributeError, ValueError):
+        raise ValueError("image_path must be a base64 data URI")
+
+    ext = header.split("/")[-1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise ValueError(f"Unsupported image type: {ext}")
+
+    if any(character.isspace() for character in encoded[:CHUNK_CHARS]):
+        encoded = "".join(encoded.split())
+
+    digest = hashlib.sha256()
+    temp = tempfile.NamedTemporaryFile(suffix=f".{ext}", delete=False)
+    try:
+        with temp:
+            for start in range(0, len(encoded), CHUNK_CHARS):
+                chunk = base64.b64decode(encoded[start : start + CHUNK_CHARS], validate=True)
+                digest.update(chunk)
+                temp.write(chunk)
+
+        content_hash = digest.hexdigest()
+        name = f"{UPLOAD_TO}/{content_hash[:2]}/{content_hash}.{ext}"
+        if not default_storage.exists(name):
+            with open(temp.name, "rb") as image_file:
+                name = default_storage.save(name, File(image_file))
+    finally:
+        os.unlink(temp.name)
+
+    schedule_variants(name)
+    return name
+
+
+def variant_name(name, variant):
+    base, ext = os.path.splitext(name)
+    return f"{base}-{variant}{ext}"
+
+
+def variant_names(name):
+    """Storage names of every resized variant of a content-addressed image
+
+    Returns:
+        dict -- {variant: storage name}, empty for images stored before hashing
+    """
+    if not name or not CONTENT_ADDRESSED.match(str(name)):
+        return {}
+    return {variant: variant_name(str(name), variant) for variant in _variants()}
+
+
+def generate_variants(name):
+    """Write the missing resized variants of an image"""
+    pending = {
+        variant: target
+        for variant, target in variant_names(name).items()
+        if not default_storage.exists(target)
+    }
+    if not pending:
+        return
+
+    # Imported here so Pillow only loads in processes that resize images
+    from PIL import Image  # pylint: disable=import-outside-toplevel
+
+    with default_storage.open(name) as image_file:
+        image = Image.open(image_file)
+        image.load()
+
+    for variant, target in pending.items():
+        resized = image.copy()
+        resized.thumbnail(_variants()[variant])
+        buffer = BytesIO()
+        resized.save(buffer, format=image.format)
+        default_storage.save(target, ContentFile(buffer.getvalue()))
+
+
+def _generate_logged(name):
+    try:
+        generate_variants(name)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Could not generate variants of %s", name)
+
+
+def schedule_variants(name):
+    """Generate variants off the request thread, or inline with no workers"""
+    if not variant_names(name):
+        return None
+    if not settings.PRODUCT_IMAGE_WORKERS:
+        _generate_logged(name)
+        return None
+    return _pool().submit(_generate_logged, name)
@@ -0,0 +1,142 @@
+"""Parse stage of the catalog import
+
+Reads NDJSON or CSV files record by record and coerces them into plain
+dicts in chunks. Nothing here touches Django, so chunks can be parsed in
+worker processes while the main process writes the previous ones.
+"""
+
+import csv
+import datetime
+import json
+from itertools import islice
+
+CUSTOMERS = "customers"
+PRODUCTS = "products"
+ORDERS = "orders"
+LINEITEMS = "lineitems"
+
+# Import order, so every reference points at rows loaded before it
+KINDS = (CUSTOMERS, PRODUCTS, ORDERS, LINEITEMS)
+
+
+def _key(value):
+    """Source ids are opaque; 5 in NDJSON and "5" in CSV are the same row"""
+    if value in (None, ""):
+        raise ValueError("missing id")
+    return str(value)
+
+
+def _optional_key(value):
+    return None if value in (None, "") else _key(value)
+
+
+def _optional_int(value):
+    return None if value in (None, "") else int(value)
+
+
+def _quantity(value):
+    """Units of a line item; sources with one row per unit leave it out"""
+    quantity = 1 if value in (None, "") else int(value)
+    if quantity < 1:
+        raise ValueError("quantity must be at least 1")
+    return quantity
+
+
+def _date(value):
+    if value in (None, ""):
+        return datetime.date.today()
+    return datetime.date.fromisoformat(str(value))
+
+
+def _bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes")
+    return bool(value)
+
+
+def _text(value):
+    return "" if value is None else str(value)
+
+
+# Column -> converter. Keys are source ids resolved against the rows
+# imported before; *_type_id and category_id are database ids.
+FIELDS = {
+    CUSTOMERS: {
+        "id": _key,
+        "username": _key,
+        "first_name": _text,
+        "last_name": _text,
+        "email": _text,
+        "phone_number": _text,
+        "address": _text,
+    },
+    PRODUCTS: {
+        "id": _key,
+        "customer_id": _key,
+        "category_id": int,
+        "name": _text,
+        "price": float,
+        "description": _text,
+        "quantity": int,
+        "location": _text,
+    },
+    ORDERS: {
+        "id": _key,
+        "customer_id": _key,
+        "payment_type_id": _optional_int,
+        "created_date": _date,
+        "status": _bool,
+    },
+    LINEITEMS: {
+        "order_id": _key,
+        "product_id": _key,
+        "quantity": _quantity,
+    },
+}
+
+
+def read_records(path):
+    """Raw records of a file: text lines for NDJSON, dicts for CSV"""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as source:
+            yield from csv.DictReader(source)
+    else:
+        with open(path, encoding="utf-8") as source:
+            for line in source:
+                if line.strip():
+                    yield line
+
+
+def batched(records, size):
+    """(offset, records) tuples of at most size records"""
+    records = iter(records)
+    offset = 0
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield offset, chunk
+        offset += len(chunk)
+
+
+def parse_chunk(job):
+    """Coerce one chunk of raw records
+
+    Arguments:
+        job -- (kind, offset, records) tuple, so it pickles for a process pool
+
+    Returns:
+        tuple -- (list of row dicts, list of "record N: message" errors)
+    """
+    kind, offset, records = job
+    fields = FIELDS[kind]
+    rows = []
+    errors = []
+    for number, record in enumerate(records, start=offset + 1):
+        try:
+            if isinstance(record, str):
+                record = json.loads(record)
+            rows.append({field: convert(record.get(field)) for field, convert in fields.items()})
+        except (TypeError, ValueError, AttributeError) as ex:
+            errors.append(f"record {number}: {ex}")
+    return rows, errors
@@ -0,0 +1,143 @@
+"""Stock holds for carts and stock decrements at checkout
+
+Adding to a cart holds units of the product for `INVENTORY_HOLD_SECONDS`.
+Holds are counted in `Product.reserved`, and placing one is a single
+conditional UPDATE that only succeeds while `quantity - reserved` covers
+it, so concurrent carts can't hold more than is in stock. Checkout turns
+an order's holds into decrements of `quantity` the same way. Expired
+holds are released in batches by `sweep_expired`, which the
+`sweep_stock_holds` command runs in the background.
+
+Every function expects to run inside the caller's transaction.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from bangazonapi.models import Product, StockHold
+
+
+class OutOfStock(Exception):
+    """Not enough unreserved units of the products in `product_ids`"""
+
+    def __init__(self, product_ids):
+        super().__init__(f"Not enough stock of products {sorted(product_ids)}")
+        self.product_ids = sorted(product_ids)
+
+
+def _expiry():
+    return timezone.now() + timedelta(seconds=getattr(settings, "INVENTORY_HOLD_SECONDS", 900))
+
+
+def hold(order, product, quantity):
+    """Hold more units of a product for an order, renewing its hold's expiry
+
+    Raises:
+        OutOfStock -- Fewer than quantity units are neither sold nor held
+    """
+    reserved = Product.all_objects.filter(
+        pk=product.pk, quantity__gte=F("reserved") + quantity
+    ).update(reserved=F("reserved") + quantity)
+    if not reserved:
+        raise OutOfStock([product.pk])
+
+    expires_at = _expiry()
+    extended = StockHold.objects.filter(order=order, product=product).update(
+        quantity=F("quantity") + quantity, expires_at=expires_at
+    )
+    if not extended:
+        StockHold.objects.create(
+            order=order, product=product, quantity=quantity, expires_at=expires_at
+        )
+
+
+def release(order, product_id, quantity=None):
+    """Give back units, or all, of an order's hold on a product"""
+    holds = StockHold.objects.filter(order=order, product_id=product_id)
+    current = holds.first()
+    if current is None:
+        return
+    if quantity is None or quantity >= current.quantity:
+        _release(holds)
+    else:
+        holds.update(quantity=F("quantity") - quantity)
+        Product.all_objects.filter(pk=product_id).update(reserved=F("reserved") - quantity)
+
+
+def release_order(order):
+    """Give back every hold of an order"""
+    _release(StockHold.objects.filter(order=order))
+
+
+def checkout(order):
+    """Turn an order's holds into stock decrements of its line items
+
+    Line items whose hold has been swept take unreserved stock instead. All
+    products are decremented or, on OutOfStock, none are.
+
+    Raises:
+        OutOfStock -- Some line items are neither held nor in stock
+    """
+    held = dict(
+        StockHold.objects.filter(order=order).values_list("product_id", "quantity")
+    )
+    needed = dict(order.lineitems.values_list("product_id", "quantity"))
+
+    short = []
+    with transaction.atomic():
+        for product_id, quantity in needed.items():
+            units_held = held.get(product_id, 0)
+            # Other carts' holds must stay covered after this decrement
+            decremented = Product.all_objects.filter(
+                pk=product_id, quantity__gte=F("reserved") - units_held + quantity
+            ).update(
+                quantity=F("quantity") - quantity,
+                reserved=F("reserved") - units_held,
+            )
+            if not decremented:
+                short.append(product_id)
+        if short:
+            raise OutOfStock(short)
+
+        StockHold.objects.filter(order=order).delete()
+        # Holds of products no longer in the order
+        for product_id, units_held in held.items():
+            if product_id not in needed:
+                Product.all_objects.filter(pk=product_id).update(
+                    reserved=F("reserved") - units_held
+                )
+
+
+def _release(holds):
+    """Delete holds and take their units out of their products' reserved
+
+    Returns:
+        int -- The number of holds released
+    """
+    rows = list(holds.values_list("pk", "product_id", "quantity"))
+    released = defaultdict(int)
+    for _, product_id, quantity in rows:
+        released[product_id] += quantity
+
+    StockHold.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+    for product_id, quantity in released.items():
+        Product.all_objects.filter(pk=product_id).update(reserved=F("reserved") - quantity)
+    return len(rows)
+
+
+def sweep_expired(batch_size=500):
+    """Release up to batch_size expired holds, oldest first
+
+    Returns:
+        int -- The number of holds released
+    """
+    with transaction.atomic():
+        expired = (
+            StockHold.objects.filter(expires_at__lte=timezone.now())
+            .order_by("expires_at")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        return _release(StockHold.objects.filter(pk__in=list(expired)))
@@ -0,0 +1,225 @@
+"""Measure API latency, throughput and query counts against a recorded baseline"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from bangazonapi.models import Customer, Product, Store
+
+# (name, path, authenticated); paths are formatted with the ids of a busy
+# customer, their store and a best-selling product
+ENDPOINTS = (
+    ("products_landing", "/products", False),
+    ("products_page", "/products?limit=50", False),
+    ("products_search", "/products?q=kite", False),
+    ("products_popular", "/products?order_by=number_sold&direction=desc", False),
+    ("product_detail", "/products/{product}", True),
+    ("cart", "/cart", True),
+    ("orders", "/orders", True),
+    ("stores", "/stores", True),
+    ("store_detail", "/stores/{store}", True),
+    ("profile", "/profile", True),
+    ("report_expensive", "/reports/expensiveproducts", False),
+    ("report_inexpensive", "/reports/inexpensiveproducts", False),
+    ("report_favoritesellers", "/reports/favoritesellers?customer={customer}", False),
+)
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, "benchmarks", "baseline.json")
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the API through the Django test client and report p50/p95/p99 latency, "
+        "requests/s and SQL queries per endpoint, compared with a JSON baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50, help="Measured requests per endpoint")
+        parser.add_argument("--warmup", type=int, default=3, help="Unmeasured requests per endpoint")
+        parser.add_argument("--concurrency", type=int, default=1, help="Client threads")
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            dest="endpoints",
+            help="Only run this endpoint; repeatable",
+        )
+        parser.add_argument(
+            "--baseline",
+            default=DEFAULT_BASELINE,
+            help="JSON file to compare with (and write with --save)",
+        )
+        parser.add_argument("--save", action="store_true", help="Record the results as the new baseline")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=20.0,
+            help="Percent p95 slowdown reported as a regression",
+        )
+        parser.add_argument(
+            "--generate",
+            type=float,
+            metavar="SCALE",
+            help="Run generate_catalog at this scale first",
+        )
+        parser.add_argument("--host", default="localhost", help="Host header of the requests")
+
+    def handle(self, *args, **options):
+        if options["generate"]:
+            call_command("generate_catalog", scale=options["generate"], stdout=self.stdout)
+
+        endpoints = [
+            endpoint
+            for endpoint in ENDPOINTS
+            if not options["endpoints"] or endpoint[0] in options["endpoints"]
+        ]
+        if not endpoints:
+            raise CommandError("No endpoint matches --endpoint")
+
+        self.host = options["host"]
+        self.token, ids = self.fixture_ids()
+        self.local = threading.local()
+
+        results = {}
+        for name, path, authenticated in endpoints:
+            results[name] = self.measure(
+                path.format(**ids),
+                authenticated,
+                options["requests"],
+                options["warmup"],
+                options["concurrency"],
+            )
+            self.stdout.write(
+                f"{name:24} p50 {results[name]['p50_ms']:8.2f}ms  p95 {results[name]['p95_ms']:8.2f}ms  "
+                f"p99 {results[name]['p99_ms']:8.2f}ms  {results[name]['rps']:8.1f} req/s  "
+                f"{results[name]['queries']:4} queries"
+            )
+
+        report = {
+            "meta": {
+                "recorded": datetime.now(timezone.utc).isoformat(),
+                "requests": options["requests"],
+                "concurrency": options["concurrency"],
+                "products": Product.objects.count(),
+            },
+            "endpoints": results,
+        }
+
+        regressions = []
+        if os.path.exists(options["baseline"]):
+            with open(options["baseline"], encoding="utf-8") as baseline_file:
+                baseline = json.load(baseline_file)
+            regressions = self.compare(baseline, report, options["threshold"])
+
+        if options["save"]:
+            os.makedirs(os.path.dirname(os.path.abspath(options["baseline"])), exist_ok=True)
+            with open(options["baseline"], "w", encoding="utf-8") as baseline_file:
+                json.dump(report, baseline_file, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+        elif regressions:
+            raise CommandError(f"{len(regressions)} endpoints regressed: {', '.join(regressions)}")
+
+    def fixture_ids(self):
+        """Token and path ids of the customer with the most orders"""
+        customer = (
+            Customer.objects.annotate(order_count=Count("order"))
+            .order_by("-order_count", "id")
+            .select_related("user")
+            .first()
+        )
+        if customer is None:
+            raise CommandError("No customers; seed the database or pass --generate")
+
+        token, _ = Token.objects.get_or_create(user=customer.user)
+        store = Store.objects.order_by("id").first()
+        product = Product.objects.order_by("-stats__units_sold", "id").first()
+        return token.key, {
+            "customer": customer.pk,
+            "store": store.pk if store else 0,
+            "product": product.pk if product else 0,
+        }
+
+    def request(self, path, authenticated):
+        """One timed GET on this thread's client and connection"""
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = Client(HTTP_HOST=self.host)
+
+        headers = {"HTTP_AUTHORIZATION": f"Token {self.token}"} if authenticated else {}
+        # The log is capped, so a full one would count nothing
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(path, **headers)
+            if getattr(response, "streaming", False):
+                b"".join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        return elapsed, len(queries), response.status_code
+
+    def measure(self, path, authenticated, count, warmup, concurrency):
+        for _ in range(warmup):
+            self.request(path, authenticated)
+
+        started = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                samples = list(pool.map(lambda _: self.request(path, authenticated), range(count)))
+        else:
+            samples = [self.request(path, authenticated) for _ in range(count)]
+        wall = time.perf_counter() - started
+
+        latencies = sorted(elapsed * 1000 for elapsed, _, _ in samples)
+        return {
+            "path": path,
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "rps": round(count / wall, 1) if wall else 0.0,
+            "queries": max((queries for _, queries, _ in samples), default=0),
+            "errors": sum(1 for _, _, status in samples if status >= 400),
+        }
+
+    def compare(self, baseline, report, threshold):
+        """Print the change of every endpoint and return the names that regressed"""
+        regressions = []
+        self.stdout.write(f"\nCompared with baseline of {baseline['meta']['recorded']}:")
+        for name, current in report["endpoints"].items():
+            previous = baseline["endpoints"].get(name)
+            if previous is None:
+                self.stdout.write(f"{name:24} new endpoint")
+                continue
+
+            change = (
+                (current["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100
+                if previous["p95_ms"]
+                else 0.0
+            )
+            slower = change > threshold
+            more_queries = current["queries"] > previous["queries"]
+            line = (
+                f"{name:24} p95 {previous['p95_ms']:8.2f} -> {current['p95_ms']:8.2f}ms ({change:+6.1f}%)  "
+                f"queries {previous['queries']} -> {current['queries']}"
+            )
+            if slower or more_queries or current["errors"] > previous["errors"]:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(line + "  REGRESSION"))
+            else:
+                self.stdout.write(line)
+        return regressions
@@ -0,0 +1,20 @@
+"""Merge repeated line items of a product in an order into one with a quantity"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from bangazonapi.models import OrderProduct
+
+
+class Command(BaseCommand):
+    help = (
+        "Collapse the one-row-per-unit line items of databases created before line items "
+        "had quantities; run it once before migrating them to the order_product_unique "
+        "constraint, which those rows would violate"
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            deleted = OrderProduct.objects.collapse_duplicates()
+        self.stdout.write(
+            self.style.SUCCESS(f"Line items collapsed: {deleted} duplicate rows removed")
+        )
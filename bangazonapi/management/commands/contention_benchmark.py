@@ -0,0 +1,147 @@
+"""Measure concurrent write throughput of worker processes sharing the SQLite file"""
+
+import logging
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from rest_framework.authtoken.models import Token
+from bangazonapi.models import Customer, Order, Payment, Product
+from .benchmark import percentile
+
+PROFILES = {
+    "default": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False, "OPTIONS": {}},
+    "production": settings.SQLITE_PRODUCTION,
+}
+
+
+def _configure(database, profile):
+    """Point this worker's default connection at database with a profile's settings"""
+    connections.close_all()
+    # Failed writes are counted; their query and error logs would drown the report
+    logging.disable(logging.ERROR)
+    settings_dict = connections["default"].settings_dict
+    settings_dict.update(PROFILES[profile], NAME=database)
+
+
+def _work(job):
+    """Run one worker's writes; returns (latencies, failures, first error)"""
+    database, profile, host, token, customer_id, product_ids, writes, seed = job
+    _configure(database, profile)
+    rng = random.Random(seed)
+    client = Client(
+        HTTP_HOST=host, HTTP_AUTHORIZATION=f"Token {token}", raise_request_exception=False
+    )
+    payment = Payment.objects.filter(customer_id=customer_id).values_list("id", flat=True).first()
+
+    latencies, failures, error = [], 0, None
+    for number in range(writes):
+        product_id = rng.choice(product_ids)
+        started = time.perf_counter()
+        if number % 10 == 9:
+            response = client.post(
+                f"/products/{product_id}/rate-product", {"score": rng.randint(1, 5)}
+            )
+        elif number % 25 == 24 and payment is not None:
+            order = Order.objects.filter(customer_id=customer_id, payment_type__isnull=True).first()
+            if order is None:
+                continue
+            response = client.put(
+                f"/orders/{order.id}", {"payment_type": payment}, content_type="application/json"
+            )
+        else:
+            response = client.post("/cart", {"product_id": product_id})
+        latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            failures += 1
+            request = response.request
+            error = error or f"{response.status_code} on {request['REQUEST_METHOD']} {request['PATH_INFO']}"
+
+    connections.close_all()
+    return latencies, failures, error
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive cart, checkout and rating writes from several processes against copies of "
+        "the database, once per SQLite profile, and report the write throughput of each"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=4, help="Concurrent worker processes")
+        parser.add_argument("--writes", type=int, default=200, help="Writes per process")
+        parser.add_argument(
+            "--profile",
+            action="append",
+            dest="profiles",
+            choices=sorted(PROFILES),
+            help="Only run this profile; repeatable",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--host", default="localhost", help="Host header of the requests")
+
+    def handle(self, *args, **options):
+        source = connections["default"].settings_dict["NAME"]
+        if not os.path.exists(str(source)):
+            raise CommandError(f"{source} does not exist; seed the database first")
+
+        # One customer per worker; those with payment types also check out
+        customers = list(
+            Customer.objects.order_by("id").values_list("id", "user_id")[: options["processes"]]
+        )
+        if len(customers) < options["processes"]:
+            raise CommandError(f"Need {options['processes']} customers; try generate_catalog")
+        product_ids = list(Product.objects.values_list("id", flat=True)[:1000])
+        tokens = [Token.objects.get_or_create(user_id=user_id)[0].key for _, user_id in customers]
+        connections.close_all()
+
+        results = {}
+        for profile in options["profiles"] or ("default", "production"):
+            with tempfile.TemporaryDirectory() as directory:
+                database = os.path.join(directory, "contention.sqlite3")
+                # The backup API copies a consistent snapshot, even of a WAL database
+                with sqlite3.connect(source) as original, sqlite3.connect(database) as copy:
+                    original.backup(copy)
+
+                jobs = [
+                    (
+                        database,
+                        profile,
+                        options["host"],
+                        token,
+                        customer_id,
+                        product_ids,
+                        options["writes"],
+                        options["seed"] + worker,
+                    )
+                    for worker, (token, (customer_id, _)) in enumerate(zip(tokens, customers))
+                ]
+                started = time.perf_counter()
+                with multiprocessing.get_context("fork").Pool(options["processes"]) as pool:
+                    outcomes = pool.map(_work, jobs)
+                wall = time.perf_counter() - started
+
+            latencies = sorted(elapsed * 1000 for outcome in outcomes for elapsed in outcome[0])
+            failures = sum(outcome[1] for outcome in outcomes)
+            results[profile] = (len(latencies) - failures) / wall
+            self.stdout.write(
+                f"{profile:12} {results[profile]:8.1f} writes/s  "
+                f"p50 {percentile(latencies, 0.50):8.2f}ms  p95 {percentile(latencies, 0.95):8.2f}ms  "
+                f"{failures} failed of {len(latencies)}"
+            )
+            for _, _, error in outcomes:
+                if error:
+                    self.stdout.write(f"  first failure: {error}")
+                    break
+
+        if results.get("default") and "production" in results:
+            self.stdout.write(
+                f"production profile: {results['production'] / results['default']:.2f}x "
+                "the default profile's write throughput"
+            )
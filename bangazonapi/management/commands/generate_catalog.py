@@ -0,0 +1,349 @@
+"""Generate a large, deterministic synthetic data set for load testing"""
+
+import datetime
+import random
+import time
+from itertools import accumulate, islice
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from bangazonapi import cache, search
+from bangazonapi.models import (
+    Customer,
+    Favorite,
+    Like,
+    Order,
+    OrderProduct,
+    Payment,
+    Product,
+    ProductCategory,
+    ProductRating,
+    ProductStats,
+    Rating,
+    Recommendation,
+    Store,
+    StoreProduct,
+)
+
+# Row counts at --scale 1; --scale 100 gives 1M products and 10M line items
+DEFAULT_COUNTS = {
+    "customers": 2000,
+    "stores": 200,
+    "products": 10000,
+    "orders": 20000,
+    "lineitems": 100000,
+    "likes": 20000,
+    "ratings": 10000,
+    "favorites": 4000,
+    "recommendations": 2000,
+}
+
+CATEGORIES = ("Auto", "Clothing", "Electronics", "Home", "Sporting Goods", "Toys")
+FIRST_NAMES = ("Ann", "Bo", "Cy", "Di", "Ed", "Flo", "Gus", "Hal", "Ida", "Jo", "Kai", "Lu")
+LAST_NAMES = ("Adams", "Baker", "Chen", "Diaz", "Evans", "Fox", "Gray", "Hill", "Ito", "Khan")
+ADJECTIVES = ("Sturdy", "Compact", "Vintage", "Deluxe", "Classic", "Rugged", "Smart", "Tiny")
+NOUNS = ("Kite", "Lamp", "Chair", "Drone", "Jacket", "Blender", "Wagon", "Guitar", "Tent")
+CITIES = ("Nashville", "Pittsburgh", "Chicago", "Seoul", "Paris", "Lagos", "Lima", "Oslo")
+RATING_TEXTS = ("Love it", "Works fine", "Not as described", "Great value", None)
+# Weights of scores 1-5, skewed positive as real review scores are
+SCORE_WEIGHTS = (6, 4, 8, 22, 60)
+
+
+class Command(BaseCommand):
+    help = (
+        "Insert synthetic customers, stores, products, orders, line items, likes, "
+        "ratings, favorites and recommendations with Zipf-distributed popularity"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for every count")
+        for table, count in DEFAULT_COUNTS.items():
+            parser.add_argument(f"--{table}", type=int, help=f"Rows to create (default {count})")
+        parser.add_argument("--seed", type=int, default=1, help="Random seed; equal seeds give equal data")
+        parser.add_argument(
+            "--zipf",
+            type=float,
+            default=1.1,
+            help="Exponent of the popularity distributions",
+        )
+        parser.add_argument("--batch-size", type=int, default=10000, help="Rows per INSERT batch")
+
+    def handle(self, *args, **options):
+        counts = {
+            table: options[table] if options[table] is not None else int(count * options["scale"])
+            for table, count in DEFAULT_COUNTS.items()
+        }
+        counts["stores"] = min(counts["stores"], counts["customers"])
+        self.rng = random.Random(options["seed"])
+        self.exponent = options["zipf"]
+        self.batch_size = options["batch_size"]
+        self.today = datetime.date.today()
+        started = time.monotonic()
+
+        categories = self.ensure_categories()
+        customers = self.next_ids(Customer, counts["customers"])
+        users = self.next_ids(User, counts["customers"])
+        payments = self.next_ids(Payment, counts["customers"])
+        first_user = users[0] if users else 0
+        password = make_password(None)
+
+        self.insert(
+            User,
+            ("id", "username", "password", "first_name", "last_name", "email"),
+            (
+                (
+                    user_id,
+                    f"shopper{user_id}",
+                    password,
+                    self.rng.choice(FIRST_NAMES),
+                    self.rng.choice(LAST_NAMES),
+                    f"shopper{user_id}@example.com",
+                )
+                for user_id in users
+            ),
+        )
+        self.insert(
+            Customer,
+            ("id", "user_id", "phone_number", "address"),
+            (
+                (customer_id, first_user + index, f"555-{index % 10000:04d}", f"{index} Main St")
+                for index, customer_id in enumerate(customers)
+            ),
+        )
+        # One payment type per customer, with the same offset as the customer
+        self.insert(
+            Payment,
+            ("id", "customer_id", "merchant_name", "account_number", "expiration_date", "create_date"),
+            (
+                (payment_id, customer_id, "Visa", f"{payment_id:016d}", "2030-01-01", self.today.isoformat())
+                for payment_id, customer_id in zip(payments, customers)
+            ),
+        )
+
+        # Sellers are a random subset of customers, one store each
+        sellers = self.rng.sample(customers, counts["stores"])
+        stores = self.next_ids(Store, len(sellers))
+        self.insert(
+            Store,
+            ("id", "customer_id", "name", "description"),
+            (
+                (store_id, seller, f"Store {store_id}", "Synthetic store")
+                for store_id, seller in zip(stores, sellers)
+            ),
+        )
+
+        # Zipf over stores gives power-law store sizes
+        products = self.next_ids(Product, counts["products"] if stores else 0)
+        product_stores = list(self.zipf(stores, len(products)))
+        seller_of = dict(zip(stores, sellers))
+        self.insert(
+            Product,
+            (
+                "id",
+                "name",
+                "customer_id",
+                "price",
+                "description",
+                "quantity",
+                "created_date",
+                "category_id",
+                "location",
+            ),
+            (
+                (
+                    product_id,
+                    f"{self.rng.choice(ADJECTIVES)} {self.rng.choice(NOUNS)}",
+                    seller_of[store_id],
+                    round(self.rng.lognormvariate(3, 1.2) % 17500, 2),
+                    "Synthetic product",
+                    self.rng.randint(0, 500),
+                    self.past_date(),
+                    self.rng.choice(categories),
+                    self.rng.choice(CITIES),
+                )
+                for product_id, store_id in zip(products, product_stores)
+            ),
+        )
+        self.insert(StoreProduct, ("store_id", "product_id"), zip(product_stores, products))
+
+        # Heavy buyers and popular products both follow Zipf
+        orders = self.next_ids(Order, counts["orders"] if customers else 0)
+        open_carts = set()
+        order_rows = []
+        for order_id, customer_id in zip(orders, self.zipf(customers, len(orders))):
+            payment_id = payments[customer_id - customers[0]]
+            if customer_id not in open_carts and self.rng.random() < 0.1:
+                open_carts.add(customer_id)
+                payment_id = None
+            order_rows.append((order_id, customer_id, payment_id, self.past_date()))
+        self.insert(Order, ("id", "customer_id", "payment_type_id", "created_date"), order_rows)
+        del order_rows
+
+        # Repeated picks of a product for an order become its quantity
+        lineitems = counts["lineitems"] if orders and products else 0
+        self.insert(
+            OrderProduct,
+            ("order_id", "product_id"),
+            zip(
+                (self.rng.choice(orders) for _ in range(lineitems)),
+                self.zipf(products, lineitems),
+            ),
+            on_conflict=OrderProduct.objects.add_on_conflict(),
+        )
+        Order.objects.rebuild_totals()
+
+        self.insert(
+            Like,
+            ("customer_id", "product_id"),
+            self.unique_pairs(customers, products, counts["likes"]),
+        )
+
+        ratings = self.next_ids(Rating, counts["ratings"] if products else 0)
+        self.insert(
+            Rating,
+            ("id", "customer_id", "score", "rating_text"),
+            (
+                (
+                    rating_id,
+                    self.rng.choice(customers),
+                    self.rng.choices(range(1, 6), weights=SCORE_WEIGHTS)[0],
+                    self.rng.choice(RATING_TEXTS),
+                )
+                for rating_id in ratings
+            ),
+        )
+        self.insert(
+            ProductRating,
+            ("product_id", "rating_id"),
+            zip(self.zipf(products, len(ratings)), ratings),
+        )
+
+        self.insert(
+            Favorite,
+            ("customer_id", "store_id"),
+            self.unique_pairs(customers, stores, counts["favorites"]),
+        )
+        self.insert(
+            Recommendation,
+            ("customer_id", "recommender_id", "product_id"),
+            (
+                (self.rng.choice(customers), self.rng.choice(customers), product_id)
+                for product_id in self.zipf(products, counts["recommendations"] if customers else 0)
+            ),
+        )
+
+        self.reset_sequences()
+        created, _ = ProductStats.objects.rebuild()
+        self.stdout.write(f"product statistics: {created:,} rows")
+        if search.is_available():
+            search.rebuild_index()
+            self.stdout.write("search index rebuilt")
+        cache.bump_version(cache.CATALOG)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Generated data set in {time.monotonic() - started:.1f}s")
+        )
+
+    def ensure_categories(self):
+        categories = list(ProductCategory.objects.values_list("id", flat=True))
+        if not categories:
+            categories = [
+                category.pk
+                for category in ProductCategory.objects.bulk_create(
+                    ProductCategory(name=name) for name in CATEGORIES
+                )
+            ]
+        return categories
+
+    def next_ids(self, model, count):
+        """Primary keys for new rows, allocated up front so rows can reference them"""
+        # all_objects, so soft-deleted rows keep their ids
+        manager = getattr(model, "all_objects", model._default_manager)
+        start = (manager.aggregate(top=Max("pk"))["top"] or 0) + 1
+        return range(start, start + count)
+
+    def past_date(self):
+        return (self.today - datetime.timedelta(days=self.rng.randrange(730))).isoformat()
+
+    def zipf(self, population, count):
+        """count draws from population, the k-th most popular drawn with weight 1/k^s
+
+        Popularity ranks are shuffled so they don't follow primary key order,
+        and draws are made a batch at a time to keep memory flat.
+        """
+        if not population:
+            return
+        ranked = list(population)
+        self.rng.shuffle(ranked)
+        weights = list(accumulate(1 / rank**self.exponent for rank in range(1, len(ranked) + 1)))
+        while count > 0:
+            drawn = min(count, self.batch_size)
+            yield from self.rng.choices(ranked, cum_weights=weights, k=drawn)
+            count -= drawn
+
+    def unique_pairs(self, customers, targets, count):
+        """Distinct (customer, target) pairs with Zipf-popular targets"""
+        if not customers or not targets:
+            return []
+        pairs = set()
+        for _ in range(3):
+            missing = count - len(pairs)
+            if missing <= 0:
+                break
+            drawn = self.zipf(targets, missing)
+            pairs.update((self.rng.choice(customers), target) for target in drawn)
+        return sorted(pairs)[:count]
+
+    def insert(self, model, columns, rows, on_conflict=""):
+        """executemany INSERTs in batches, one transaction each
+
+        Rows are tuples of database-ready values for columns; every other
+        column gets its field default. on_conflict is appended to the
+        INSERT, such as an upsert clause.
+        """
+        fields = [model._meta.get_field(column) for column in columns]
+        defaults = [
+            field
+            for field in model._meta.concrete_fields
+            if field not in fields and not field.primary_key
+        ]
+        default_values = tuple(
+            field.get_db_prep_save(field.get_default(), connection) for field in defaults
+        )
+        names = ", ".join(
+            connection.ops.quote_name(field.column) for field in fields + defaults
+        )
+        placeholders = ", ".join(["%s"] * (len(fields) + len(defaults)))
+        sql = f"INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({names}) VALUES ({placeholders})"
+        if on_conflict:
+            sql = f"{sql} {on_conflict}"
+
+        started = time.monotonic()
+        total = 0
+        rows = iter(rows)
+        while True:
+            batch = [tuple(row) + default_values for row in islice(rows, self.batch_size)]
+            if not batch:
+                break
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, batch)
+            total += len(batch)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"{model._meta.verbose_name_plural}: {total:,} rows "
+            f"({total / max(elapsed, 1e-6):,.0f} rows/s)"
+        )
+
+    def reset_sequences(self):
+        """Move sequences past the explicit ids on backends that have them"""
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [User, Customer, Payment, Store, Product, Order, Rating]
+        )
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
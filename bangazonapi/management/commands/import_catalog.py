@@ -0,0 +1,207 @@
+"""Bulk import customers, products, orders and line items"""
+
+import multiprocessing
+import time
+from collections import deque
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from bangazonapi import cache, importer
+from bangazonapi.models import (
+    Customer,
+    Order,
+    OrderProduct,
+    Payment,
+    Product,
+    ProductCategory,
+    ProductStats,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Import customers, products, orders and line items from NDJSON or CSV "
+        "files with batched bulk inserts, one transaction per chunk"
+    )
+
+    def add_arguments(self, parser):
+        for kind in importer.KINDS:
+            parser.add_argument(
+                f"--{kind}",
+                metavar="PATH",
+                help=f"NDJSON or .csv file of {kind}",
+            )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Rows per chunk, bulk insert and transaction",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Processes parsing chunks ahead of the writer (0 parses inline)",
+        )
+
+    def handle(self, *args, **options):
+        paths = {kind: options[kind] for kind in importer.KINDS if options[kind]}
+        if not paths:
+            raise CommandError("Nothing to import; pass at least one file")
+
+        self.batch_size = options["batch_size"]
+        self.workers = options["workers"]
+
+        # Source id -> database id of every row imported so far
+        self.customers = {}
+        self.products = {}
+        self.orders = {}
+        self.categories = set(ProductCategory.objects.values_list("id", flat=True))
+        self.payments = set(Payment.objects.values_list("id", flat=True))
+
+        writers = {
+            importer.CUSTOMERS: self.write_customers,
+            importer.PRODUCTS: self.write_products,
+            importer.ORDERS: self.write_orders,
+            importer.LINEITEMS: self.write_lineitems,
+        }
+        for kind in importer.KINDS:
+            if kind in paths:
+                self.import_file(kind, paths[kind], writers[kind])
+
+        if importer.LINEITEMS in paths:
+            Order.objects.rebuild_totals()
+
+        # Bulk inserts skip the signals that keep these current
+        if importer.PRODUCTS in paths or importer.LINEITEMS in paths:
+            ProductStats.objects.rebuild()
+            cache.bump_version(cache.CATALOG)
+
+    def parsed_chunks(self, kind, path):
+        jobs = (
+            (kind, offset, records)
+            for offset, records in importer.batched(importer.read_records(path), self.batch_size)
+        )
+        if self.workers > 0:
+            # Pool.imap would read the whole file ahead into its task queue;
+            # keeping a window of chunks in flight bounds memory to it
+            window = self.workers * 2
+            with multiprocessing.Pool(self.workers) as pool:
+                pending = deque()
+                for job in jobs:
+                    pending.append(pool.apply_async(importer.parse_chunk, (job,)))
+                    if len(pending) >= window:
+                        yield pending.popleft().get()
+                while pending:
+                    yield pending.popleft().get()
+        else:
+            yield from map(importer.parse_chunk, jobs)
+
+    def import_file(self, kind, path, write):
+        started = time.monotonic()
+        imported = 0
+        skipped = 0
+        for rows, errors in self.parsed_chunks(kind, path):
+            for error in errors[:5]:
+                self.stderr.write(f"{kind} {error}")
+            try:
+                with transaction.atomic():
+                    written = write(rows)
+            except IntegrityError as ex:
+                raise CommandError(f"{kind} chunk after {imported} rows failed: {ex}")
+
+            imported += written
+            skipped += len(errors) + len(rows) - written
+            rate = imported / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f"{kind}: {imported:,} rows ({rate:,.0f} rows/s)")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {imported:,} {kind} in {elapsed:.1f}s, skipped {skipped:,}"
+            )
+        )
+
+    def write_customers(self, rows):
+        password = make_password(None)
+        users = User.objects.bulk_create(
+            [
+                User(
+                    username=row["username"],
+                    first_name=row["first_name"],
+                    last_name=row["last_name"],
+                    email=row["email"],
+                    password=password,
+                )
+                for row in rows
+            ]
+        )
+        customers = Customer.objects.bulk_create(
+            [
+                Customer(
+                    user_id=user.pk,
+                    phone_number=row["phone_number"],
+                    address=row["address"],
+                )
+                for user, row in zip(users, rows)
+            ]
+        )
+        for customer, row in zip(customers, rows):
+            self.customers[row["id"]] = customer.pk
+        return len(customers)
+
+    def write_products(self, rows):
+        rows = [
+            row
+            for row in rows
+            if row["customer_id"] in self.customers and row["category_id"] in self.categories
+        ]
+        products = Product.objects.bulk_create_products(
+            [
+                Product(
+                    customer_id=self.customers[row["customer_id"]],
+                    category_id=row["category_id"],
+                    name=row["name"],
+                    price=row["price"],
+                    description=row["description"],
+                    quantity=row["quantity"],
+                    location=row["location"],
+                )
+                for row in rows
+            ],
+            batch_size=self.batch_size,
+        )
+        for product, row in zip(products, rows):
+            self.products[row["id"]] = product.pk
+        return len(products)
+
+    def write_orders(self, rows):
+        rows = [
+            row
+            for row in rows
+            if row["customer_id"] in self.customers
+            and (row["payment_type_id"] is None or row["payment_type_id"] in self.payments)
+        ]
+        orders = Order.objects.bulk_create(
+            [
+                Order(
+                    customer_id=self.customers[row["customer_id"]],
+                    payment_type_id=row["payment_type_id"],
+                    created_date=row["created_date"],
+                    status=row["status"],
+                )
+                for row in rows
+            ]
+        )
+        for order, row in zip(orders, rows):
+            self.orders[row["id"]] = order.pk
+        return len(orders)
+
+    def write_lineitems(self, rows):
+        # A product repeated in an order, in the file or already in the table, adds units
+        return OrderProduct.objects.bulk_add(
+            (self.orders[row["order_id"]], self.products[row["product_id"]], row["quantity"])
+            for row in rows
+            if row["order_id"] in self.orders and row["product_id"] in self.products
+        )
@@ -0,0 +1,161 @@
+"""Oversell check and checkout throughput of concurrent buyers of one product"""
+
+import datetime
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Sum
+from django.test import Client
+from rest_framework.authtoken.models import Token
+from bangazonapi.models import Customer, Order, OrderProduct, Payment, Product, StockHold
+from .benchmark import percentile
+from .contention_benchmark import PROFILES
+
+
+class Command(BaseCommand):
+    help = (
+        "On a copy of the database, let several threads add one unit of a product to their "
+        "carts and pay until it sells out, then check that every sale came out of stock "
+        "exactly once and report checkouts/s"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8, help="Concurrent buyers")
+        parser.add_argument("--stock", type=int, default=200, help="Units of the product on sale")
+        parser.add_argument(
+            "--attempts",
+            type=int,
+            default=40,
+            help="Checkouts each buyer tries; more than stock/threads to sell out",
+        )
+        parser.add_argument(
+            "--profile",
+            choices=sorted(PROFILES),
+            help="SQLite profile of the copy; defaults to the configured settings",
+        )
+        parser.add_argument("--host", default="localhost", help="Host header of the requests")
+
+    def handle(self, *args, **options):
+        source = connections["default"].settings_dict["NAME"]
+        if not os.path.exists(str(source)):
+            raise CommandError(f"{source} does not exist; seed the database first")
+
+        settings_dict = connections["default"].settings_dict
+        original = dict(settings_dict)
+        with tempfile.TemporaryDirectory() as directory:
+            database = os.path.join(directory, "inventory.sqlite3")
+            with sqlite3.connect(source) as primary, sqlite3.connect(database) as copy:
+                primary.backup(copy)
+
+            # Threads open their own connections from this shared settings dict
+            connections.close_all()
+            settings_dict.update(PROFILES.get(options["profile"], {}), NAME=database)
+            try:
+                self.run(options)
+            finally:
+                connections.close_all()
+                settings_dict.clear()
+                settings_dict.update(original)
+
+    def run(self, options):
+        product = Product.objects.order_by("id").first()
+        if product is None:
+            raise CommandError("No products; seed the database first")
+        Product.all_objects.filter(pk=product.pk).update(quantity=options["stock"], reserved=0)
+        StockHold.objects.filter(product=product).delete()
+        buyers = [self.buyer(number) for number in range(options["threads"])]
+
+        results = []
+        lock = threading.Lock()
+
+        def shop(token, customer_id, payment_id):
+            client = Client(
+                HTTP_HOST=options["host"],
+                HTTP_AUTHORIZATION=f"Token {token}",
+                raise_request_exception=False,
+            )
+            outcomes = []
+            for _ in range(options["attempts"]):
+                started = time.perf_counter()
+                response = client.post("/cart", {"product_id": product.pk})
+                if response.status_code == 201:
+                    order_id = (
+                        Order.objects.filter(customer_id=customer_id, payment_type__isnull=True)
+                        .values_list("id", flat=True)
+                        .first()
+                    )
+                    response = client.put(
+                        f"/orders/{order_id}",
+                        {"payment_type": payment_id},
+                        content_type="application/json",
+                    )
+                outcomes.append((response.status_code, time.perf_counter() - started))
+            connections.close_all()
+            with lock:
+                results.extend(outcomes)
+
+        threads = [threading.Thread(target=shop, args=buyer) for buyer in buyers]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        checkouts = [elapsed * 1000 for code, elapsed in results if code == 204]
+        sold_out = sum(1 for code, _ in results if code == 409)
+        failed = len(results) - len(checkouts) - sold_out
+        checkouts.sort()
+
+        product = Product.all_objects.get(pk=product.pk)
+        sold = (
+            OrderProduct.objects.filter(product=product, order__payment_type__isnull=False)
+            .filter(order__customer_id__in=[customer_id for _, customer_id, _ in buyers])
+            .aggregate(units=Sum("quantity"))["units"]
+            or 0
+        )
+        held = StockHold.objects.filter(product=product).aggregate(units=Sum("quantity"))["units"] or 0
+
+        self.stdout.write(
+            f"{len(checkouts) / wall:8.1f} checkouts/s  p50 {percentile(checkouts, 0.50):8.2f}ms  "
+            f"p95 {percentile(checkouts, 0.95):8.2f}ms  {len(checkouts)} paid, "
+            f"{sold_out} sold out, {failed} failed"
+        )
+        self.stdout.write(
+            f"stock {options['stock']} -> {product.quantity}, {sold} units sold, "
+            f"{product.reserved} reserved, {held} held"
+        )
+
+        # A failed checkout leaves its unit in the cart for the buyer's next one,
+        # so units sold, not paid checkouts, must match the stock taken
+        problems = []
+        if options["stock"] - product.quantity != sold:
+            problems.append("stock decrements don't match units sold")
+        if product.quantity < 0:
+            problems.append("oversold")
+        if product.reserved != held:
+            problems.append("reserved units don't match holds")
+        if problems:
+            raise CommandError("Lost updates: " + "; ".join(problems))
+        self.stdout.write(self.style.SUCCESS("No lost updates"))
+
+    def buyer(self, number):
+        """(token, customer id, payment id) of a benchmark customer"""
+        user, _ = User.objects.get_or_create(username=f"inventory-benchmark-{number}")
+        customer, _ = Customer.objects.get_or_create(
+            user=user, defaults={"phone_number": "555-0100", "address": "1 Bench St"}
+        )
+        payment = Payment.objects.create(
+            customer=customer,
+            merchant_name="Benchmark",
+            account_number="0000-0000-0000",
+            expiration_date=datetime.date.today() + datetime.timedelta(days=365),
+        )
+        Order.objects.filter(customer=customer, payment_type__isnull=True).delete()
+        token, _ = Token.objects.get_or_create(user=user)
+        return token.key, customer.pk, payment.pk
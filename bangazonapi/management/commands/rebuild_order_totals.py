@@ -0,0 +1,40 @@
+"""Rebuild or verify the denormalized order totals"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from bangazonapi.models import Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Snapshot the price of line items loaded without one and rebuild order subtotals "
+        "and item counts from the line items"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report drift between stored and computed totals",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Rows per bulk update statement",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            mismatches = Order.objects.drift()
+            for order_id, field, stored, expected in mismatches:
+                self.stdout.write(f"order {order_id}: {field} is {stored}, expected {expected}")
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} order totals have drifted")
+
+            self.stdout.write(self.style.SUCCESS("Order totals are consistent"))
+            return
+
+        with transaction.atomic():
+            updated = Order.objects.rebuild_totals(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Order totals rebuilt: {updated} updated"))
@@ -0,0 +1,41 @@
+"""Rebuild or verify the denormalized product statistics"""
+
+from django.core.management.base import BaseCommand, CommandError
+from bangazonapi.models import ProductStats
+
+
+class Command(BaseCommand):
+    help = "Rebuild ProductStats from the raw order, rating and like tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report drift between stored and computed statistics",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Rows per bulk insert/update statement",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            mismatches = ProductStats.objects.drift()
+            for product_id, field, stored, expected in mismatches:
+                self.stdout.write(
+                    f"product {product_id}: {field} is {stored}, expected {expected}"
+                )
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} product statistics have drifted")
+
+            self.stdout.write(self.style.SUCCESS("Product statistics are consistent"))
+            return
+
+        created, updated = ProductStats.objects.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Product statistics rebuilt: {created} created, {updated} updated"
+            )
+        )
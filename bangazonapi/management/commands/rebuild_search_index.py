@@ -0,0 +1,22 @@
+"""Rebuild the product full-text search index"""
+
+from django.core.management.base import BaseCommand, CommandError
+from bangazonapi import search
+
+
+class Command(BaseCommand):
+    help = "Repopulate the FTS5 product search index from the product table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            default="default",
+            help="Database alias holding the index",
+        )
+
+    def handle(self, *args, **options):
+        if not search.is_available(options["database"]):
+            raise CommandError("The database doesn't support SQLite FTS5")
+
+        count = search.rebuild_index(options["database"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} products"))
@@ -0,0 +1,55 @@
+"""Keep local SQLite read replicas as periodically refreshed copies of the primary"""
+
+import sqlite3
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from bangazonapi import replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Stamp the primary's heartbeat and copy it over every replica in DATABASE_REPLICAS "
+        "with the SQLite backup API, once or every --interval seconds, printing each "
+        "replica's lag before the copy"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Seconds between refreshes; 0 refreshes once",
+        )
+
+    def handle(self, *args, **options):
+        aliases = replicas.replicas()
+        if not aliases:
+            raise CommandError("No replicas; list their files in BANGAZON_REPLICAS")
+        for alias in aliases:
+            if settings.DATABASES[alias]["ENGINE"] != "django.db.backends.sqlite3":
+                raise CommandError(f"{alias} is not SQLite; it replicates on its own")
+
+        while True:
+            self.refresh(aliases)
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
+
+    def refresh(self, aliases):
+        replicas.beat()
+        primary = connections[replicas.PRIMARY].settings_dict["NAME"]
+        for alias in aliases:
+            before = replicas.lag(alias)
+            # Readers of the replica wait out the copy through their busy timeout
+            connections[alias].close()
+            started = time.perf_counter()
+            with sqlite3.connect(primary) as source, sqlite3.connect(
+                settings.DATABASES[alias]["NAME"], timeout=30
+            ) as target:
+                source.backup(target)
+            self.stdout.write(
+                f"{alias}: lag {'-' if before is None else f'{before:.1f}s'} before, "
+                f"copied in {(time.perf_counter() - started) * 1000:.0f}ms"
+            )
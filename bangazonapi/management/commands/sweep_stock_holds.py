@@ -0,0 +1,41 @@
+"""Release expired cart holds on product stock"""
+
+import time
+from django.core.management.base import BaseCommand
+from bangazonapi import inventory
+
+
+class Command(BaseCommand):
+    help = (
+        "Release expired stock holds in batches, once or every --interval seconds, "
+        "so their units can be sold again"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Seconds between sweeps; 0 sweeps once",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Holds released per transaction",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            released = 0
+            # Short transactions, so carts and checkouts get the write lock in between
+            while True:
+                batch = inventory.sweep_expired(options["batch_size"])
+                released += batch
+                if batch < options["batch_size"]:
+                    break
+            if released or not options["interval"]:
+                self.stdout.write(f"{released} expired holds released")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
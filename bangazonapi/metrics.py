@@ -0,0 +1,281 @@
+"""Prometheus metrics shared by preforked worker processes
+
+Every process adds to its own memory-mapped file in `METRICS_DIR`, so the
+request path only takes a lock private to its process. `/metrics` sums the
+files of all workers when it is scraped, without locking them. Values are
+counters only; histogram buckets are stored cumulatively and the cache hit
+ratio is derived at scrape time.
+
+Files of exited workers keep counting towards the totals, as counters
+should; empty the directory when deploying.
+"""
+
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# family: (type, help)
+FAMILIES = {
+    "bangazon_http_requests": ("counter", "HTTP requests by route, method and status"),
+    "bangazon_http_request_duration_seconds": ("histogram", "Time to produce a response"),
+    "bangazon_http_response_size_bytes": ("histogram", "Size of non-streaming response bodies"),
+    "bangazon_db_queries": ("counter", "SQL queries run while handling requests"),
+    "bangazon_db_query_seconds": ("counter", "Time spent in SQL queries"),
+    "bangazon_serializer_seconds": ("counter", "Time spent in top-level serializer .data"),
+    "bangazon_cache_requests": ("counter", "Response cache lookups by namespace and outcome"),
+    "bangazon_cache_hit_ratio": ("gauge", "Response cache hits over lookups"),
+    "bangazon_db_lock_retries": ("counter", "Writes retried after the database was locked"),
+    "bangazon_replica_lag_seconds": ("gauge", "Age of the primary's heartbeat on each read replica"),
+}
+
+_HEADER = struct.Struct("i")
+_VALUE = struct.Struct("d")
+_INITIAL_SIZE = 64 * 1024
+
+
+class ValueFile:
+    """Append-only key -> float64 map in an mmap'd file with a single writer
+
+    Layout: a 4-byte count of used bytes, then entries of a 4-byte key
+    length, the key padded to 8-byte alignment and an 8-byte value. A new
+    entry's value is written before the used count moves past it, so a
+    concurrent reader never sees half an entry.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a+b")  # pylint: disable=consider-using-with
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(_INITIAL_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._used = _HEADER.unpack_from(self._map, 0)[0] or 8
+        self._positions = {key: position for key, _, position in self._entries(self._map, self._used)}
+
+    @staticmethod
+    def _entries(buffer, used):
+        position = 8
+        while position < used:
+            length = _HEADER.unpack_from(buffer, position)[0]
+            position += 4
+            key = bytes(buffer[position : position + length]).decode().rstrip(" ")
+            position += length
+            yield key, _VALUE.unpack_from(buffer, position)[0], position
+            position += 8
+
+    @classmethod
+    def read(cls, path):
+        """{key: value} of a file, read without locking its writer out"""
+        with open(path, "rb") as source:
+            data = source.read()
+        if len(data) < 8:
+            return {}
+        return {key: value for key, value, _ in cls._entries(data, _HEADER.unpack_from(data, 0)[0])}
+
+    def _append(self, key):
+        encoded = key.encode()
+        encoded += b" " * (-(len(encoded) + 4) % 8)
+        size = 4 + len(encoded) + 8
+        if self._used + size > len(self._map):
+            self._map.close()
+            self._file.truncate(max(2 * os.fstat(self._file.fileno()).st_size, self._used + size))
+            self._map = mmap.mmap(self._file.fileno(), 0)
+
+        position = self._used
+        _HEADER.pack_into(self._map, position, len(encoded))
+        self._map[position + 4 : position + 4 + len(encoded)] = encoded
+        _VALUE.pack_into(self._map, position + 4 + len(encoded), 0.0)
+        self._used += size
+        _HEADER.pack_into(self._map, 0, self._used)
+        self._positions[key] = position + 4 + len(encoded)
+        return self._positions[key]
+
+    def add(self, key, amount):
+        position = self._positions.get(key)
+        if position is None:
+            position = self._append(key)
+        _VALUE.pack_into(self._map, position, _VALUE.unpack_from(self._map, position)[0] + amount)
+
+
+class _Registry:
+    """This process's value file, reopened after a fork or a settings change"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file = None
+        self._owner = None
+
+    def _value_file(self):
+        directory = settings.METRICS_DIR
+        owner = (os.getpid(), directory)
+        if self._owner != owner:
+            os.makedirs(directory, exist_ok=True)
+            self._file = ValueFile(os.path.join(directory, f"metrics_{os.getpid()}.db"))
+            self._owner = owner
+        return self._file
+
+    def add(self, family, sample, labels, amount=1.0):
+        key = json.dumps([family, sample, sorted(labels.items())])
+        with self._lock:
+            self._value_file().add(key, amount)
+
+
+_registry = _Registry()
+_local = threading.local()
+
+
+def inc(family, labels, amount=1.0, suffix="_total"):
+    _registry.add(family, family + suffix, labels, amount)
+
+
+def observe(family, labels, value, buckets):
+    """Add value to a histogram; buckets are cumulative as exposed"""
+    for bound in buckets:
+        # Adding 0 still creates the bucket, and histograms need every one
+        amount = 1.0 if value <= bound else 0.0
+        _registry.add(family, f"{family}_bucket", dict(labels, le=repr(float(bound))), amount)
+    _registry.add(family, f"{family}_bucket", dict(labels, le="+Inf"))
+    _registry.add(family, f"{family}_count", labels)
+    _registry.add(family, f"{family}_sum", labels, value)
+
+
+def route_label(request):
+    """Router basename such as "product", or the URL name of plain views"""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    initkwargs = getattr(match.func, "initkwargs", None) or {}
+    return initkwargs.get("basename") or match.url_name or match.view_name or "unnamed"
+
+
+def instrument_serializers():
+    """Time the outermost `.data` of every DRF serializer on this thread
+
+    Nested serializers that build their own `.data`, like those in
+    SerializerMethodFields, count towards the outermost one only.
+    """
+    # Imported here so this module stays importable before apps are ready
+    from rest_framework.serializers import BaseSerializer  # pylint: disable=import-outside-toplevel
+
+    original = BaseSerializer.data
+    if getattr(original.fget, "timed", False):
+        return
+
+    def data(self):
+        depth = getattr(_local, "serializer_depth", 0)
+        _local.serializer_depth = depth + 1
+        started = time.perf_counter()
+        try:
+            return original.fget(self)
+        finally:
+            _local.serializer_depth = depth
+            if depth == 0:
+                _local.serializer_seconds = getattr(_local, "serializer_seconds", 0.0) + (
+                    time.perf_counter() - started
+                )
+
+    data.timed = True
+    BaseSerializer.data = property(data)
+
+
+class MetricsMiddleware:
+    """Record latency, size, query and serializer metrics of every request
+
+    Listed before QueryBudgetMiddleware, whose `query_report` it reads.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.serializer_seconds = 0.0
+        started = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        route = {"route": route_label(request)}
+        inc(
+            "bangazon_http_requests",
+            dict(route, method=request.method, status=str(response.status_code)),
+        )
+        observe("bangazon_http_request_duration_seconds", route, elapsed, LATENCY_BUCKETS)
+        if not getattr(response, "streaming", False):
+            observe("bangazon_http_response_size_bytes", route, len(response.content), SIZE_BUCKETS)
+
+        report = getattr(response, "query_report", None)
+        if report is not None:
+            inc("bangazon_db_queries", route, report["queries"])
+            inc("bangazon_db_query_seconds", route, report["time_ms"] / 1000)
+        inc("bangazon_serializer_seconds", route, _local.serializer_seconds)
+        return response
+
+
+def collect():
+    """{(family, sample, labels): value} summed over every worker's file"""
+    totals = defaultdict(float)
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, "metrics_*.db")):
+        for key, value in ValueFile.read(path).items():
+            family, sample, labels = json.loads(key)
+            totals[(family, sample, tuple(tuple(label) for label in labels))] += value
+    return totals
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\""))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def exposition(gauges=None):
+    """All metrics in the Prometheus text format, version 0.0.4
+
+    Arguments:
+        gauges -- Optional {(family, sample, labels): value} read at scrape time
+    """
+    totals = collect()
+    totals.update(gauges or {})
+
+    # Gauges derived from the summed counters
+    lookups = defaultdict(lambda: {"hit": 0.0, "miss": 0.0})
+    for (family, _, labels), value in totals.items():
+        if family == "bangazon_cache_requests":
+            labels = dict(labels)
+            lookups[labels["namespace"]][labels["outcome"]] += value
+    for namespace, outcomes in lookups.items():
+        total = outcomes["hit"] + outcomes["miss"]
+        totals[
+            ("bangazon_cache_hit_ratio", "bangazon_cache_hit_ratio", (("namespace", namespace),))
+        ] = outcomes["hit"] / total if total else 0.0
+
+    by_family = defaultdict(list)
+    for (family, sample, labels), value in totals.items():
+        by_family[family].append((sample, labels, value))
+
+    lines = []
+    for family in sorted(by_family):
+        kind, description = FAMILIES.get(family, ("untyped", family))
+        lines.append(f"# HELP {family} {description}")
+        lines.append(f"# TYPE {family} {kind}")
+        for sample, labels, value in sorted(by_family[family], key=_sample_order):
+            lines.append(f"{sample}{_format_labels(labels)} {value!r}")
+    return "\n".join(lines) + "\n"
+
+
+def _sample_order(sample):
+    """Group samples by labels, with histogram buckets in ascending order"""
+    name, labels, _ = sample
+    bound = dict(labels).get("le")
+    others = tuple(label for label in labels if label[0] != "le")
+    return (others, name.rsplit("_", 1)[-1] != "bucket", float(bound) if bound else 0.0, name)
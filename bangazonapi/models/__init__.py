@@ -4,10 +4,13 @@ from .like import Like
 from .order import Order
 from .orderproduct import OrderProduct
 from .payment import Payment
-from .product import Product
+from .product import Product, products_bulk_saved
 from .productcategory import ProductCategory
 from .productrating import ProductRating
+from .productstats import ProductStats
 from .rating import Rating
 from .recommendation import Recommendation
+from .replicaheartbeat import ReplicaHeartbeat
+from .stockhold import StockHold
 from .store import Store
 from .storeproduct import StoreProduct
@@ -1,10 +1,107 @@
 """Customer order model"""
 
+from decimal import Decimal
 from django.db import models
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
 from .customer import Customer
 from .payment import Payment
 
 
+class OrderManager(models.Manager):
+    """Manager for maintaining the denormalized totals of orders"""
+
+    TOTAL_FIELDS = ("subtotal", "item_count")
+
+    def expected_totals(self, order_ids=None):
+        """Compute totals from the line items with one grouped query
+
+        Returns:
+            dict -- {order_id: {field: value}} for every order
+        """
+        # Imported here since the line item module imports this one
+        from .orderproduct import OrderProduct
+
+        orders = self.all()
+        line_items = OrderProduct.objects.all()
+        if order_ids is not None:
+            orders = orders.filter(pk__in=order_ids)
+            line_items = line_items.filter(order_id__in=order_ids)
+
+        totals = {
+            order_id: {"subtotal": Decimal("0.00"), "item_count": 0}
+            for order_id in orders.values_list("pk", flat=True)
+        }
+        rows = (
+            line_items.order_by()
+            .values("order_id")
+            .annotate(
+                subtotal=Sum(
+                    ExpressionWrapper(
+                        F("unit_price") * F("quantity"),
+                        output_field=DecimalField(max_digits=12, decimal_places=2),
+                    )
+                ),
+                item_count=Sum("quantity"),
+            )
+        )
+        for row in rows:
+            if row["order_id"] in totals:
+                totals[row["order_id"]] = {
+                    "subtotal": Decimal(row["subtotal"] or 0).quantize(Decimal("0.01")),
+                    "item_count": row["item_count"] or 0,
+                }
+        return totals
+
+    def rebuild_totals(self, order_ids=None, batch_size=500):
+        """Recompute totals from the line items and write only the orders that differ
+
+        Line items loaded without a price snapshot get their product's
+        current price first.
+
+        Returns:
+            int -- The number of orders updated
+        """
+        from .orderproduct import OrderProduct
+
+        OrderProduct.objects.snapshot_prices(order_ids)
+        expected = self.expected_totals(order_ids)
+        existing = self.in_bulk(list(expected.keys()))
+
+        changed = []
+        for order_id, values in expected.items():
+            order = existing[order_id]
+            if any(getattr(order, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(order, field, value)
+                changed.append(order)
+
+        self.bulk_update(changed, self.TOTAL_FIELDS, batch_size=batch_size)
+        return len(changed)
+
+    def drift(self, order_ids=None):
+        """Compare stored totals against the line items
+
+        Returns:
+            list -- (order_id, field, stored value, expected value) for each mismatch
+        """
+        expected = self.expected_totals(order_ids)
+        existing = self.in_bulk(list(expected.keys()))
+
+        mismatches = []
+        for order_id, values in expected.items():
+            for field, value in values.items():
+                stored = getattr(existing[order_id], field)
+                if stored != value:
+                    mismatches.append((order_id, field, stored, value))
+        return mismatches
+
+    def bump_totals(self, order_id, units, amount):
+        """Add units and their price to an order's totals, or take them off when negative"""
+        self.filter(pk=order_id).update(
+            item_count=F("item_count") + units, subtotal=F("subtotal") + amount
+        )
+
+
 class Order(models.Model):
     customer = models.ForeignKey(
         Customer,
@@ -15,8 +112,28 @@ class Order(models.Model):
         default="0000-00-00",
     )
     status = models.BooleanField(default=False)
+    # Kept in step with the line items by OrderProduct.objects
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    item_count = models.PositiveIntegerField(default=0)
+
+    objects = OrderManager()
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            # Writing back totals read earlier would lose units added since
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in OrderManager.TOTAL_FIELDS
+            ]
+        super().save(*args, **kwargs)
 
     class Meta:
         verbose_name = "order"
         verbose_name_plural = "orders"
+        indexes = [
+            # A customer's order history, newest first
+            models.Index(
+                fields=["customer", "-created_date", "-id"], name="order_customer_created_idx"
+            ),
+        ]
@@ -1,4 +1,138 @@
-from django.db import models
+from decimal import Decimal
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import F, OuterRef, Subquery
+from .order import Order
+from .product import Product
+
+
+class OrderProductManager(models.Manager):
+    """Manager keeping one line item, with a quantity, per product in an order
+
+    Adding and removing units through it also keeps the order's subtotal
+    and item count current, in the caller's transaction.
+    """
+
+    def add_units(self, order, product, quantity=1):
+        """Add units of a product to an order, incrementing its line item if it has one
+
+        A new line item snapshots the product's price; units added to an
+        existing one are charged at the price it snapshotted.
+
+        Returns:
+            OrderProduct -- The line item with its new quantity
+        """
+        line_item = None
+        if not self.filter(order=order, product=product).update(
+            quantity=F("quantity") + quantity
+        ):
+            try:
+                with transaction.atomic(using=self.db):
+                    line_item = self.create(
+                        order=order,
+                        product=product,
+                        quantity=quantity,
+                        unit_price=Decimal(str(product.price)),
+                    )
+            except IntegrityError:
+                # A concurrent request created the line item since the update
+                self.filter(order=order, product=product).update(
+                    quantity=F("quantity") + quantity
+                )
+        if line_item is None:
+            line_item = self.get(order=order, product=product)
+        Order.objects.bump_totals(order.pk, quantity, line_item.unit_price * quantity)
+        return line_item
+
+    def remove_units(self, line_item, quantity=None):
+        """Take units, or all, of a line item out of its order, deleting it when none are left"""
+        if quantity is None or quantity >= line_item.quantity:
+            quantity = line_item.quantity
+            line_item.delete()
+        else:
+            self.filter(pk=line_item.pk).update(quantity=F("quantity") - quantity)
+        Order.objects.bump_totals(
+            line_item.order_id, -quantity, -(line_item.unit_price or 0) * quantity
+        )
+
+    def snapshot_prices(self, order_ids=None):
+        """Give line items loaded without a price snapshot their product's current price
+
+        Returns:
+            int -- The number of line items updated
+        """
+        line_items = self.filter(unit_price__isnull=True)
+        if order_ids is not None:
+            line_items = line_items.filter(order_id__in=order_ids)
+        return line_items.update(
+            unit_price=Subquery(
+                Product.all_objects.filter(pk=OuterRef("product_id")).values("price")[:1]
+            )
+        )
+
+    def add_on_conflict(self):
+        """Clause making an INSERT of a product already in the order add to its quantity"""
+        table = self.model._meta.db_table
+        return (
+            "ON CONFLICT (order_id, product_id) "
+            f"DO UPDATE SET quantity = {table}.quantity + excluded.quantity"
+        )
+
+    def bulk_add(self, rows, batch_size=500):
+        """Insert (order_id, product_id, quantity) rows with executemany
+
+        Rows repeating a product of an order, in the batch or in the table,
+        add to that line item's quantity. Prices aren't snapshotted and
+        totals aren't bumped, so follow with Order.objects.rebuild_totals().
+
+        Returns:
+            int -- The number of rows added
+        """
+        table = self.model._meta.db_table
+        sql = (
+            f"INSERT INTO {table} (order_id, product_id, quantity) VALUES (%s, %s, %s) "
+            f"{self.add_on_conflict()}"
+        )
+        rows = list(rows)
+        with connections[self.db].cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                cursor.executemany(sql, rows[start : start + batch_size])
+        return len(rows)
+
+    def collapse_duplicates(self):
+        """Merge line items of the same product in an order into the first one
+
+        Rows from before line items had quantities can repeat a product.
+        The first row of each takes the summed quantity. Units sold don't
+        change, so the rows are deleted without signals. Databases created
+        before the order_product_unique constraint need this before
+        migrating to it.
+
+        Returns:
+            int -- The number of rows deleted
+        """
+        table = self.model._meta.db_table
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {table} SET quantity = (
+                    SELECT SUM(duplicate.quantity) FROM {table} duplicate
+                    WHERE duplicate.order_id = {table}.order_id
+                    AND duplicate.product_id = {table}.product_id
+                )
+                WHERE id IN (
+                    SELECT MIN(id) FROM {table}
+                    GROUP BY order_id, product_id HAVING COUNT(*) > 1
+                )
+                """
+            )
+            cursor.execute(
+                f"""
+                DELETE FROM {table} WHERE id NOT IN (
+                    SELECT MIN(id) FROM {table} GROUP BY order_id, product_id
+                )
+                """
+            )
+            return cursor.rowcount
 
 
 class OrderProduct(models.Model):
@@ -10,3 +144,16 @@ class OrderProduct(models.Model):
     product = models.ForeignKey("Product",
                                 on_delete=models.DO_NOTHING,
                                 related_name="lineitems")
+
+    quantity = models.PositiveIntegerField(default=1)
+
+    # Price of one unit when it was added; null for rows bulk loaded without one
+    unit_price = models.DecimalField(max_digits=7, decimal_places=2, null=True)
+
+    objects = OrderProductManager()
+
+    class Meta:
+        constraints = [
+            # One line item per product; more units raise its quantity
+            models.UniqueConstraint(fields=["order", "product"], name="order_product_unique"),
+        ]
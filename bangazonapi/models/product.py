@@ -1,16 +1,104 @@
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Case, Exists, F, FloatField, OuterRef, Value, When
+from django.db.models.functions import Cast, Coalesce
+from django.dispatch import Signal
+from django.utils import timezone
 from safedelete.models import SafeDeleteModel
 from safedelete.models import SOFT_DELETE
+from safedelete.managers import (
+    SafeDeleteManager,
+    SafeDeleteAllManager,
+    SafeDeleteDeletedManager,
+)
+from safedelete.queryset import SafeDeleteQueryset
 from .customer import Customer
+from .like import Like
 from .productcategory import ProductCategory
-from .orderproduct import OrderProduct
-from .rating import Rating
+from .productstats import ProductStats
+
+
+# Sent after bulk writes, which skip post_save, with `products` and `created`
+products_bulk_saved = Signal()
+
+
+class ProductQuerySet(SafeDeleteQueryset):
+    """Queryset for products with optional bulk-loaded statistics"""
+
+    def with_stats(self, user=None):
+        """Annotate the values behind the per-product calculated properties
+
+        Statistics are joined from the denormalized ProductStats row, so a
+        page of products is loaded in a single statement instead of one query
+        per property per row.
+
+        Arguments:
+            user -- Request user used to compute `liked_by_user`
+
+        Returns:
+            ProductQuerySet -- Products annotated with num_sold, avg_rating,
+                num_ratings, num_likes and liked_by_user
+        """
+        if user is not None and user.is_authenticated:
+            liked = Exists(
+                Like.objects.filter(product=OuterRef("pk"), customer__user=user)
+            )
+        else:
+            liked = Value(False)
+
+        return self.annotate(
+            num_sold=Coalesce(F("stats__units_sold"), Value(0)),
+            avg_rating=Case(
+                When(
+                    stats__ratings_count__gt=0,
+                    then=Cast("stats__ratings_sum", FloatField())
+                    / F("stats__ratings_count"),
+                ),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+            num_ratings=Coalesce(F("stats__ratings_count"), Value(0)),
+            num_likes=Coalesce(F("stats__likes_count"), Value(0)),
+            liked_by_user=liked,
+        )
+
+    def bulk_create_products(self, products, batch_size=500):
+        """bulk_create that still maintains the data kept up by save signals
+
+        Returns:
+            list -- The created products, with primary keys
+        """
+        products = self.bulk_create(products, batch_size=batch_size)
+        products_bulk_saved.send(sender=self.model, products=products, created=True)
+        return products
+
+    def bulk_update_products(self, products, fields, batch_size=500):
+        """bulk_update that still maintains the data kept up by save signals"""
+        now = timezone.now()
+        for product in products:
+            product.updated_at = now
+        self.bulk_update(products, list(fields) + ["updated_at"], batch_size=batch_size)
+        products_bulk_saved.send(sender=self.model, products=products, created=False)
 
 
 class Product(SafeDeleteModel):
+    """A product for sale
+
+    Stock (`quantity` and `reserved`) is changed by the conditional UPDATEs
+    in bangazonapi.inventory, so `save()` without `update_fields` leaves it
+    out rather than write back values read earlier. Such a save raises
+    ValueError if stock was changed on the instance; name the fields in
+    `update_fields` to set it.
+    """
+
+    STOCK_FIELDS = ("quantity", "reserved")
 
     _safedelete_policy = SOFT_DELETE
+
+    objects = SafeDeleteManager.from_queryset(ProductQuerySet)()
+    all_objects = SafeDeleteAllManager.from_queryset(ProductQuerySet)()
+    deleted_objects = SafeDeleteDeletedManager.from_queryset(ProductQuerySet)()
+
     name = models.CharField(
         max_length=50,
     )
@@ -26,6 +114,8 @@ class Product(SafeDeleteModel):
     quantity = models.IntegerField(
         validators=[MinValueValidator(0)],
     )
+    # Units held by carts; see bangazonapi.inventory
+    reserved = models.PositiveIntegerField(default=0)
     created_date = models.DateField(auto_now_add=True)
     category = models.ForeignKey(
         ProductCategory, on_delete=models.DO_NOTHING, related_name="products"
@@ -41,6 +131,55 @@ class Product(SafeDeleteModel):
         null=True,
     )
     rating = models.ManyToManyField("Rating", through="ProductRating")
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        product = super().from_db(db, field_names, values)
+        product._saved_stock = {
+            name: getattr(product, name) for name in cls.STOCK_FIELDS if name in field_names
+        }
+        return product
+
+    def save(self, *args, **kwargs):
+        # Not auto_now, so fixtures without the column still load
+        self.updated_at = timezone.now()
+        saved_stock = getattr(self, "_saved_stock", {})
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            # Inventory's conditional UPDATEs change stock and holds; writing
+            # back values read earlier, as soft deletes do, would undo them.
+            changed = [name for name, value in saved_stock.items() if getattr(self, name) != value]
+            if changed:
+                raise ValueError(
+                    f"Product.save() leaves out {', '.join(changed)}; "
+                    "name them in update_fields to change stock"
+                )
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.STOCK_FIELDS
+            ]
+
+        written = self.STOCK_FIELDS if self._state.adding else kwargs["update_fields"]
+        super().save(*args, **kwargs)
+        self._saved_stock = dict(
+            saved_stock,
+            **{name: getattr(self, name) for name in self.STOCK_FIELDS if name in written},
+        )
+
+    @property
+    def statistics(self):
+        """Denormalized statistics row, created from the raw tables if missing
+
+        Returns:
+            ProductStats -- Sales, rating and like totals for the product
+        """
+        try:
+            return self.stats
+        except ProductStats.DoesNotExist:
+            ProductStats.objects.rebuild([self.pk])
+            self.stats = ProductStats.objects.get(pk=self.pk)
+            return self.stats
 
     @property
     def number_sold(self):
@@ -49,10 +188,7 @@ class Product(SafeDeleteModel):
         Returns:
             int -- Number items on completed orders
         """
-        sold = OrderProduct.objects.filter(
-            product=self, order__payment_type__isnull=False
-        )
-        return sold.count()
+        return self.statistics.units_sold
 
     @property
     def can_be_rated(self):
@@ -74,17 +210,7 @@ class Product(SafeDeleteModel):
         Returns:
             number -- The average rating for the product
         """
-
-        try:
-            ratings = Rating.objects.filter(product=self)
-            total_rating = 0
-            for rating in ratings:
-                total_rating += rating.score
-
-            avg = total_rating / len(ratings)
-            return avg
-        except ZeroDivisionError:
-            return 0
+        return self.statistics.average_rating
 
     @property
     def rating_count(self):
@@ -92,7 +218,7 @@ class Product(SafeDeleteModel):
         Returns:
             int -- The number of ratings for the product
         """
-        return self.rating.count()
+        return self.statistics.ratings_count
 
     @property
     def number_of_likes(self):
@@ -101,8 +227,7 @@ class Product(SafeDeleteModel):
         Returns:
             int -- TAhe number of likes for the product
         """
-
-        return self.likes.count()
+        return self.statistics.likes_count
 
     class Meta:
         verbose_name = "product"
@@ -1,10 +1,17 @@
 from django.db import models
+from django.utils import timezone
 
 
 class ProductCategory(models.Model):
 
     name = models.CharField(max_length=55)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def save(self, *args, **kwargs):
+        # Not auto_now, so fixtures without the column still load
+        self.updated_at = timezone.now()
+        super().save(*args, **kwargs)
 
     class Meta:
         verbose_name = ("productcategory")
-        verbose_name_plural = ("productcategories")
\ No newline at end of file
+        verbose_name_plural = ("productcategories")
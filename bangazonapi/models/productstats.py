@@ -0,0 +1,143 @@
+"""Denormalized per-product sales, rating and like statistics"""
+
+from django.db import models
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+
+class ProductStatsManager(models.Manager):
+    """Manager for maintaining ProductStats rows"""
+
+    STAT_FIELDS = ("units_sold", "ratings_sum", "ratings_count", "likes_count")
+
+    def expected(self, product_ids=None):
+        """Compute statistics from the raw tables with one grouped query per statistic
+
+        Arguments:
+            product_ids -- Optional iterable of product ids to limit the computation
+
+        Returns:
+            dict -- {product_id: {field: value}} for every product, including soft-deleted ones
+        """
+        # Imported here since the product models import this module
+        from .like import Like
+        from .orderproduct import OrderProduct
+        from .productrating import ProductRating
+
+        products = self.model._meta.get_field("product").related_model.all_objects
+        if product_ids is not None:
+            products = products.filter(pk__in=product_ids)
+
+        stats = {
+            product_id: dict.fromkeys(self.STAT_FIELDS, 0)
+            for product_id in products.values_list("pk", flat=True)
+        }
+
+        def collect(queryset, **aggregates):
+            if product_ids is not None:
+                queryset = queryset.filter(product_id__in=product_ids)
+            rows = queryset.order_by().values("product_id").annotate(**aggregates)
+            for row in rows:
+                if row["product_id"] in stats:
+                    for field in aggregates:
+                        stats[row["product_id"]][field] = row[field] or 0
+
+        collect(
+            OrderProduct.objects.filter(order__payment_type__isnull=False),
+            units_sold=Sum("quantity"),
+        )
+        collect(
+            ProductRating.objects.all(),
+            ratings_sum=Sum("rating__score"),
+            ratings_count=Count("pk"),
+        )
+        collect(Like.objects.all(), likes_count=Count("pk"))
+
+        return stats
+
+    def rebuild(self, product_ids=None, batch_size=500):
+        """Recompute statistics from scratch and write only the rows that differ
+
+        Returns:
+            tuple -- (number of rows created, number of rows updated)
+        """
+        expected = self.expected(product_ids)
+        existing = self.in_bulk(list(expected.keys()))
+
+        missing = []
+        changed = []
+        for product_id, values in expected.items():
+            row = existing.get(product_id)
+            if row is None:
+                missing.append(self.model(product_id=product_id, **values))
+            elif any(getattr(row, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(row, field, value)
+                row.updated_at = timezone.now()
+                changed.append(row)
+
+        self.bulk_create(missing, batch_size=batch_size, ignore_conflicts=True)
+        self.bulk_update(changed, self.STAT_FIELDS + ("updated_at",), batch_size=batch_size)
+
+        return len(missing), len(changed)
+
+    def drift(self, product_ids=None):
+        """Compare stored statistics against the raw tables
+
+        Returns:
+            list -- (product_id, field, stored value, expected value) for each mismatch
+        """
+        expected = self.expected(product_ids)
+        existing = self.in_bulk(list(expected.keys()))
+
+        mismatches = []
+        for product_id, values in expected.items():
+            row = existing.get(product_id)
+            for field, value in values.items():
+                stored = getattr(row, field) if row is not None else None
+                if stored != value:
+                    mismatches.append((product_id, field, stored, value))
+
+        return mismatches
+
+    def bump(self, product_id, **deltas):
+        """Incrementally adjust the statistics of a single product
+
+        A product without a stats row yet gets one computed from the raw
+        tables, which already include the change being recorded.
+        """
+        updated = self.filter(product_id=product_id).update(
+            updated_at=timezone.now(),
+            **{field: F(field) + delta for field, delta in deltas.items()}
+        )
+        if not updated:
+            self.rebuild([product_id])
+
+
+class ProductStats(models.Model):
+
+    product = models.OneToOneField(
+        "Product", on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    units_sold = models.IntegerField(default=0, db_index=True)
+    ratings_sum = models.IntegerField(default=0)
+    ratings_count = models.IntegerField(default=0)
+    likes_count = models.IntegerField(default=0, db_index=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    objects = ProductStatsManager()
+
+    @property
+    def average_rating(self):
+        """Average rating from the running sum and count
+
+        Returns:
+            number -- The average rating for the product
+        """
+        if not self.ratings_count:
+            return 0
+        return self.ratings_sum / self.ratings_count
+
+    class Meta:
+        verbose_name = "productstats"
+        verbose_name_plural = "productstats"
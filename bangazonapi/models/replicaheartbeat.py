@@ -0,0 +1,11 @@
+from django.db import models
+
+
+class ReplicaHeartbeat(models.Model):
+    """Single row stamped on the primary; its age on a replica is the replica's lag"""
+
+    beat_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "replica heartbeat"
+        verbose_name_plural = "replica heartbeats"
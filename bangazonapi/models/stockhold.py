@@ -0,0 +1,17 @@
+from django.db import models
+
+
+class StockHold(models.Model):
+    """Units of a product held for an open order until expires_at
+
+    Each hold is also counted in its product's `reserved`.
+    """
+
+    order = models.ForeignKey("Order", on_delete=models.CASCADE, related_name="holds")
+    product = models.ForeignKey("Product", on_delete=models.CASCADE, related_name="holds")
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "stock hold"
+        verbose_name_plural = "stock holds"
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 
 class Store(models.Model):
@@ -13,6 +14,12 @@ class Store(models.Model):
     description = models.CharField(
         max_length=255,
     )
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def save(self, *args, **kwargs):
+        # Not auto_now, so fixtures without the column still load
+        self.updated_at = timezone.now()
+        super().save(*args, **kwargs)
 
 
     @property
@@ -0,0 +1,159 @@
+"""Keyset (cursor) pagination for the hand-written ViewSet.list methods"""
+
+import base64
+import json
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Forward-only pagination that seeks past the last row of the previous page
+
+    The cursor holds the ordering values of the last row returned, so every
+    page is a `WHERE (a, b) > (x, y) ORDER BY a, b LIMIT n` seek and deep
+    pages cost the same as the first one. The ordering must end in a unique,
+    non-null column such as `id` to be stable. Foreign keys are ordered and
+    sought by their `<name>_id` column. NULLs sort below every value, as
+    SQLite does, on every backend.
+
+    Clients written before paging can ask for `?envelope=legacy` to get
+    the page as a bare array, with the next page in a `Link` header.
+
+    Arguments:
+        ordering -- Tuple of field names, each optionally prefixed with "-"
+    """
+
+    cursor_query_param = "cursor"
+    envelope_query_param = "envelope"
+    page_size_query_param = "limit"
+    max_page_size = 100
+
+    def __init__(self, ordering=("id",), page_size=None):
+        self.ordering = tuple(ordering)
+        self.page_size = page_size or api_settings.PAGE_SIZE or 10
+        self.next_position = None
+        self.request = None
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        self.ordering = tuple(self.column(queryset.model, field) for field in self.ordering)
+        queryset = queryset.order_by(*(self.order_expression(field) for field in self.ordering))
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.seek(position))
+
+        # One extra row tells whether another page follows
+        rows = list(queryset[: page_size + 1])
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_position = [
+                self.to_json(getattr(rows[-1], field.lstrip("-")))
+                for field in self.ordering
+            ]
+        else:
+            self.next_position = None
+
+        return rows
+
+    @staticmethod
+    def order_expression(field):
+        if field.startswith("-"):
+            return F(field[1:]).desc(nulls_last=True)
+        return F(field).asc(nulls_first=True)
+
+    def seek(self, position):
+        """Row-value comparison `(a, b, c) > (x, y, z)` expanded into plain lookups
+
+        SQL comparisons with NULL are never true, so NULLs take `isnull`
+        lookups on the side of the ordering they sort on.
+        """
+        condition = Q()
+        equal_so_far = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip("-")
+            descending = field.startswith("-")
+            if value is None:
+                # Ascending, every value follows NULL; descending, nothing does
+                if not descending:
+                    condition |= equal_so_far & Q(**{f"{name}__isnull": False})
+                equal_so_far &= Q(**{f"{name}__isnull": True})
+            else:
+                after = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+                if descending:
+                    after |= Q(**{f"{name}__isnull": True})
+                condition |= equal_so_far & after
+                equal_so_far &= Q(**{name: value})
+        return condition
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            if len(position) != len(self.ordering):
+                raise ValueError(encoded)
+            return [
+                self.to_python(model, field.lstrip("-"), value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, UnicodeError, ValidationError):
+            raise NotFound("Invalid cursor")
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(json.dumps(position).encode("ascii")).decode("ascii")
+
+    @staticmethod
+    def column(model, field):
+        """A foreign key ordering as its `<name>_id` column, whose value is JSON"""
+        descending = field.startswith("-")
+        name = field.lstrip("-")
+        try:
+            name = model._meta.get_field(name).attname
+        except (FieldDoesNotExist, AttributeError):
+            # Annotations, and reverse relations, which have no column
+            pass
+        return f"-{name}" if descending else name
+
+    @staticmethod
+    def to_json(value):
+        return value.isoformat() if hasattr(value, "isoformat") else value
+
+    @staticmethod
+    def to_python(model, name, value):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Annotations such as the product statistics are plain numbers
+            return value
+        return field.to_python(value)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.next_position)
+        )
+
+    def get_paginated_response(self, data):
+        if self.request.query_params.get(self.envelope_query_param) == "legacy":
+            next_link = self.get_next_link()
+            headers = {"Link": f'<{next_link}>; rel="next"'} if next_link else None
+            return Response(data, headers=headers)
+        return Response({"next": self.get_next_link(), "results": data})
@@ -0,0 +1,63 @@
+"""Opt-in profiling of single requests
+
+A request carrying an `X-Profile` header is run under the stack sampler
+when it authenticates as a staff user or with a token listed in
+`REQUEST_PROFILE_TOKENS`. The collapsed stacks (for flamegraph.pl or
+speedscope) and a top-N summary are written to `REQUEST_PROFILE_DIR`, and
+the response names the files in its own `X-Profile` header. Requests
+without the header never import the profiler.
+"""
+
+import re
+import threading
+from datetime import datetime
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+_SLUG = re.compile(r"[^A-Za-z0-9]+")
+
+
+def profiling_allowed(request):
+    """Whether the request may be profiled; only called when it asks to be"""
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+
+    header = request.META.get("HTTP_AUTHORIZATION", "").split()
+    if len(header) != 2 or header[0] != TokenAuthentication.keyword:
+        return False
+    if header[1] in getattr(settings, "REQUEST_PROFILE_TOKENS", ()):
+        return True
+
+    model = TokenAuthentication().get_model()
+    return model.objects.filter(key=header[1], user__is_staff=True, user__is_active=True).exists()
+
+
+class RequestProfilingMiddleware:
+    """Profile the view, serializers and rendering of requests that ask for it
+
+    Listed last in MIDDLEWARE, so the profile covers the DRF dispatch and
+    response rendering rather than the rest of the middleware stack.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if "HTTP_X_PROFILE" not in request.META or not profiling_allowed(request):
+            return self.get_response(request)
+
+        # Only profiled requests load the sampler
+        from bangazonapi.stack_sampler import StackSampler  # pylint: disable=import-outside-toplevel
+
+        interval = getattr(settings, "REQUEST_PROFILE_INTERVAL", 0.001)
+        with StackSampler(threading.get_ident(), interval) as sampler:
+            response = self.get_response(request)
+
+        name = "{}-{}-{}".format(
+            datetime.now().strftime("%Y%m%dT%H%M%S.%f"),
+            request.method,
+            _SLUG.sub("-", request.path).strip("-") or "root",
+        )
+        sampler.write(settings.REQUEST_PROFILE_DIR, name)
+        response["X-Profile"] = name
+        return response
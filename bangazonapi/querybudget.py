@@ -0,0 +1,143 @@
+"""Per-request SQL query budgets and repeated-query (N+1) detection
+
+`QueryBudgetMiddleware` wraps every database connection while a request is
+handled and counts its queries, their total time and how often each query
+shape repeats. Routes get budgets by method and URL name in
+`QUERY_BUDGETS`; a request over its budget is logged, or raises with
+`QUERY_BUDGET_ACTION = "raise"`. Tests assert the same budgets with
+`QueryBudgetTestMixin`.
+"""
+
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(Exception):
+    """A request ran more queries than its route's budget"""
+
+
+def fingerprint(sql):
+    """Query shape with literals and IN-list lengths erased"""
+    sql = _IN_LIST.sub("IN (...)", sql)
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def budget_for(method, route):
+    """Query budget of a method and URL name such as "GET product-list"
+
+    Returns:
+        int -- The budget, or None for unbudgeted routes
+    """
+    budgets = getattr(settings, "QUERY_BUDGETS", {})
+    return budgets.get(f"{method} {route}", getattr(settings, "QUERY_BUDGET_DEFAULT", None))
+
+
+class QueryRecorder:
+    """Context manager counting the queries of every connection used inside it"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def repeated(self, threshold):
+        """{fingerprint: count} of query shapes run at least threshold times"""
+        return {sql: count for sql, count in self.fingerprints.items() if count >= threshold}
+
+    def report(self, method, route):
+        return {
+            "method": method,
+            "route": route,
+            "queries": self.count,
+            "time_ms": round(self.duration * 1000, 3),
+            "repeated": self.repeated(getattr(settings, "QUERY_REPEAT_THRESHOLD", 5)),
+        }
+
+
+class QueryBudgetMiddleware:
+    """Record the queries of each request and enforce its route's budget
+
+    The report is attached to the response as `query_report`, and with
+    DEBUG on it is also sent in X-Query-Count and X-Query-Time-Ms headers.
+    Queries run while a streaming response is consumed are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        match = getattr(request, "resolver_match", None)
+        route = match.view_name if match else request.path
+        report = recorder.report(request.method, route)
+        response.query_report = report
+
+        if settings.DEBUG:
+            response["X-Query-Count"] = str(report["queries"])
+            response["X-Query-Time-Ms"] = str(report["time_ms"])
+
+        for sql, count in report["repeated"].items():
+            logger.warning("%s ran %d times in %s: %s", route, count, request.path, sql[:300])
+
+        budget = budget_for(request.method, route)
+        if budget is not None and report["queries"] > budget:
+            message = (
+                f"{request.method} {request.path} ({route}) ran {report['queries']} queries "
+                f"in {report['time_ms']}ms, over its budget of {budget}"
+            )
+            if getattr(settings, "QUERY_BUDGET_ACTION", "log") == "raise":
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return response
+
+
+class QueryBudgetTestMixin:
+    """TestCase mixin asserting responses against the configured budgets"""
+
+    def assertWithinQueryBudget(self, response, budget=None):  # pylint: disable=invalid-name
+        report = response.query_report
+        if budget is None:
+            budget = budget_for(report["method"], report["route"])
+        self.assertIsNotNone(budget, f"{report['method']} {report['route']} has no query budget")
+        self.assertLessEqual(
+            report["queries"],
+            budget,
+            f"{report['route']} ran {report['queries']} queries, budget is {budget}",
+        )
+        self.assertEqual(report["repeated"], {}, f"{report['route']} repeats queries")
@@ -0,0 +1,156 @@
+"""Read replicas for read-only endpoints and reports
+
+Views opt in with `ReplicaReadsMixin` or `@replica_reads`; their safe
+requests then read from one of `DATABASE_REPLICAS`, chosen at random,
+through `ReplicaRouter`. Everything else reads from the primary.
+
+Reads stay on the primary for the rest of a request once it has written,
+and for `REPLICA_PIN_SECONDS` afterwards for the same user, so clients
+read their own writes. Pins live in the default cache, which is shared
+between worker processes only when that backend is.
+
+Replica lag is the age of the `ReplicaHeartbeat` row as the replica sees
+it; `refresh_replicas` stamps the primary before copying it.
+"""
+
+import contextvars
+import functools
+import random
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError
+from django.http import HttpRequest
+from django.utils import timezone
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.request import Request
+from bangazonapi.models import ReplicaHeartbeat
+
+PRIMARY = "default"
+
+# {"alias": replica or None, "wrote": bool} of the request on this thread
+_state = contextvars.ContextVar("replica_state", default=None)
+
+
+def replicas():
+    return list(getattr(settings, "DATABASE_REPLICAS", ()))
+
+
+def _pin_key(user_id):
+    return f"replica-pin:{user_id}"
+
+
+def is_pinned(user):
+    return user.is_authenticated and caches["default"].get(_pin_key(user.pk)) is not None
+
+
+def pin(user):
+    """Send the user's reads to the primary for REPLICA_PIN_SECONDS"""
+    seconds = getattr(settings, "REPLICA_PIN_SECONDS", 5)
+    if seconds and user.is_authenticated:
+        caches["default"].set(_pin_key(user.pk), True, timeout=seconds)
+
+
+def use_replica(request):
+    """Read from a replica for the rest of this request, unless its user is pinned"""
+    state = _state.get()
+    if state is None or state["wrote"] or request.method not in SAFE_METHODS:
+        return
+    aliases = replicas()
+    if aliases and not is_pinned(request.user):
+        state["alias"] = random.choice(aliases)
+
+
+def replica_reads(view):
+    """Decorate a view function or a ViewSet action to read from a replica"""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        request = next(arg for arg in args if isinstance(arg, (HttpRequest, Request)))
+        use_replica(request)
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+class ReplicaReadsMixin:
+    """ViewSet mixin sending the reads of every safe request to a replica"""
+
+    def initial(self, request, *args, **kwargs):
+        # Authentication has run, so pins can be looked up by user
+        super().initial(request, *args, **kwargs)
+        use_replica(request)
+
+
+class ReplicaMiddleware:
+    """Scope replica reads to a request and pin users who wrote to the primary"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = {"alias": None, "wrote": False}
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        user = getattr(request, "user", None)
+        if state["wrote"] and user is not None:
+            pin(user)
+        return response
+
+
+class ReplicaRouter:
+    """Route reads of replica-enabled requests to their replica, writes to the primary"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state["wrote"]:
+            return None
+        return state["alias"]
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state["wrote"] = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the primary's rows, so objects from any of them may relate
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False
+        return None
+
+
+def beat():
+    """Stamp the primary's heartbeat with the current time"""
+    ReplicaHeartbeat.objects.using(PRIMARY).update_or_create(
+        pk=1, defaults={"beat_at": timezone.now()}
+    )
+
+
+def lag(alias):
+    """Seconds since the heartbeat a replica holds was written, or None without one"""
+    try:
+        heartbeat = ReplicaHeartbeat.objects.using(alias).filter(pk=1).first()
+    except DatabaseError:
+        # Not copied yet
+        return None
+    if heartbeat is None:
+        return None
+    return (timezone.now() - heartbeat.beat_at).total_seconds()
+
+
+def lag_gauges():
+    """{(family, sample, labels): seconds} of every replica for the metrics exposition"""
+    gauges = {}
+    for alias in replicas():
+        seconds = lag(alias)
+        if seconds is not None:
+            labels = (("replica", alias),)
+            gauges[("bangazon_replica_lag_seconds", "bangazon_replica_lag_seconds", labels)] = seconds
+    return gauges
@@ -0,0 +1,58 @@
+"""Transactional retry of writes that lose the SQLite write lock
+
+SQLite has a single writer. A transaction that cannot get the lock within
+the busy timeout, or that would deadlock upgrading a read to a write,
+fails with "database is locked". `retry_on_lock` runs a view method in its
+own transaction and runs it again after a short, jittered and growing
+delay, up to `DB_LOCK_RETRIES` times.
+"""
+
+import functools
+import logging
+import random
+import time
+from django.conf import settings
+from django.db import OperationalError, transaction
+from bangazonapi import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def is_lock_error(exc):
+    """Whether an OperationalError is SQLite write contention"""
+    message = str(exc).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+def backoff(attempt):
+    """Seconds to wait before retry number attempt, counting from 1"""
+    base = getattr(settings, "DB_LOCK_RETRY_DELAY", 0.01)
+    cap = getattr(settings, "DB_LOCK_RETRY_MAX_DELAY", 0.5)
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def retry_on_lock(func):
+    """Run func in a transaction, retrying it when the database is locked
+
+    Inside an enclosing transaction the lock can't be released by retrying,
+    so the error is raised to whoever owns that transaction.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = getattr(settings, "DB_LOCK_RETRIES", 5)
+        attempt = 0
+        while True:
+            nested = transaction.get_connection().in_atomic_block
+            try:
+                with transaction.atomic():
+                    return func(*args, **kwargs)
+            except OperationalError as exc:
+                attempt += 1
+                if nested or attempt > retries or not is_lock_error(exc):
+                    raise
+                logger.info("%s retry %d after: %s", func.__qualname__, attempt, exc)
+                metrics.inc("bangazon_db_lock_retries", {"view": func.__qualname__})
+                time.sleep(backoff(attempt))
+
+    return wrapper
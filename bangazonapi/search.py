@@ -0,0 +1,151 @@
+"""Full-text product search backed by an SQLite FTS5 index"""
+
+from functools import lru_cache
+from django.db import connection, connections
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+INDEX_TABLE = "bangazonapi_product_fts"
+PRODUCT_TABLE = "bangazonapi_product"
+
+# Control characters FTS5 puts around matches; product text is seller
+# input, so HTML tags are only added after escaping it
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+
+@lru_cache(maxsize=None)
+def is_available(using="default"):
+    """Whether the database can host the FTS5 index
+
+    Returns:
+        boolean -- True for SQLite builds compiled with FTS5
+    """
+    db = connections[using]
+    if db.vendor != "sqlite":
+        return False
+
+    with db.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_index(using="default"):
+    """Create the index table if it doesn't exist yet"""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE}
+            USING fts5(name, description, location, tokenize='unicode61 remove_diacritics 2')
+            """
+        )
+
+
+def rebuild_index(using="default"):
+    """Repopulate the index from every product that isn't soft-deleted
+
+    Returns:
+        int -- Number of indexed products
+    """
+    create_index(using)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {INDEX_TABLE}")
+        cursor.execute(
+            f"""
+            INSERT INTO {INDEX_TABLE} (rowid, name, description, location)
+            SELECT id, name, description, location
+            FROM {PRODUCT_TABLE}
+            WHERE deleted IS NULL
+            """
+        )
+        count = cursor.rowcount
+        cursor.execute(f"INSERT INTO {INDEX_TABLE} ({INDEX_TABLE}) VALUES ('optimize')")
+    return count
+
+
+def index_product(product):
+    """Add, replace or remove a single product's index entry"""
+    index_products([product])
+
+
+def index_products(products):
+    """Replace the index entries of many products in two statements
+
+    Soft-deleted products only lose their entry.
+    """
+    products = list(products)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {INDEX_TABLE} WHERE rowid = %s",
+            [[product.pk] for product in products],
+        )
+        cursor.executemany(
+            f"INSERT INTO {INDEX_TABLE} (rowid, name, description, location) VALUES (%s, %s, %s, %s)",
+            [
+                [product.pk, product.name, product.description, product.location]
+                for product in products
+                if product.deleted is None
+            ],
+        )
+
+
+def unindex_product(product):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {INDEX_TABLE} WHERE rowid = %s", [product.pk])
+
+
+def match_expression(text):
+    """Turn free text into an FTS5 query of quoted prefix terms
+
+    Quoting every term keeps FTS5 operators and punctuation in user input
+    from being parsed as query syntax.
+    """
+    terms = [term.replace('"', '""') for term in text.split()]
+    return " ".join(f'"{term}"*' for term in terms if term)
+
+
+def annotate_matches(queryset, text):
+    """Restrict products to those matching text and rank them with BM25
+
+    The MATCH subquery drives the lookup, so only matching rows are read.
+    Name matches weigh more than location matches, which weigh more than
+    description matches. Lower ranks are better matches.
+
+    Returns:
+        QuerySet -- Matching products annotated with search_rank, and with
+            search_snippet for `highlight()`
+    """
+    expression = match_expression(text)
+    if not expression:
+        return queryset.none()
+
+    product_table = queryset.model._meta.db_table
+    matching = f"{INDEX_TABLE} MATCH %s AND {INDEX_TABLE}.rowid = {product_table}.id"
+
+    return queryset.filter(
+        pk__in=RawSQL(
+            f"SELECT rowid FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s",
+            [expression],
+        )
+    ).annotate(
+        search_rank=RawSQL(
+            f"SELECT bm25({INDEX_TABLE}, 10.0, 1.0, 5.0) FROM {INDEX_TABLE} WHERE {matching}",
+            [expression],
+        ),
+        search_snippet=RawSQL(
+            f"SELECT snippet({INDEX_TABLE}, -1, %s, %s, '...', 12) "
+            f"FROM {INDEX_TABLE} WHERE {matching}",
+            [MATCH_START, MATCH_END, expression],
+        ),
+    )
+
+
+def highlight(snippet):
+    """HTML of a search_snippet, escaped, with its matches wrapped in <mark>"""
+    if snippet is None:
+        return None
+    return (
+        escape(snippet)
+        .replace(MATCH_START, "<mark>")
+        .replace(MATCH_END, "</mark>")
+    )
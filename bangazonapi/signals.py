@@ -0,0 +1,266 @@
+"""Signal handlers keeping denormalized product data up to date"""
+
+from django.db.models import Sum
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.contrib.auth.models import User
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from bangazonapi import cache, search
+from bangazonapi.authentication import token_cache
+from bangazonapi.models import (
+    Customer,
+    Favorite,
+    Like,
+    Order,
+    OrderProduct,
+    Product,
+    ProductCategory,
+    ProductRating,
+    ProductStats,
+    Rating,
+    Store,
+    StoreProduct,
+    products_bulk_saved,
+)
+
+
+# Fixtures are loaded with raw=True; `rebuild_product_stats` covers them instead.
+
+
+@receiver(post_save, sender=Product)
+def create_product_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ProductStats.objects.get_or_create(product_id=instance.pk)
+
+
+@receiver(post_save, sender=OrderProduct)
+def count_line_item_sold(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.order.payment_type_id is not None:
+        ProductStats.objects.bump(instance.product_id, units_sold=instance.quantity)
+        cache.bump_version(cache.CATALOG)
+
+
+@receiver(post_delete, sender=OrderProduct)
+def uncount_line_item_sold(sender, instance, **kwargs):
+    if Order.objects.filter(pk=instance.order_id, payment_type__isnull=False).exists():
+        ProductStats.objects.bump(instance.product_id, units_sold=-instance.quantity)
+        cache.bump_version(cache.CATALOG)
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_payment(sender, instance, raw=False, **kwargs):
+    instance._previous_payment_type_id = (
+        Order.objects.filter(pk=instance.pk)
+        .values_list("payment_type_id", flat=True)
+        .first()
+        if instance.pk and not raw
+        else None
+    )
+
+
+@receiver(post_save, sender=Order)
+def count_order_sold(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    was_paid = getattr(instance, "_previous_payment_type_id", None) is not None
+    is_paid = instance.payment_type_id is not None
+    if was_paid == is_paid:
+        return
+
+    direction = 1 if is_paid else -1
+    sold = (
+        OrderProduct.objects.filter(order=instance)
+        .order_by()
+        .values("product_id")
+        .annotate(units=Sum("quantity"))
+    )
+    for row in sold:
+        ProductStats.objects.bump(row["product_id"], units_sold=direction * row["units"])
+    cache.bump_version(cache.CATALOG)
+
+
+@receiver(post_save, sender=ProductRating)
+def count_product_rating(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ProductStats.objects.bump(
+            instance.product_id,
+            ratings_sum=int(instance.rating.score),
+            ratings_count=1,
+        )
+
+
+@receiver(post_delete, sender=ProductRating)
+def uncount_product_rating(sender, instance, **kwargs):
+    score = (
+        Rating.objects.filter(pk=instance.rating_id)
+        .values_list("score", flat=True)
+        .first()
+    )
+    if score is None:
+        ProductStats.objects.rebuild([instance.product_id])
+    else:
+        ProductStats.objects.bump(
+            instance.product_id, ratings_sum=-score, ratings_count=-1
+        )
+
+
+@receiver(m2m_changed, sender=Product.rating.through)
+def count_product_ratings_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """`product.rating.add()` bulk inserts ProductRating rows without post_save
+
+    `remove()` and `clear()` delete the rows with a queryset delete, which
+    sends post_delete for each one, so `uncount_product_rating` counts those.
+    """
+    if action != "post_add" or not pk_set:
+        return
+
+    if reverse:
+        for product_id in pk_set:
+            ProductStats.objects.bump(
+                product_id,
+                ratings_sum=int(instance.score),
+                ratings_count=1,
+            )
+    else:
+        scores = Rating.objects.filter(pk__in=pk_set).values_list("score", flat=True)
+        ProductStats.objects.bump(
+            instance.pk,
+            ratings_sum=sum(scores),
+            ratings_count=len(pk_set),
+        )
+
+
+@receiver(pre_save, sender=Rating)
+def remember_rating_score(sender, instance, raw=False, **kwargs):
+    instance._previous_score = (
+        Rating.objects.filter(pk=instance.pk).values_list("score", flat=True).first()
+        if instance.pk and not raw
+        else None
+    )
+
+
+@receiver(post_save, sender=Rating)
+def rescore_product_rating(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, "_previous_score", None)
+    if created or raw or previous is None or previous == instance.score:
+        return
+
+    product_ids = ProductRating.objects.filter(rating=instance).values_list(
+        "product_id", flat=True
+    )
+    for product_id in product_ids:
+        ProductStats.objects.bump(product_id, ratings_sum=int(instance.score) - previous)
+
+
+@receiver(post_save, sender=Like)
+def count_like(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ProductStats.objects.bump(instance.product_id, likes_count=1)
+
+
+@receiver(post_delete, sender=Like)
+def uncount_like(sender, instance, **kwargs):
+    ProductStats.objects.bump(instance.product_id, likes_count=-1)
+
+
+def create_search_index(sender, using="default", **kwargs):
+    """Connected to post_migrate, since the FTS5 table has no model"""
+    if search.is_available(using):
+        search.create_index(using)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """Soft-deletes save the product too, which drops it from the index"""
+    if search.is_available():
+        search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    if search.is_available():
+        search.unindex_product(instance)
+
+
+def invalidate_catalog(sender, **kwargs):
+    """Anything shown on the product landing page changed
+
+    Line items and orders only invalidate when they change units sold,
+    which the handlers above take care of.
+    """
+    cache.bump_version(cache.CATALOG)
+
+
+def invalidate_categories(sender, **kwargs):
+    cache.bump_version(cache.CATALOG)
+    cache.bump_version(cache.CATEGORIES)
+
+
+for model in (Product, Like, Rating, ProductRating):
+    post_save.connect(invalidate_catalog, sender=model)
+    post_delete.connect(invalidate_catalog, sender=model)
+
+m2m_changed.connect(invalidate_catalog, sender=Product.rating.through)
+post_save.connect(invalidate_categories, sender=ProductCategory)
+post_delete.connect(invalidate_categories, sender=ProductCategory)
+
+
+def touch_store(sender, instance, **kwargs):
+    """Favorites and store products change the store payload and its ETag"""
+    if kwargs.get("raw"):
+        return
+    Store.objects.filter(pk=instance.store_id).update(updated_at=timezone.now())
+
+
+for model in (Favorite, StoreProduct):
+    post_save.connect(touch_store, sender=model)
+    post_delete.connect(touch_store, sender=model)
+
+
+@receiver(post_save, sender=User)
+def touch_owned_store(sender, instance, raw=False, **kwargs):
+    """The owner's name is part of the store payload"""
+    if not raw:
+        Store.objects.filter(customer__user=instance).update(updated_at=timezone.now())
+
+
+@receiver(products_bulk_saved, sender=Product)
+def bulk_saved_products(sender, products, created, **kwargs):
+    """Stats rows, search entries and cache versions for bulk writes"""
+    if created:
+        ProductStats.objects.bulk_create(
+            [ProductStats(product_id=product.pk) for product in products],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+    if search.is_available():
+        search.index_products(products)
+    cache.bump_version(cache.CATALOG)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Token)
+def evict_cached_tokens(sender, instance, **kwargs):
+    token_cache.evict_user(instance.pk if sender is User else instance.user_id)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def evict_customer_tokens(sender, instance, **kwargs):
+    token_cache.evict_user(instance.user_id)
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def evict_store_owner_tokens(sender, instance, raw=False, **kwargs):
+    """Cached tokens carry the owner's store, joined through the customer"""
+    if raw:
+        return
+    user_id = (
+        Customer.objects.filter(pk=instance.customer_id).values_list("user_id", flat=True).first()
+    )
+    if user_id is not None:
+        token_cache.evict_user(user_id)
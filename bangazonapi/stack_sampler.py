@@ -0,0 +1,117 @@
+"""Sampling profiler for a single thread, with flame-graph output
+
+Only imported by `bangazonapi.profiling` for requests that ask to be
+profiled.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# First matching frame from the innermost outwards decides a sample's phase
+PHASES = (
+    ("db", ("django/db/",)),
+    ("render", ("rest_framework/renderers.py", "django/template/")),
+    ("serialize", ("rest_framework/serializers.py", "rest_framework/fields.py", "rest_framework/relations.py")),
+)
+
+
+def frame_label(code):
+    """module/path.py:function, relative to site-packages or the project"""
+    filename = code.co_filename.replace(os.sep, "/")
+    for marker in ("site-packages/", "/bangazonapi/", "/bangazon/"):
+        if marker in filename:
+            filename = filename.rsplit(marker, 1)[1]
+            if not marker.startswith("site"):
+                filename = marker.strip("/") + "/" + filename
+            break
+    return f"{filename}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class StackSampler:
+    """Records the call stack of one thread every interval seconds
+
+    The sampler thread needs the GIL to look, so the effective rate is
+    bounded by `sys.getswitchinterval()` while the profiled thread is busy.
+    """
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self._started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)  # pylint: disable=protected-access
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed stack format, one `a;b;c count` line per stack"""
+        return "".join(
+            f"{';'.join(stack)} {count}\n" for stack, count in self.samples.most_common()
+        )
+
+    def phases(self):
+        """{phase: samples}, splitting database, serializer and rendering time"""
+        totals = Counter()
+        for stack, count in self.samples.items():
+            phase = "view"
+            for label in reversed(stack):
+                matched = next(
+                    (name for name, paths in PHASES if any(path in label for path in paths)),
+                    None,
+                )
+                if matched:
+                    phase = matched
+                    break
+            totals[phase] += count
+        return totals
+
+    def summary(self, top=25):
+        """Plain-text report of phases and the top functions by self and total samples"""
+        total = sum(self.samples.values()) or 1
+        own = Counter()
+        inclusive = Counter()
+        for stack, count in self.samples.items():
+            own[stack[-1]] += count
+            for label in set(stack):
+                inclusive[label] += count
+
+        lines = [f"{total} samples over {self.elapsed * 1000:.1f}ms", "", "phase"]
+        for phase, count in self.phases().most_common():
+            lines.append(f"  {count / total:6.1%}  {phase}")
+        lines += ["", "self"]
+        lines += [f"  {count / total:6.1%}  {label}" for label, count in own.most_common(top)]
+        lines += ["", "total"]
+        lines += [f"  {count / total:6.1%}  {label}" for label, count in inclusive.most_common(top)]
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory, name):
+        """Write name.collapsed and name.txt into directory"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name)
+        with open(f"{path}.collapsed", "w", encoding="utf-8") as collapsed:
+            collapsed.write(self.collapsed())
+        with open(f"{path}.txt", "w", encoding="utf-8") as summary:
+            summary.write(self.summary())
@@ -0,0 +1,27 @@
+"""Test runner that keeps files written while handling requests out of the tree"""
+
+import os
+import tempfile
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TemporaryDirectoryRunner(DiscoverRunner):
+    """DiscoverRunner writing metrics for the whole run into a temporary directory
+
+    Tests that check the files themselves still override METRICS_DIR with
+    a directory of their own.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._directory = tempfile.TemporaryDirectory(prefix="bangazon-tests-")
+        self._settings = override_settings(
+            METRICS_DIR=os.path.join(self._directory.name, "metrics")
+        )
+        self._settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._settings.disable()
+        self._directory.cleanup()
+        super().teardown_test_environment(**kwargs)
@@ -10,5 +10,5 @@ from .lineitem import LineItems
 from .customer import Customers
 from .user import Users
 from .store import StoreViewSet
-
-
+from .cachestats import cache_stats
+from .metrics import prometheus_metrics
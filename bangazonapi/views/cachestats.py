@@ -0,0 +1,27 @@
+"""View module for response cache statistics"""
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from bangazonapi import cache
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """
+    @api {GET} /cache-stats GET response cache hit and miss counters
+    @apiName GetCacheStats
+    @apiGroup Admin
+
+    @apiHeader {String} Authorization Auth token of a staff user
+
+    @apiSuccessExample {json} Success
+        {
+            "catalog": {
+                "hits": 120,
+                "misses": 4,
+                "hit_ratio": 0.967
+            }
+        }
+    """
+    return Response(cache.stats())
@@ -1,15 +1,17 @@
 """View module for handling requests about customer shopping cart"""
 
-from django.db.models import Sum, F
-from django.db.models.functions import Round
+from django.db.models import Prefetch
 import datetime
 from rest_framework.decorators import action
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import serializers
-from bangazonapi.models import Order, Customer, Product, OrderProduct
-from .product import ProductSerializer
+from bangazonapi import cache, inventory
+from bangazonapi.models import Order, Product, OrderProduct
+from bangazonapi.authentication import current_customer
+from bangazonapi.retry import retry_on_lock
+from .product import ProductSerializer, _as_int, product_stats_prefetch
 from .order import OrderSerializer
 
 
@@ -20,12 +22,13 @@ class CartLineItemSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = OrderProduct
-        fields = ("id", "product")
+        fields = ("id", "product", "quantity", "unit_price")
 
 
 class Cart(ViewSet):
     """Shopping cart for Bangazon eCommerce"""
 
+    @retry_on_lock
     def create(self, request, pk=None):
         """
         @api {POST} /cart POST new line items to cart
@@ -35,8 +38,12 @@ class Cart(ViewSet):
         @apiSuccessExample {json} Success
             HTTP/1.1 204 No Content
         @apiParam {Number} product_id Id of product to add
+        @apiParam {Number} [quantity=1] Units to add; an existing line item is incremented
+
+        @apiDescription Holds the units for INVENTORY_HOLD_SECONDS, or
+        responds 409 Conflict when fewer are neither sold nor held.
         """
-        current_user = Customer.objects.get(user=request.auth.user)
+        current_user = current_customer(request)
 
         try:
             open_order = Order.objects.get(
@@ -48,6 +55,13 @@ class Cart(ViewSet):
             open_order.customer = current_user
             open_order.save()
 
+        quantity = _as_int(request.data.get("quantity", 1))
+        if quantity is None or quantity < 1:
+            return Response(
+                {"message": "Quantity must be a positive whole number."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
         product_id = request.data.get("product_id")
         try:
             product = Product.objects.get(pk=product_id)
@@ -56,33 +70,43 @@ class Cart(ViewSet):
                 {"message": "Product not found."}, status=status.HTTP_404_NOT_FOUND
             )
 
-        line_item = OrderProduct()
+        try:
+            inventory.hold(open_order, product, quantity)
+        except inventory.OutOfStock:
+            return Response(
+                {"message": "Not enough of this product in stock."},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        line_item = OrderProduct.objects.add_units(open_order, product, quantity)
         line_item.product = product
-        line_item.order = open_order
-        line_item.save()
+        cache.bump_version_on_commit(cache.CARTS, current_user.pk)
 
         serializer = CartLineItemSerializer(line_item, context={"request": request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @retry_on_lock
     def destroy(self, request, pk=None):
         """
         @api {DELETE} /cart DELETE line item or empty cart
         @apiName RemoveFromCart
         @apiGroup ShoppingCart
 
-        @apiParam {id} id Product Id to remove from cart
+        @apiParam {id} id Line item Id to remove one unit of from cart
         @apiParam {Boolean} empty Whether to empty the entire cart
         @apiSuccessExample {json} Success
             HTTP/1.1 204 No Content
         """
-        current_user = Customer.objects.get(user=request.auth.user)
+        current_user = current_customer(request)
 
         try:
             open_order = Order.objects.get(customer=current_user, payment_type=None)
 
             try:
                 line_item = OrderProduct.objects.get(id=pk, order=open_order)
-                line_item.delete()
+                OrderProduct.objects.remove_units(line_item, 1)
+                inventory.release(open_order, line_item.product_id, 1)
+                cache.bump_version_on_commit(cache.CARTS, current_user.pk)
                 return Response({}, status=status.HTTP_204_NO_CONTENT)
             except OrderProduct.DoesNotExist:
                 return Response(
@@ -107,35 +131,66 @@ class Cart(ViewSet):
         @apiSuccess (200) {Object} payment_type Payment id use to complete order
         @apiSuccess (200) {String} customer URI for customer
         @apiSuccess (200) {Object[]} lineitems Line items in cart
-        @apiSuccess (200) {Number} size Number of items in cart
+        @apiSuccess (200) {Number} size Number of units in cart
         @apiSuccess (200) {Number} total Total price of items in cart
         """
-        current_user = Customer.objects.get(user=request.auth.user)
+        current_user = current_customer(request)
         try:
-            open_order = Order.objects.get(customer=current_user, payment_type=None)
-            line_items = OrderProduct.objects.filter(order=open_order)
+            # Line items with their products and statistics in one prefetch;
+            # the totals are columns of the order
+            open_order = Order.objects.prefetch_related(
+                Prefetch(
+                    "lineitems",
+                    queryset=OrderProduct.objects.prefetch_related(
+                        product_stats_prefetch(request)
+                    ),
+                )
+            ).get(customer=current_user, payment_type=None)
 
-            serialized_order = OrderSerializer(
+            final = OrderSerializer(
                 open_order, many=False, context={"request": request}
-            )
-
-            line_item_serializer = CartLineItemSerializer(
-                line_items, many=True, context={"request": request}
-            )
-
-            total_price = line_items.aggregate(total=Round(Sum(F("product__price")), 2))
-
-            final = serialized_order.data
-            final["lineitems"] = line_item_serializer.data
-            final["size"] = len(line_items)
-            final["total"] = total_price["total"] or 0
+            ).data
+            final.update(size=open_order.item_count, total=open_order.subtotal)
 
             return Response(final)
 
         except Order.DoesNotExist as ex:
             return Response({"message": ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=False, methods=["get"])
+    def summary(self, request):
+        """
+        @api {GET} /cart/summary GET number of units and total of cart
+        @apiName GetCartSummary
+        @apiGroup ShoppingCart
+
+        @apiDescription Cached per customer until a write to their cart
+        commits, for badges that poll it. The total uses the prices line
+        items were added at, so catalog changes don't invalidate it.
+        Cart versions live in the responses cache, so with several worker
+        processes it has to be shared (BANGAZON_RESPONSE_CACHE_BACKEND, such
+        as the file backend); with the default per-process LocMemCache other
+        workers can serve the old totals for up to its 300s timeout.
+
+        @apiSuccess (200) {Number} size Number of units in cart
+        @apiSuccess (200) {Number} total Total price of items in cart
+        """
+        current_user = current_customer(request)
+
+        def build():
+            totals = (
+                Order.objects.filter(customer=current_user, payment_type=None)
+                .values("item_count", "subtotal")
+                .first()
+            )
+            if totals is None:
+                return {"size": 0, "total": 0}
+            return {"size": totals["item_count"], "total": totals["subtotal"]}
+
+        return Response(cache.cached(cache.CARTS, "summary", build, scope=current_user.pk))
+
     @action(detail=False, methods=["delete"])
+    @retry_on_lock
     def empty(self, request):
         """
         @api {DELETE} /cart/empty Empty the entire cart
@@ -145,14 +200,16 @@ class Cart(ViewSet):
         @apiSuccessExample {json} Success
             HTTP/1.1 204 No Content
         """
-        current_user = Customer.objects.get(user=request.auth.user)
+        current_user = current_customer(request)
 
         try:
             open_order = Order.objects.get(customer=current_user, payment_type=None)
 
             # Delete all line items in the cart
+            inventory.release_order(open_order)
             OrderProduct.objects.filter(order=open_order).delete()
             open_order.delete()
+            cache.bump_version_on_commit(cache.CARTS, current_user.pk)
 
             return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -4,9 +4,12 @@ from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
 from bangazonapi.models import Customer
+from bangazonapi.authentication import current_customer
+from bangazonapi.replicas import replica_reads
 from rest_framework.decorators import action
 from bangazonapi.models import Customer, Favorite
 from django.shortcuts import render
+from bangazonapi.pagination import KeysetPagination
 
 
 class CustomerSerializer(serializers.HyperlinkedModelSerializer):
@@ -38,28 +41,39 @@ class Customers(ViewSet):
         @apiHeaderExample {String} Authorization
             Token 9ba45f09651c5b0c404f37a2d2572c026c146611
 
-        @apiSuccess (200) {Object[]} customers Array of customers
+        @apiParam {Number} limit Page size
+        @apiParam {String} cursor Opaque position from the `next` link of the previous page
+        @apiParam {String} envelope Set to `legacy` for a bare array of the page, with the
+            next page in a `Link` header
+
+        @apiSuccess (200) {String} next URL of the next page, null on the last page
+        @apiSuccess (200) {Object[]} results Page of customers
         @apiSuccessExample {json} Success
-            [
-                {
-                    "id": 1,
-                    "url": "http://localhost:8000/customers/1",
-                    "username": "johndoe",
-                    "phone_number": "555-5555",
-                    "address": "123 Main St"
-                },
-                {
-                    "id": 2,
-                    "url": "http://localhost:8000/customers/2",
-                    "username": "janedoe",
-                    "phone_number": "555-1234",
-                    "address": "456 Elm St"
-                }
-            ]
+            {
+                "next": null,
+                "results": [
+                    {
+                        "id": 1,
+                        "url": "http://localhost:8000/customers/1",
+                        "username": "johndoe",
+                        "phone_number": "555-5555",
+                        "address": "123 Main St"
+                    },
+                    {
+                        "id": 2,
+                        "url": "http://localhost:8000/customers/2",
+                        "username": "janedoe",
+                        "phone_number": "555-1234",
+                        "address": "456 Elm St"
+                    }
+                ]
+            }
         """
-        customers = Customer.objects.all()
-        serializer = CustomerSerializer(customers, many=True, context={'request': request})
-        return Response(serializer.data)
+        customers = Customer.objects.select_related('user')
+        paginator = KeysetPagination(('id',))
+        page = paginator.paginate_queryset(customers, request)
+        serializer = CustomerSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
     def update(self, request, pk=None):
         """
@@ -75,7 +89,7 @@ class Customers(ViewSet):
         @apiSuccessExample {json} Success
             HTTP/1.1 204 No Content
         """
-        customer = Customer.objects.get(user=request.auth.user)
+        customer = current_customer(request)
         customer.user.last_name = request.data["last_name"]
         customer.user.email = request.data["email"]
         customer.address = request.data["address"]
@@ -86,6 +100,7 @@ class Customers(ViewSet):
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
     @action (detail=False, methods=['get'])
+    @replica_reads
     def favorite_sellers_report(self, request):
         """Generates HTML report for a single customer's favorite stores"""
 
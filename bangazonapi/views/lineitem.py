@@ -5,7 +5,10 @@ from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
-from bangazonapi.models import OrderProduct, Order, Product, Customer
+from bangazonapi import cache, inventory
+from bangazonapi.models import OrderProduct, Order, Product
+from bangazonapi.authentication import current_customer
+from bangazonapi.retry import retry_on_lock
 
 
 class LineItemSerializer(serializers.HyperlinkedModelSerializer):
@@ -16,7 +19,7 @@ class LineItemSerializer(serializers.HyperlinkedModelSerializer):
             view_name='lineitem',
             lookup_field='id'
         )
-        fields = ('id', 'url', 'order', 'product')
+        fields = ('id', 'url', 'order', 'product', 'quantity', 'unit_price')
 
 class LineItems(ViewSet):
     """Line items for Bangazon orders"""
@@ -50,7 +53,7 @@ class LineItems(ViewSet):
         """
         try:
             # line_item = OrderProduct.objects.get(pk=pk)
-            customer = Customer.objects.get(user=request.auth.user)
+            customer = current_customer(request)
             line_item = OrderProduct.objects.get(pk=pk, order__customer=customer)
 
             serializer = LineItemSerializer(line_item, context={'request': request})
@@ -60,6 +63,7 @@ class LineItems(ViewSet):
         except OrderProduct.DoesNotExist as ex:
             return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
 
+    @retry_on_lock
     def destroy(self, request, pk=None):
         """
         @api {DELETE} /cart/:id DELETE line item from cart
@@ -75,9 +79,11 @@ class LineItems(ViewSet):
             HTTP/1.1 204 No Content
         """
         try:
-            customer = Customer.objects.get(user=request.auth.user)
+            customer = current_customer(request)
             order_product = OrderProduct.objects.get(product__id=pk, order__customer=customer)
-            order_product.delete()
+            inventory.release(order_product.order_id, order_product.product_id)
+            OrderProduct.objects.remove_units(order_product)
+            cache.bump_version_on_commit(cache.CARTS, customer.pk)
 
             return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -0,0 +1,19 @@
+"""View module for Prometheus metrics"""
+from django.http import HttpResponse
+from bangazonapi import metrics, replicas
+
+
+def prometheus_metrics(request):
+    """
+    @api {GET} /metrics GET request, database, serializer and cache metrics
+    @apiName GetMetrics
+    @apiGroup Admin
+
+    @apiSuccessExample {text} Success
+        # HELP bangazon_http_requests HTTP requests by route, method and status
+        # TYPE bangazon_http_requests counter
+        bangazon_http_requests_total{method="GET",route="product",status="200"} 42.0
+    """
+    return HttpResponse(
+        metrics.exposition(replicas.lag_gauges()), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -1,13 +1,18 @@
 """View module for handling requests about customer order"""
 
-from django.db.models import Sum, F
 from django.http import HttpResponseServerError
+from django.utils.dateparse import parse_date
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers, status
 from rest_framework.decorators import action
-from bangazonapi.models import Order, Customer, OrderProduct, Payment
-from .product import ProductSerializer
+from bangazonapi import cache, inventory
+from bangazonapi.models import Order, OrderProduct, Payment
+from bangazonapi.authentication import current_customer
+from bangazonapi.retry import retry_on_lock
+from bangazonapi.replicas import replica_reads
+from bangazonapi.pagination import KeysetPagination
+from .product import ProductSerializer, product_stats_prefetch
 from django.shortcuts import render
 
 
@@ -26,14 +31,16 @@ class OrderLineItemSerializer(serializers.HyperlinkedModelSerializer):
         url = serializers.HyperlinkedIdentityField(
             view_name="lineitem", lookup_field="id"
         )
-        fields = ("id", "product")
+        fields = ("id", "product", "quantity", "unit_price")
         depth = 1
 
 class OrderSerializer(serializers.HyperlinkedModelSerializer):
     """JSON serializer for customer orders"""
 
     lineitems = OrderLineItemSerializer(many=True)
-    total = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    total = serializers.DecimalField(
+        source="subtotal", max_digits=12, decimal_places=2, read_only=True
+    )
     payment_type = PaymentTypeSerializer(read_only=True)
 
     class Meta:
@@ -46,10 +53,26 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
             "payment_type",
             "customer",
             "lineitems",
+            "item_count",
             "total",
         )
 
 
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """JSON serializer for an order without its line items"""
+
+    total = serializers.DecimalField(
+        source="subtotal", max_digits=12, decimal_places=2, read_only=True
+    )
+    payment_merchant = serializers.CharField(
+        source="payment_type.merchant_name", read_only=True
+    )
+
+    class Meta:
+        model = Order
+        fields = ("id", "created_date", "total", "item_count", "payment_merchant")
+
+
 class Orders(ViewSet):
     """View for interacting with customer orders"""
 
@@ -69,6 +92,8 @@ class Orders(ViewSet):
         @apiSuccess (200) {String} created_date Date order was created
         @apiSuccess (200) {String} payment_type Payment URI
         @apiSuccess (200) {String} customer Customer URI
+        @apiSuccess (200) {Number} item_count Number of units in the order
+        @apiSuccess (200) {String} total Sum of the line items at the prices they were added at
 
         @apiSuccessExample {json} Success
             {
@@ -80,10 +105,10 @@ class Orders(ViewSet):
             }
         """
         try:
-            customer = Customer.objects.get(user=request.auth.user)
+            customer = current_customer(request)
             order = (
-                Order.objects.annotate(total=Sum(F("lineitems__product__price")))
-                .select_related("payment_type")
+                Order.objects.select_related("payment_type")
+                .prefetch_related(product_stats_prefetch(request, "lineitems__product"))
                 .get(pk=pk, customer=customer)
             )
             serializer = OrderSerializer(order, context={"request": request})
@@ -100,6 +125,7 @@ class Orders(ViewSet):
         except Exception as ex:
             return HttpResponseServerError(ex)
 
+    @retry_on_lock
     def update(self, request, pk=None):
         """
         @api {PUT} /order/:id PUT new payment for order
@@ -119,8 +145,14 @@ class Orders(ViewSet):
 
         @apiSuccessExample {json} Success
             HTTP/1.1 204 No Content
+        @apiErrorExample {json} Out of stock
+            HTTP/1.1 409 Conflict
+            {
+                "message": "Not enough stock.",
+                "product_ids": [4]
+            }
         """
-        customer = Customer.objects.get(user=request.auth.user)
+        customer = current_customer(request)
 
         # Retrieve the order instance
         order = Order.objects.get(pk=pk, customer=customer)
@@ -133,9 +165,21 @@ class Orders(ViewSet):
                 {"message": "Invalid payment type."}, status=status.HTTP_400_BAD_REQUEST
             )
 
+        # Paying takes the order's units out of stock, once
+        if order.payment_type_id is None:
+            try:
+                inventory.checkout(order)
+            except inventory.OutOfStock as ex:
+                return Response(
+                    {"message": "Not enough stock.", "product_ids": ex.product_ids},
+                    status=status.HTTP_409_CONFLICT,
+                )
+
         # Assign the Payment instance to the order's payment_type field
         order.payment_type = payment
         order.save()
+        # A paid order is no longer the cart
+        cache.bump_version_on_commit(cache.CARTS, customer.pk)
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -150,42 +194,95 @@ class Orders(ViewSet):
             Token 9ba45f09651c5b0c404f37a2d2572c026c146611
 
         @apiParam {id} payment_id Query param to filter by payment used
-
-        @apiSuccess (200) {Object[]} orders Array of order objects
-        @apiSuccess (200) {id} orders.id Order id
-        @apiSuccess (200) {String} orders.url Order URI
-        @apiSuccess (200) {String} orders.created_date Date order was created
-        @apiSuccess (200) {String} orders.payment_type Payment URI
-        @apiSuccess (200) {String} orders.customer Customer URI
+        @apiParam {String} [start_date] Only orders created on or after this YYYY-MM-DD date
+        @apiParam {String} [end_date] Only orders created on or before this YYYY-MM-DD date
+        @apiParam {String} [view] `summary` for id, date, total, item count and
+            payment merchant only; GET /orders/:id has the line items
+        @apiParam {Number} limit Page size
+        @apiParam {String} cursor Opaque position from the `next` link of the previous page
+        @apiParam {String} envelope Set to `legacy` for a bare array of the page, with the
+            next page in a `Link` header
+
+        @apiSuccess (200) {String} next URL of the next page, null on the last page
+        @apiSuccess (200) {Object[]} results Page of order objects, newest first
+        @apiSuccess (200) {id} results.id Order id
+        @apiSuccess (200) {String} results.url Order URI
+        @apiSuccess (200) {String} results.created_date Date order was created
+        @apiSuccess (200) {String} results.payment_type Payment URI
+        @apiSuccess (200) {String} results.customer Customer URI
+        @apiSuccess (200) {Number} results.item_count Number of units in the order
+        @apiSuccess (200) {String} results.total Sum of the line items at the prices they were added at
 
         @apiSuccessExample {json} Success
-            [
-                {
-                    "id": 1,
-                    "url": "http://localhost:8000/orders/1",
-                    "created_date": "2019-08-16",
-                    "payment_type": "http://localhost:8000/paymenttypes/1",
-                    "customer": "http://localhost:8000/customers/5"
-                }
-            ]
+            {
+                "next": "http://localhost:8000/orders?cursor=WyIyMDE5LTA4LTE2IiwgMV0%3D",
+                "results": [
+                    {
+                        "id": 1,
+                        "url": "http://localhost:8000/orders/1",
+                        "created_date": "2019-08-16",
+                        "payment_type": "http://localhost:8000/paymenttypes/1",
+                        "customer": "http://localhost:8000/customers/5"
+                    }
+                ]
+            }
+        @apiSuccessExample {json} Summary
+            {
+                "next": null,
+                "results": [
+                    {
+                        "id": 1,
+                        "created_date": "2019-08-16",
+                        "total": "29.98",
+                        "item_count": 2,
+                        "payment_merchant": "American Express"
+                    }
+                ]
+            }
         """
-        customer = Customer.objects.get(user=request.auth.user)
-        orders = (
-            Order.objects.filter(customer=customer, payment_type__isnull=False)
-            .annotate(total=Sum(F("lineitems__product__price")))
-            .select_related("payment_type")
-            .order_by("-created_date")
-        )
+        customer = current_customer(request)
+        orders = Order.objects.filter(customer=customer, payment_type__isnull=False)
 
         payment = self.request.query_params.get("payment_id", None)
         if payment is not None:
-            orders = orders.filter(payment__id=payment)
+            orders = orders.filter(payment_type_id=payment)
+
+        # Range of the (customer, created_date, id) index the pages seek through
+        for param, lookup in (("start_date", "gte"), ("end_date", "lte")):
+            value = request.query_params.get(param, None)
+            if value is None:
+                continue
+            try:
+                date = parse_date(value)
+            except ValueError:
+                date = None
+            if date is None:
+                return Response(
+                    {"message": f"{param} must be a YYYY-MM-DD date."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            orders = orders.filter(**{f"created_date__{lookup}": date})
+
+        if request.query_params.get("view", None) == "summary":
+            # One query: order columns and the merchant, no line items
+            orders = orders.select_related("payment_type").only(
+                "id", "created_date", "subtotal", "item_count", "payment_type__merchant_name"
+            )
+            serializer_class = OrderSummarySerializer
+        else:
+            orders = orders.select_related("payment_type").prefetch_related(
+                product_stats_prefetch(request, "lineitems__product")
+            )
+            serializer_class = OrderSerializer
 
-        json_orders = OrderSerializer(orders, many=True, context={"request": request})
+        paginator = KeysetPagination(("-created_date", "-id"))
+        page = paginator.paginate_queryset(orders, request)
+        json_orders = serializer_class(page, many=True, context={"request": request})
 
-        return Response(json_orders.data)
+        return paginator.get_paginated_response(json_orders.data)
 
     @action(detail=False, methods=["get"], url_path="reports/orders")
+    @replica_reads
     def reports(self, request):
         """
         Generates an HTML report based on the 'status' query parameter.
@@ -202,15 +299,15 @@ class Orders(ViewSet):
         is_paid = status == "complete"
 
         # Retrieve orders based on payment_type
-        orders = Order.objects.filter(payment_type__isnull=not is_paid).annotate(
-            total_cost=Sum(F("lineitems__product__price"))
+        orders = Order.objects.filter(payment_type__isnull=not is_paid).select_related(
+            "customer__user", "payment_type"
         )
 
         order_data = [
             {
                 "order_id": order.id,
                 "customer_name": f"{order.customer.user.first_name} {order.customer.user.last_name}",
-                "total_cost": order.total_cost,
+                "total_cost": order.subtotal,
                 "payment_type": order.payment_type.merchant_name if is_paid else None,
             }
             for order in orders
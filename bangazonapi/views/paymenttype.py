@@ -6,6 +6,7 @@ from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
 from bangazonapi.models import Payment, Customer
+from bangazonapi.authentication import current_customer
 
 
 class PaymentSerializer(serializers.HyperlinkedModelSerializer):
@@ -47,7 +48,7 @@ class Payments(ViewSet):
         new_payment.account_number = request.data["account_number"]
         new_payment.expiration_date = request.data["expiration_date"]
         
-        customer = Customer.objects.get(user=request.auth.user)
+        customer = current_customer(request)
         new_payment.customer = customer
         new_payment.save()
 
@@ -90,7 +91,7 @@ class Payments(ViewSet):
 
     def list(self, request):
         """Handle GET requests to payment type resource"""
-        customer = Customer.objects.get(user=request.auth.user)
+        customer = current_customer(request)
         payment_types = Payment.objects.filter(customer=customer)
         
         serializer = PaymentSerializer(
@@ -1,14 +1,19 @@
 """View module for handling requests about products"""
 
 from rest_framework.decorators import action
-import base64
-from django.core.files.base import ContentFile
-from django.http import HttpResponseServerError
+from itertools import groupby
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Prefetch, Q, Window
+from django.db.models.functions import RowNumber
+from django.http import HttpResponseServerError, StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers, status
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from bangazonapi import cache, conditional, export, images, search
+from bangazonapi.pagination import KeysetPagination
 from bangazonapi.models import (
     Product,
     Customer,
@@ -17,6 +22,9 @@ from bangazonapi.models import (
     Recommendation,
     Like,
 )
+from bangazonapi.authentication import current_customer
+from bangazonapi.retry import retry_on_lock
+from bangazonapi.replicas import ReplicaReadsMixin, replica_reads
 
 
 class RatingSerializer(serializers.ModelSerializer):
@@ -26,11 +34,146 @@ class RatingSerializer(serializers.ModelSerializer):
         read_only_fields = ("customer",)
 
 
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+STAT_ORDERINGS = {
+    "number_sold": "num_sold",
+    "average_rating": "avg_rating",
+    "rating_count": "num_ratings",
+    "number_of_likes": "num_likes",
+}
+
+# Columns with values a cursor can hold; others are rejected with a 400
+SORTABLE_FIELDS = (
+    "id",
+    "name",
+    "price",
+    "quantity",
+    "created_date",
+    "location",
+    "category",
+) + tuple(STAT_ORDERINGS)
+
+
+LIST_PARAMS = (
+    "q",
+    "category",
+    "min_price",
+    "name",
+    "location",
+    "quantity",
+    "number_sold",
+    "order_by",
+    "direction",
+    "cursor",
+    "limit",
+    "envelope",
+)
+
+
+def filter_products(request):
+    """Products matching the list filters of the request, with their ordering
+
+    Shared by the list and export views so both see the same rows.
+
+    Raises:
+        serializers.ValidationError -- When order_by isn't one of SORTABLE_FIELDS
+
+    Returns:
+        tuple -- (queryset, ordering, row limit or None, whether ranked by search)
+    """
+    products = Product.objects.with_stats(request.user)
+
+    category = request.query_params.get("category", None)
+    min_price = request.query_params.get("min_price", None)
+    name = request.query_params.get("name", None)
+    location = request.query_params.get("location", None)
+    quantity = request.query_params.get("quantity", None)
+    number_sold = request.query_params.get("number_sold", None)
+    order = request.query_params.get("order_by", None)
+    direction = request.query_params.get("direction", None)
+    query = request.query_params.get("q", None)
+
+    ranked_search = query is not None and search.is_available()
+    if ranked_search:
+        products = search.annotate_matches(products, query)
+    elif query is not None:
+        products = products.filter(
+            Q(name__icontains=query)
+            | Q(description__icontains=query)
+            | Q(location__icontains=query)
+        )
+
+    if category is not None:
+        products = products.filter(category__id=category)
+
+    if min_price is not None:
+        products = products.filter(price__gte=float(min_price))
+
+    if name is not None:
+        products = products.filter(name__contains=name)
+
+    if location is not None:
+        products = products.filter(location__contains=location)
+
+    if number_sold is not None:
+        products = products.filter(num_sold__gte=int(number_sold))
+
+    # Every ordering ends in id so the keyset cursor is unique
+    limit = None
+    if order is not None:
+        if order not in SORTABLE_FIELDS:
+            raise serializers.ValidationError(
+                {"order_by": [f"Products can be ordered by {', '.join(SORTABLE_FIELDS)}."]}
+            )
+        # Popularity sorts use the statistics joined by with_stats()
+        order_filter = STAT_ORDERINGS.get(order, order)
+        if direction is not None and direction == "desc":
+            ordering = (f"-{order_filter}", "-id")
+        else:
+            ordering = (order_filter, "id")
+    elif quantity is not None:
+        # The newest `quantity` products
+        ordering = ("-created_date", "-id")
+        limit = int(quantity)
+    elif ranked_search:
+        # Best BM25 match first
+        ordering = ("search_rank", "id")
+    else:
+        ordering = ("id",)
+
+    return products, ordering, limit, ranked_search
+
+
+def product_stats_prefetch(request, lookup="product"):
+    """Prefetch for nested product payloads with their statistics annotated
+
+    Line items keep pointing at soft-deleted products, so the prefetch uses
+    the manager that still sees them.
+    """
+    return Prefetch(
+        lookup, queryset=Product.all_objects.with_stats(request.user)
+    )
+
+
 class ProductSerializer(serializers.ModelSerializer):
-    """JSON serializer for products"""
+    """JSON serializer for products
+
+    Reads the annotations added by `Product.objects.with_stats()` when the
+    product was loaded with them, and falls back to the model properties.
+    """
 
-    average_rating = serializers.ReadOnlyField()
+    number_sold = serializers.SerializerMethodField()
+    average_rating = serializers.SerializerMethodField()
+    rating_count = serializers.SerializerMethodField()
+    number_of_likes = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
@@ -44,6 +187,7 @@ class ProductSerializer(serializers.ModelSerializer):
             "created_date",
             "location",
             "image_path",
+            "image_variants",
             "average_rating",
             "can_be_rated",
             "rating_count",
@@ -52,15 +196,77 @@ class ProductSerializer(serializers.ModelSerializer):
         )
         depth = 1
 
+    def get_number_sold(self, obj):
+        return obj.num_sold if hasattr(obj, "num_sold") else obj.number_sold
+
+    def get_average_rating(self, obj):
+        return obj.avg_rating if hasattr(obj, "avg_rating") else obj.average_rating
+
+    def get_rating_count(self, obj):
+        return obj.num_ratings if hasattr(obj, "num_ratings") else obj.rating_count
+
+    def get_number_of_likes(self, obj):
+        return obj.num_likes if hasattr(obj, "num_likes") else obj.number_of_likes
+
+    def get_image_variants(self, obj):
+        """URLs of the resized copies of the image, keyed by variant name"""
+        request = self.context.get("request")
+        variants = {}
+        for variant, name in images.variant_names(obj.image_path.name).items():
+            url = default_storage.url(name)
+            variants[variant] = request.build_absolute_uri(url) if request else url
+        return variants
+
     def get_is_liked(self, obj):
         """Check if the current user has liked the product"""
+        if hasattr(obj, "liked_by_user"):
+            return obj.liked_by_user
+
         request = self.context.get("request")
         if request and request.user.is_authenticated:
             return obj.likes.filter(customer__user=request.user).exists()
         return False
 
 
-class Products(ViewSet):
+class BulkProductItemSerializer(serializers.ModelSerializer):
+    """Validates one product of a bulk create"""
+
+    category_id = serializers.IntegerField()
+
+    class Meta:
+        model = Product
+        fields = (
+            "name",
+            "price",
+            "description",
+            "quantity",
+            "location",
+            "category_id",
+        )
+
+    def to_internal_value(self, data):
+        # Ids are assigned by the database; a client's would collide or be arbitrary
+        if isinstance(data, dict) and "id" in data:
+            raise serializers.ValidationError({"id": ["New products can't have an id."]})
+        return super().to_internal_value(data)
+
+
+class BulkProductUpdateSerializer(BulkProductItemSerializer):
+    """Validates one product of a bulk update, which names it by id"""
+
+    id = serializers.IntegerField()
+
+    class Meta(BulkProductItemSerializer.Meta):
+        fields = ("id",) + BulkProductItemSerializer.Meta.fields
+
+    def to_internal_value(self, data):
+        # Partial validation skips required fields, id included
+        if isinstance(data, dict) and "id" not in data:
+            raise serializers.ValidationError({"id": ["This field is required."]})
+        return serializers.ModelSerializer.to_internal_value(self, data)
+
+
+class Products(ReplicaReadsMixin, ViewSet):
     """Request handlers for Products in the Bangazon Platform"""
 
     permission_classes = (IsAuthenticatedOrReadOnly,)
@@ -80,6 +286,7 @@ class Products(ViewSet):
         @apiParam {String} description Long form description of product
         @apiParam {Number} quantity Number of items to sell
         @apiParam {String} location City where product is located
+        @apiParam {String} image_path Optional base64 data URI of the product image
         @apiParam {Number} category_id Category of product
         @apiParamExample {json} Input
             {
@@ -100,6 +307,7 @@ class Products(ViewSet):
         @apiSuccess (200) {Date} product.created_date City where product is located
         @apiSuccess (200) {String} product.location City where product is located
         @apiSuccess (200) {String} product.image_path Path to product image
+        @apiSuccess (200) {Object} product.image_variants URLs of resized copies of the image, by variant name
         @apiSuccess (200) {Number} product.average_rating Average customer rating of product
         @apiSuccess (200) {Number} product.number_sold How many items have been purchased
         @apiSuccess (200) {Object} product.category Category of product
@@ -145,21 +353,18 @@ class Products(ViewSet):
         new_product.quantity = request.data["quantity"]
         new_product.location = request.data["location"]
 
-        customer = Customer.objects.get(user=request.auth.user)
+        customer = current_customer(request)
         new_product.customer = customer
 
         product_category = ProductCategory.objects.get(pk=request.data["category_id"])
         new_product.category = product_category
 
         if "image_path" in request.data:
-            format, imgstr = request.data["image_path"].split(";base64,")
-            ext = format.split("/")[-1]
-            data = ContentFile(
-                base64.b64decode(imgstr),
-                name=f'{new_product.id}-{request.data["name"]}.{ext}',
-            )
-
-            new_product.image_path = data
+            # Stored under the hash of its contents, with thumbnails made in the background
+            try:
+                new_product.image_path = images.ingest_data_uri(request.data["image_path"])
+            except ValueError as ex:
+                return Response({"message": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
 
         new_product.save()
 
@@ -183,6 +388,7 @@ class Products(ViewSet):
         @apiSuccess (200) {Date} product.created_date City where product is located
         @apiSuccess (200) {String} product.location City where product is located
         @apiSuccess (200) {String} product.image_path Path to product image
+        @apiSuccess (200) {Object} product.image_variants URLs of resized copies of the image, by variant name
         @apiSuccess (200) {Number} product.average_rating Average customer rating of product
         @apiSuccess (200) {Number} product.number_sold How many items have been purchased
         @apiSuccess (200) {Object} product.category Category of product
@@ -206,9 +412,25 @@ class Products(ViewSet):
             }
         """
         try:
-            product = Product.objects.get(pk=pk)
+            # Validators come from the updated-at columns alone, so a client
+            # with a current copy gets a 304 before anything is serialized
+            product_modified, stats_modified = (
+                Product.objects.filter(pk=pk)
+                .values_list("updated_at", "stats__updated_at")
+                .get()
+            )
+            etag, last_modified = conditional.validators(
+                request, product_modified, stats_modified
+            )
+            response = conditional.not_modified(request, etag, last_modified)
+            if response is not None:
+                return response
+
+            product = Product.objects.with_stats(request.user).get(pk=pk)
             serializer = ProductSerializer(product, context={"request": request})
-            return Response(serializer.data)
+            return conditional.add_validators(
+                Response(serializer.data), etag, last_modified
+            )
         except Exception as ex:
             return HttpResponseServerError(ex)
 
@@ -234,12 +456,25 @@ class Products(ViewSet):
         product.created_date = request.data["created_date"]
         product.location = request.data["location"]
 
-        customer = Customer.objects.get(user=request.auth.user)
+        customer = current_customer(request)
         product.customer = customer
 
         product_category = ProductCategory.objects.get(pk=request.data["category_id"])
         product.category = product_category
-        product.save()
+        # Stock isn't written by plain saves; the seller sets it here
+        product.save(
+            update_fields=[
+                "name",
+                "price",
+                "description",
+                "quantity",
+                "created_date",
+                "location",
+                "customer",
+                "category",
+                "updated_at",
+            ]
+        )
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -277,95 +512,223 @@ class Products(ViewSet):
         @apiName ListProducts
         @apiGroup Product
 
-        @apiSuccess (200) {Object[]} products Array of products, grouped by category if no filters.
+        @apiParam {String} q Full-text search of name, description and location, best match first
+        @apiParam {Number} limit Page size of filtered results
+        @apiParam {Number} quantity Only the newest `quantity` products, without a next page
+        @apiParam {String} order_by One of id, name, price, quantity, created_date,
+            location, category, number_sold, average_rating, rating_count or
+            number_of_likes; anything else is a 400
+        @apiParam {String} direction `desc` to reverse order_by
+        @apiParam {String} cursor Opaque position from the `next` link of the previous page
+        @apiParam {String} envelope Set to `legacy` for the `header`/`products` response
+        @apiSuccess (200) {Object[]} results Page of products, or products grouped by category if no filters.
+        @apiSuccess (200) {String} next URL of the next page, null on the last page
+        @apiSuccess (200) {String} results.snippet HTML-escaped match context when searching with q, matches in `<mark>`
         """
-        # Check if filters are applied
-        filters_applied = any(
-            param in request.query_params
-            for param in [
-                "category",
-                "min_price",
-                "name",
-                "location",
-                "quantity",
-                "number_sold",
-                "order_by",
-                "direction",
-            ]
-        )
-
-        if filters_applied:
+        if any(param in request.query_params for param in LIST_PARAMS):
             # Handle filtered products, no grouping by category
-            products = Product.objects.all()
+            products, ordering, page_size, ranked_search = filter_products(request)
+
+            paginator = KeysetPagination(ordering, page_size=page_size)
+            page = paginator.paginate_queryset(products, request)
+            if page_size is not None:
+                # `quantity` asks for the newest products only, not a first page
+                paginator.next_position = None
+            results = ProductSerializer(
+                page, many=True, context={"request": request}
+            ).data
+
+            if ranked_search:
+                for product, product_data in zip(page, results):
+                    product_data["snippet"] = search.highlight(product.search_snippet)
+
+            if request.query_params.get("envelope") == "legacy":
+                header = "Products matching search" if ranked_search else "Products matching filters"
+                return Response(
+                    {
+                        "header": header,
+                        "products": results,
+                        "next": paginator.get_next_link(),
+                    }
+                )
 
-            category = request.query_params.get("category", None)
-            min_price = request.query_params.get("min_price", None)
-            name = request.query_params.get("name", None)
-            location = request.query_params.get("location", None)
-            quantity = request.query_params.get("quantity", None)
-            number_sold = request.query_params.get("number_sold", None)
-            order = request.query_params.get("order_by", None)
-            direction = request.query_params.get("direction", None)
+            return paginator.get_paginated_response(results)
 
-            if category is not None:
-                products = products.filter(category__id=category)
+        else:
+            # No filters applied, group products by category and return 5 most recent products per category.
+            # Anonymous visitors all get the same page, so theirs comes from the cache.
+            if request.user.is_authenticated:
+                return Response(category_landing(request))
 
-            if min_price is not None:
-                products = products.filter(price__gte=float(min_price))
+            return Response(
+                cache.cached(
+                    cache.CATALOG,
+                    f"landing:{request.build_absolute_uri('/')}",
+                    lambda: category_landing(request),
+                )
+            )
 
-            if name is not None:
-                products = products.filter(name__contains=name)
+    @action(
+        methods=["get"],
+        detail=False,
+        url_path="export",
+        renderer_classes=[export.NDJSONRenderer, export.CSVRenderer],
+    )
+    def export(self, request):
+        """
+        @api {GET} /products/export Stream the whole catalog
+        @apiName ExportProducts
+        @apiGroup Product
 
-            if location is not None:
-                products = products.filter(location__contains=location)
+        @apiParam {String} format `ndjson` (default) or `csv`
+        @apiParam {String} q Same filters and ordering as GET /products, without paging
+        @apiSuccessExample {json} Success
+            HTTP/1.1 200 OK
+            {"id": 1, "name": "Kite", "price": 14.99, ...}
+            {"id": 2, "name": "Box kite", "price": 24.99, ...}
+        """
+        products, ordering, limit, _ = filter_products(request)
+        products = products.order_by(*ordering)
+        if limit is not None:
+            products = products[:limit]
+
+        context = {"request": request}
+        serialized = (
+            ProductSerializer(chunk, many=True, context=context).data
+            for chunk in export.chunks(products)
+        )
 
-            if quantity is not None:
-                products = products.order_by("-created_date")[: int(quantity)]
+        if request.accepted_renderer.format == "csv":
+            columns = [
+                field for field in ProductSerializer.Meta.fields if field != "image_variants"
+            ]
+            response = StreamingHttpResponse(
+                export.csv_lines(serialized, columns), content_type="text/csv"
+            )
+            response["Content-Disposition"] = 'attachment; filename="products.csv"'
+            return response
 
-            if number_sold is not None:
-                products = products.filter(number_sold__gte=int(number_sold))
+        return StreamingHttpResponse(
+            export.ndjson_lines(serialized), content_type="application/x-ndjson"
+        )
 
-            if order is not None:
-                order_filter = order
-                if direction is not None and direction == "desc":
-                    order_filter = f"-{order}"
-                products = products.order_by(order_filter)
+    @action(methods=["post", "patch"], detail=False, url_path="bulk")
+    def bulk(self, request):
+        """
+        @api {POST} /products/bulk POST or PATCH many products at once
+        @apiName BulkProducts
+        @apiGroup Product
 
-            serializer = ProductSerializer(
-                products, many=True, context={"request": request}
-            )
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+
+        @apiParam {Object[]} body Array of products shaped like POST /products.
+            POST items can't have an `id`. PATCH items need one and only
+            change the fields they include.
+        @apiParamExample {json} Input
+            [
+                {
+                    "name": "Kite",
+                    "price": 14.99,
+                    "description": "It flies high",
+                    "quantity": 60,
+                    "location": "Pittsburgh",
+                    "category_id": 4
+                }
+            ]
+
+        @apiSuccessExample {json} Success
+            HTTP/1.1 201 Created
+            {
+                "created": 1,
+                "ids": [101]
+            }
+        @apiErrorExample {json} Invalid items
+            HTTP/1.1 400 Bad Request
+            {
+                "errors": [
+                    {"index": 3, "errors": {"category_id": ["Category 99 does not exist."]}}
+                ]
+            }
+        """
+        partial = request.method == "PATCH"
+        items = request.data
+        if not isinstance(items, list):
             return Response(
-                {"header": "Products matching filters", "products": serializer.data}
+                {"message": "Expected a list of products."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
-        else:
-            # No filters applied, group products by category and return 5 most recent products per category
-            categories = ProductCategory.objects.all()
-            grouped_products = []
-
-            for category in categories:
-                # Get the 5 most recent products per category
-                recent_products = Product.objects.filter(category=category).order_by(
-                    "-created_date"
-                )[:5]
-                if recent_products:
-                    grouped_products.append(
-                        {
-                            "category": category.name,
-                            "products": ProductSerializer(
-                                recent_products, many=True, context={"request": request}
-                            ).data,
-                        }
-                    )
+        serializer_class = BulkProductUpdateSerializer if partial else BulkProductItemSerializer
+        serializer = serializer_class(data=items, many=True, partial=partial)
+        serializer.is_valid()
+        # {index: errors} or, with the older list format, one entry per item
+        errors_by_index = serializer.errors
+        if isinstance(errors_by_index, list):
+            errors_by_index = dict(enumerate(errors_by_index))
+        item_errors = [dict(errors_by_index.get(index) or {}) for index in range(len(items))]
+
+        customer = current_customer(request)
+        rows = [item if isinstance(item, dict) else {} for item in items]
+
+        # Every referenced category and product in one IN query each
+        categories = ProductCategory.objects.in_bulk(
+            {_as_int(row.get("category_id")) for row in rows} - {None}
+        )
+        existing = {}
+        if partial:
+            existing = Product.objects.filter(customer=customer).in_bulk(
+                {_as_int(row.get("id")) for row in rows} - {None}
+            )
 
-            return Response(grouped_products)
+        for row, errors in zip(rows, item_errors):
+            if "category_id" in row and _as_int(row["category_id"]) not in categories:
+                errors.setdefault("category_id", []).append(
+                    f"Category {row['category_id']} does not exist."
+                )
+            if partial and "id" in row and _as_int(row["id"]) not in existing:
+                errors.setdefault("id", []).append(
+                    "Product does not exist or belongs to another seller."
+                )
+
+        errors = [
+            {"index": index, "errors": errors}
+            for index, errors in enumerate(item_errors)
+            if errors
+        ]
+        if errors:
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            if partial:
+                products = []
+                fields = set()
+                for values in serializer.validated_data:
+                    product = existing[values.pop("id")]
+                    for field, value in values.items():
+                        setattr(product, field, value)
+                    fields.update(values)
+                    products.append(product)
+                Product.objects.bulk_update_products(products, sorted(fields))
+            else:
+                products = [
+                    Product(customer=customer, **values)
+                    for values in serializer.validated_data
+                ]
+                products = Product.objects.bulk_create_products(products)
+
+        ids = [product.pk for product in products]
+        if partial:
+            return Response({"updated": len(ids), "ids": ids})
+        return Response({"created": len(ids), "ids": ids}, status=status.HTTP_201_CREATED)
 
     @action(methods=["post"], detail=True, url_path="recommend")
     def recommend(self, request, pk=None):
         """Recommend products to other users"""
         if request.method == "POST":
             rec = Recommendation()
-            rec.recommender = Customer.objects.get(user=request.auth.user)
+            rec.recommender = current_customer(request)
 
             # Extract the 'customer' field from request.data
             user_id = request.data.get("customer")
@@ -389,6 +752,7 @@ class Products(ViewSet):
         return Response(None, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
     @action(methods=["post"], detail=True, url_path="rate-product")
+    @retry_on_lock
     def rate_product(self, request, pk=None):
         """Add a rating to a product"""
         try:
@@ -396,7 +760,7 @@ class Products(ViewSet):
 
             # Create the rating
             rating = Rating.objects.create(
-                customer=request.auth.user.customer,
+                customer=current_customer(request),
                 score=request.data["score"],
                 rating_text=request.data.get("rating_text", None),
             )
@@ -424,10 +788,12 @@ class Products(ViewSet):
         """
         try:
             # Get the customer (user) from the request
-            customer = Customer.objects.get(user=request.auth.user)
+            customer = current_customer(request)
 
             # Get the products liked by the authenticated user
-            liked_products = Product.objects.filter(likes__customer=customer)
+            liked_products = Product.objects.with_stats(request.user).filter(
+                likes__customer=customer
+            )
 
             # Serialize the liked products
             serializer = ProductSerializer(
@@ -453,7 +819,7 @@ class Products(ViewSet):
         """
 
         # Get only soft-deleted products
-        deleted_products = Product.objects.deleted_only()
+        deleted_products = Product.objects.deleted_only().with_stats(request.user)
 
         serializer = ProductSerializer(
             deleted_products, many=True, context={"request": request}
@@ -465,7 +831,7 @@ class Products(ViewSet):
         if request.method == "POST":
             try:
                 product = Product.objects.get(pk=pk)
-                customer = Customer.objects.get(user=request.auth.user)
+                customer = current_customer(request)
 
                 # Check if the customer has already liked this product
                 if Like.objects.filter(product=product, customer=customer).exists():
@@ -490,7 +856,7 @@ class Products(ViewSet):
         elif request.method == "DELETE":
             try:
                 product = Product.objects.get(pk=pk)
-                customer = Customer.objects.get(user=request.auth.user)
+                customer = current_customer(request)
 
                 # Check if the like exists
                 like = Like.objects.filter(product=product, customer=customer).first()
@@ -513,7 +879,49 @@ class Products(ViewSet):
                 )
 
 
+def category_landing(request):
+    """The 5 most recent products of every category, grouped by category
+
+    Returns:
+        list -- [{"category": name, "products": [...]}] in category order
+    """
+    # A single window query ranks products within their category, and the
+    # category names are joined into the same pass.
+    recent_products = (
+        Product.objects.with_stats(request.user)
+        .select_related("category")
+        .annotate(
+            category_rank=Window(
+                RowNumber(),
+                partition_by=F("category_id"),
+                order_by=(F("created_date").desc(), F("id").desc()),
+            )
+        )
+        .filter(category_rank__lte=5)
+        .order_by("category_id", "category_rank")
+    )
+
+    recent_products = list(recent_products)
+    serialized = ProductSerializer(
+        recent_products, many=True, context={"request": request}
+    ).data
+
+    grouped_products = []
+    rows = zip(recent_products, serialized)
+    for _, group in groupby(rows, key=lambda row: row[0].category_id):
+        group = list(group)
+        grouped_products.append(
+            {
+                "category": group[0][0].category.name,
+                "products": [product_data for _, product_data in group],
+            }
+        )
+
+    return grouped_products
+
+
 # Product Reports
+@replica_reads
 def expensive_products_report(request):
     products = Product.objects.filter(price__gte=1000).order_by("-price")
 
@@ -526,6 +934,7 @@ def expensive_products_report(request):
     return render(request, "reports/price_report.html", context)
 
 
+@replica_reads
 def inexpensive_products_report(request):
     products = Product.objects.filter(price__lt=1000).order_by("-price")
 
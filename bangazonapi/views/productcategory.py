@@ -5,12 +5,15 @@
 """
 
 """View module for handling requests about product categories"""
+from django.db.models import Count, Max
 from django.http import HttpResponseServerError
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
+from bangazonapi import cache, conditional
 from bangazonapi.models import ProductCategory
+from bangazonapi.replicas import ReplicaReadsMixin
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 
 
@@ -25,7 +28,7 @@ class ProductCategorySerializer(serializers.HyperlinkedModelSerializer):
         fields = ('id', 'url', 'name')
 
 
-class ProductCategories(ViewSet):
+class ProductCategories(ReplicaReadsMixin, ViewSet):
     """Categories for products"""
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
@@ -53,14 +56,36 @@ class ProductCategories(ViewSet):
             return HttpResponseServerError(ex)
 
     def list(self, request):
-        """Handle GET requests to ProductCategory resource"""
-        product_category = ProductCategory.objects.all()
+        """Handle GET requests to ProductCategory resource
 
-        # Support filtering ProductCategorys by area id
-        # name = self.request.query_params.get('name', None)
-        # if name is not None:
-        #     ProductCategories = ProductCategories.filter(name=name)
+        Every visitor gets the same list, so it is served from the response
+        cache until a category changes. The validators and cache key come
+        from the table itself rather than the per-process version counter,
+        so every worker agrees on them; the count covers deletions.
+        """
+        def build():
+            product_category = ProductCategory.objects.all()
+
+            # Support filtering ProductCategorys by area id
+            # name = self.request.query_params.get('name', None)
+            # if name is not None:
+            #     ProductCategories = ProductCategories.filter(name=name)
+
+            serializer = ProductCategorySerializer(
+                product_category, many=True, context={'request': request})
+            return serializer.data
 
-        serializer = ProductCategorySerializer(
-            product_category, many=True, context={'request': request})
-        return Response(serializer.data)
+        versions = ProductCategory.objects.aggregate(
+            count=Count("id"), modified=Max("updated_at"))
+        etag, last_modified = conditional.validators(
+            request, versions["count"], versions["modified"])
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        variant = (
+            f"list:{request.build_absolute_uri('/')}:{versions['count']}:"
+            f"{versions['modified'].isoformat() if versions['modified'] else ''}"
+        )
+        data = cache.cached(cache.CATEGORIES, variant, build)
+        return conditional.add_validators(Response(data), etag, last_modified)
@@ -1,5 +1,6 @@
 """View module for handling requests about customer profiles"""
 
+from django.db.models import Prefetch, prefetch_related_objects
 from django.http import HttpResponseServerError
 from django.contrib.auth.models import User
 from rest_framework import serializers
@@ -16,7 +17,8 @@ from bangazonapi.models import (
     Like,
     Store
 )
-from .store import StoreSerializer
+from bangazonapi.authentication import current_customer
+from .store import StoreSerializer, store_products_prefetch
 
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
@@ -238,22 +240,32 @@ class Profile(ViewSet):
             }
         """
         try:
-            current_user = Customer.objects.get(user=request.auth.user)
+            current_user = current_customer(request)
             # Recommendations made by the user
             current_user.recommends = Recommendation.objects.filter(
                 recommender=current_user
-            )
+            ).select_related("customer__user", "product")
             # Recommendations made to the user
             current_user.received_recommendations = Recommendation.objects.filter(
                 customer=current_user
+            ).select_related("recommender__user", "product")
+
+            current_user.favorites = (
+                Favorite.objects.filter(customer=current_user)
+                .select_related("store__customer__user")
+                .prefetch_related(
+                    store_products_prefetch(request, "store__storeproduct_set")
+                )
+            )
+            prefetch_related_objects(
+                [current_user],
+                Prefetch("like_set", queryset=Like.objects.select_related("product")),
             )
 
-            current_user.favorites = Favorite.objects.filter(customer=current_user)
-
-            try:
-                current_user.store = Store.objects.get(customer=current_user)
-            except Store.DoesNotExist:
-                current_user.store = None
+            # The store, if any, was joined by current_customer
+            store = getattr(current_user, "store", None)
+            if store is not None:
+                prefetch_related_objects([store], store_products_prefetch(request))
 
             serializer = ProfileSerializer(
                 current_user, many=False, context={"request": request}
@@ -312,7 +324,7 @@ class Profile(ViewSet):
             ]
         """
         if request.method == "GET":
-            customer = Customer.objects.get(user=request.auth.user)
+            customer = current_customer(request)
             favorites = Favorite.objects.filter(customer=customer)
 
             serializer = FavoriteSerializer(
@@ -322,7 +334,7 @@ class Profile(ViewSet):
         
         elif request.method == "POST":
             try:
-                customer = Customer.objects.get(user=request.auth.user)
+                customer = current_customer(request)
                 store = Store.objects.get(pk=request.data["store_id"])
 
                 # Check if the customer has already liked this product
@@ -339,7 +351,7 @@ class Profile(ViewSet):
         
         elif request.method == 'DELETE':
             try:
-                customer = Customer.objects.get(user=request.auth.user)
+                customer = current_customer(request)
                 store = Store.objects.get(pk=request.data["store_id"])
 
                 favorite = Favorite.objects.filter(customer=customer, store=store).first()
@@ -1,10 +1,15 @@
 from rest_framework import serializers, viewsets
 from django.contrib.auth.models import User
-from bangazonapi.models import Store, Customer, Favorite, StoreProduct, OrderProduct
+from bangazonapi.models import Store, Customer, Favorite, StoreProduct
+from bangazonapi.authentication import current_customer
+from bangazonapi.replicas import ReplicaReadsMixin
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from django.http import HttpResponseServerError
-from .product import ProductSerializer
+from django.db.models import Max, Prefetch
+from bangazonapi import conditional
+from bangazonapi.pagination import KeysetPagination
+from .product import ProductSerializer, product_stats_prefetch
 
 
 class StoreOwnerSerializer(serializers.ModelSerializer):
@@ -25,28 +30,18 @@ class StoreSerializer(serializers.ModelSerializer):
     products_sold = serializers.SerializerMethodField()
 
     def get_products(self, obj):
-        # Get all StoreProduct objects for this store
-        store_products = StoreProduct.objects.filter(store=obj)
-        # Extract the actual Product objects
-        products = [sp.product for sp in store_products]
+        products = [sp.product for sp in obj.storeproduct_set.all()]
         return ProductSerializer(
             products, many=True, context={"request": self.context.get("request")}
         ).data
-    
+
     def get_products_sold(self, obj):
-        # Get all StoreProduct objects for this store
-        store_products = StoreProduct.objects.filter(store=obj)
-        
-        # Get all products from this store that have been sold
-        # (orders with non-null payment_type)
-        sold_products = OrderProduct.objects.filter(
-            product__in=[sp.product for sp in store_products],
-            order__payment_type__isnull=False  # Check for non-null payment_type
-        ).values_list('product', flat=True).distinct()
-        
-        # Get the actual Product objects
-        products = [sp.product for sp in store_products if sp.product.id in sold_products]
-        
+        # Products on at least one paid order, from their statistics
+        products = [
+            sp.product
+            for sp in obj.storeproduct_set.all()
+            if (sp.product.num_sold if hasattr(sp.product, "num_sold") else sp.product.number_sold) > 0
+        ]
         return ProductSerializer(
             products, many=True, context={"request": self.context.get("request")}
         ).data
@@ -58,13 +53,35 @@ class StoreSerializer(serializers.ModelSerializer):
     
     def get_is_favorite(self, obj):
         """Check if the current user has favorited the store"""
-        user = self.context['request'].user
+        # Looked up once per request and shared by every store in a list
+        favorites = self.context.get("favorite_store_ids")
+        if favorites is None:
+            try:
+                customer = current_customer(self.context["request"])
+                favorites = set(
+                    Favorite.objects.filter(customer=customer).values_list("store_id", flat=True)
+                )
+            except Customer.DoesNotExist:
+                favorites = set()
+            self.context["favorite_store_ids"] = favorites
+        return obj.id in favorites
+
+
+def store_products_prefetch(request, lookup="storeproduct_set"):
+    """Prefetch for the products of stores, with their statistics annotated
 
-        customer = Customer.objects.get(user=user)
-        return Favorite.objects.filter(customer=customer, store=obj).exists()
+    StoreSerializer reads both lists from it, so a page of stores costs two
+    queries for its products instead of several per store.
+    """
+    return Prefetch(
+        lookup,
+        queryset=StoreProduct.objects.order_by("id").prefetch_related(
+            product_stats_prefetch(request)
+        ),
+    )
 
 
-class StoreViewSet(viewsets.ModelViewSet):
+class StoreViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
     queryset = Store.objects.all()
     serializer_class = StoreSerializer
     pagination_class = None
@@ -76,7 +93,7 @@ class StoreViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         # Fetch the logged-in user's related customer instance
-        customer = Customer.objects.get(user=self.request.user)
+        customer = current_customer(self.request)
         serializer.save(customer=customer)
 
     # @action(detail=True, methods=["post"])
@@ -99,20 +116,47 @@ class StoreViewSet(viewsets.ModelViewSet):
         GET request for a single store
         """
         try:
-            store = Store.objects.get(pk=pk)
+            # The payload changes with the store row (touched by favorites and
+            # owner edits) or with any of its products and their statistics
+            versions = (
+                Store.objects.filter(pk=pk)
+                .annotate(
+                    products_modified=Max("storeproduct__product__updated_at"),
+                    stats_modified=Max("storeproduct__product__stats__updated_at"),
+                )
+                .values_list("updated_at", "products_modified", "stats_modified")
+                .get()
+            )
+            etag, last_modified = conditional.validators(request, *versions)
+            response = conditional.not_modified(request, etag, last_modified)
+            if response is not None:
+                return response
+
+            store = (
+                Store.objects.select_related("customer__user")
+                .prefetch_related(store_products_prefetch(request))
+                .get(pk=pk)
+            )
             serializer = StoreSerializer(store, context={"request": request})
-            return Response(serializer.data)
+            return conditional.add_validators(
+                Response(serializer.data), etag, last_modified
+            )
         except Exception as ex:
             return HttpResponseServerError(ex)
     
     def list(self, request):
         """
-        GET request for a single store
+        GET request for a page of stores, paged with `limit` and `cursor`;
+        `envelope=legacy` returns a bare array with the next page in a `Link` header
         """
+        paginator = KeysetPagination(("id",))
+        stores = Store.objects.select_related("customer__user").prefetch_related(
+            store_products_prefetch(request)
+        )
+        stores = paginator.paginate_queryset(stores, request)
         try:
-            stores = Store.objects.all()
             serializer = StoreSerializer(stores, context={"request": request}, many=True)
-            return Response(serializer.data)
+            return paginator.get_paginated_response(serializer.data)
         except Exception as ex:
             return HttpResponseServerError(ex)
 
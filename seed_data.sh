@@ -4,20 +4,25 @@ rm -rf bangazonapi/migrations
 rm db.sqlite3
 python manage.py makemigrations bangazonapi
 python manage.py migrate
-python manage.py loaddata users
-python manage.py loaddata tokens
-python manage.py loaddata customers
-python manage.py loaddata product_category
-python manage.py loaddata product
-python manage.py loaddata payment
-python manage.py loaddata order
-python manage.py loaddata order_product
-python manage.py loaddata likes
-python manage.py loaddata ratings
-python manage.py loaddata recommendations
-python manage.py loaddata stores
-python manage.py loaddata storeproducts
-python manage.py loaddata favoritesellers
-python manage.py loaddata productrating
+# One process and one transaction for every fixture
+python manage.py loaddata \
+    users \
+    tokens \
+    customers \
+    product_category \
+    product \
+    payment \
+    order \
+    order_product \
+    likes \
+    ratings \
+    recommendations \
+    stores \
+    storeproducts \
+    favoritesellers \
+    productrating
+python manage.py rebuild_order_totals
+python manage.py rebuild_product_stats
+python manage.py rebuild_search_index
 
 
@@ -1,10 +1,19 @@
 import datetime
 import json
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import QuerySet
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
+from bangazonapi import inventory
+from bangazonapi.models import Order, OrderProduct, Product, StockHold
+from bangazonapi.querybudget import QueryBudgetTestMixin
 
 
-class OrderTests(APITestCase):
+class OrderTests(QueryBudgetTestMixin, APITestCase):
     def setUp(self) -> None:
         """
         Create a new account and create sample category
@@ -92,6 +101,134 @@ class OrderTests(APITestCase):
         self.assertEqual(json_response["size"], 0)
         self.assertEqual(len(json_response["lineitems"]), 0)
 
+    def test_line_item_quantity(self):
+        """
+        Ensure adding a product again increments its line item's quantity
+        """
+        caches["responses"].clear()
+        self.client.post("/cart", {"product_id": 1}, format="json")
+        response = self.client.post("/cart", {"product_id": 1, "quantity": 3}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(json.loads(response.content)["quantity"], 4)
+
+        response = self.client.post("/cart", {"product_id": 1, "quantity": 0}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        json_response = json.loads(self.client.get("/cart").content)
+        self.assertEqual(len(json_response["lineitems"]), 1)
+        self.assertEqual(json_response["size"], 4)
+        self.assertAlmostEqual(json_response["total"], 59.96)
+
+        self.assertEqual(json.loads(self.client.get("/cart/summary").content)["size"], 4)
+        with self.assertNumQueries(0):
+            response = self.client.get("/cart/summary")
+        self.assertEqual(json.loads(response.content), {"size": 4, "total": 59.96})
+
+        # Removing takes one unit at a time
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/cart/{json_response['lineitems'][0]['id']}")
+        self.assertEqual(json.loads(self.client.get("/cart").content)["size"], 3)
+        self.assertEqual(json.loads(self.client.get("/cart/summary").content)["size"], 3)
+
+    def test_cart_summary_invalidated_on_commit(self):
+        """
+        Ensure a summary read before a cart write commits isn't served after it
+        """
+        caches["responses"].clear()
+        self.assertEqual(json.loads(self.client.get("/cart/summary").content)["size"], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/cart", {"product_id": 1, "quantity": 2}, format="json")
+            # Not committed yet, so the cached summary is still current
+            response = self.client.get("/cart/summary")
+            self.assertEqual(json.loads(response.content)["size"], 0)
+
+        response = self.client.get("/cart/summary")
+        self.assertEqual(json.loads(response.content), {"size": 2, "total": 29.98})
+
+    def test_stock_holds(self):
+        """
+        Ensure carts hold stock, checkout decrements it and expired holds are released
+        """
+        response = self.client.post("/cart", {"product_id": 1, "quantity": 58}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post("/cart", {"product_id": 1, "quantity": 3}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Product.objects.get(pk=1).reserved, 58)
+
+        # Only the swept hold's units can be sold again
+        StockHold.objects.update(expires_at=timezone.now())
+        self.assertEqual(inventory.sweep_expired(), 1)
+        self.assertEqual(Product.objects.get(pk=1).reserved, 0)
+
+        stale = Product.objects.get(pk=1)
+        self.test_create_payment_type()
+        response = self.client.put("/orders/1", {"payment_type": 1}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        product = Product.objects.get(pk=1)
+        self.assertEqual((product.quantity, product.reserved), (2, 0))
+
+        # Saving a copy loaded before checkout, as a soft delete does, keeps the decrement
+        stale.save()
+        self.assertEqual(Product.objects.get(pk=1).quantity, 2)
+
+        # Stock changed on the instance has to be named to be saved
+        product.quantity = 10
+        with self.assertRaises(ValueError):
+            product.save()
+        self.assertEqual(Product.objects.get(pk=1).quantity, 2)
+        product.save(update_fields=["quantity"])
+        self.assertEqual(Product.objects.get(pk=1).quantity, 10)
+        product.name = "Box kite"
+        product.save()
+        self.assertEqual(Product.objects.get(pk=1).name, "Box kite")
+
+    def test_one_line_item_per_product(self):
+        """
+        Ensure an order can't repeat a product and racing adds land on one line item
+        """
+        self.client.post("/cart", {"product_id": 1}, format="json")
+        order = Order.objects.get(pk=1)
+        product = Product.objects.get(pk=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            OrderProduct.objects.create(order=order, product=product)
+
+        # Another request creates the line item between the update and the create
+        OrderProduct.objects.all().delete()
+        Order.objects.filter(pk=1).update(item_count=0, subtotal=0)
+        update = QuerySet.update
+
+        def racing_update(queryset, **kwargs):
+            updated = update(queryset, **kwargs)
+            if not OrderProduct.objects.exists():
+                OrderProduct.objects.create(
+                    order=order, product=product, quantity=2, unit_price=Decimal("14.99")
+                )
+            return updated
+
+        with mock.patch.object(QuerySet, "update", autospec=True, side_effect=racing_update):
+            line_item = OrderProduct.objects.add_units(order, product, 2)
+        self.assertEqual(line_item.quantity, 4)
+        self.assertEqual(OrderProduct.objects.filter(order=order).count(), 1)
+
+    def test_order_totals(self):
+        """
+        Ensure orders keep the totals of the prices their line items were added at
+        """
+        self.client.post("/cart", {"product_id": 1, "quantity": 3}, format="json")
+        line_item_id = json.loads(self.client.get("/cart").content)["lineitems"][0]["id"]
+        self.client.delete(f"/cart/{line_item_id}")
+
+        self.test_create_payment_type()
+        self.client.put("/orders/1", {"payment_type": 1}, format="json")
+        Product.objects.filter(pk=1).update(price=99.99)
+
+        json_response = json.loads(self.client.get("/orders/1").content)
+        self.assertEqual(json_response["item_count"], 2)
+        self.assertEqual(json_response["total"], "29.98")
+        self.assertEqual(json_response["lineitems"][0]["unit_price"], "14.99")
+        self.assertEqual(Order.objects.drift(), [])
+
     def test_create_payment_type(self):
         """
         Ensure we can add a payment type for a customer.
@@ -193,3 +330,68 @@ class OrderTests(APITestCase):
         self.assertNotEqual(second_cart["id"], first_order_id)
         self.assertEqual(second_cart["size"], 1)
         self.assertIsNone(second_cart.get("payment_type"))
+
+    def test_cart_and_order_query_count(self):
+        """
+        Ensure nested product payloads in carts and orders don't query per line item
+        """
+        for _ in range(2):
+            url = "/products"
+            data = {
+                "name": "Kite",
+                "price": 14.99,
+                "quantity": 60,
+                "description": "It flies high",
+                "category_id": 1,
+                "location": "Pittsburgh",
+            }
+            self.client.post(url, data, format="json")
+
+        for product_id in range(1, 4):
+            self.client.post("/cart", {"product_id": product_id}, format="json")
+
+        # Order, line items, and products with statistics; the customer comes with the token
+        with self.assertNumQueries(3):
+            response = self.client.get("/cart")
+        self.assertWithinQueryBudget(response)
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["size"], 3)
+        self.assertEqual(json_response["lineitems"][0]["product"]["number_sold"], 0)
+
+        order_id = json_response["id"]
+        self.test_create_payment_type()
+        self.client.put(f"/orders/{order_id}", {"payment_type": 1}, format="json")
+
+        # Orders, line items and products
+        with self.assertNumQueries(3):
+            response = self.client.get("/orders")
+        self.assertWithinQueryBudget(response)
+        json_response = json.loads(response.content)
+        self.assertEqual(len(json_response["results"][0]["lineitems"]), 3)
+        self.assertEqual(json_response["results"][0]["lineitems"][0]["product"]["number_sold"], 1)
+
+    def test_order_summary_view(self):
+        """
+        Ensure summary order listings take one query and filter by date range
+        """
+        self.client.post("/cart", {"product_id": 1, "quantity": 2}, format="json")
+        self.test_create_payment_type()
+        self.client.put("/orders/1", {"payment_type": 1}, format="json")
+        today = datetime.date.today()
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/orders?view=summary&start_date={today}")
+        self.assertWithinQueryBudget(response)
+        self.assertEqual(json.loads(response.content)["results"], [{
+            "id": 1,
+            "created_date": str(today),
+            "total": "29.98",
+            "item_count": 2,
+            "payment_merchant": "American Express",
+        }])
+
+        tomorrow = today + datetime.timedelta(days=1)
+        response = self.client.get(f"/orders?view=summary&start_date={tomorrow}")
+        self.assertEqual(json.loads(response.content)["results"], [])
+        response = self.client.get("/orders?end_date=yesterday")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
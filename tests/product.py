@@ -1,10 +1,38 @@
+import base64
 import json
 import datetime
+import os
+import tempfile
+from io import BytesIO, StringIO
+from django.core.cache import caches
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db.models import Sum
+from PIL import Image
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+from bangazonapi import cache, images, metrics, replicas
+from bangazonapi.pagination import KeysetPagination
+from bangazonapi.querybudget import QueryBudgetExceeded, QueryBudgetTestMixin
+from bangazonapi.models import (
+    Customer,
+    Favorite,
+    Order,
+    OrderProduct,
+    Payment,
+    Product,
+    ProductCategory,
+    ProductStats,
+    Rating,
+    Recommendation,
+    Store,
+    StoreProduct,
+)
 
 
-class ProductTests(APITestCase):
+class ProductTests(QueryBudgetTestMixin, APITestCase):
     def setUp(self) -> None:
         """
         Create a new account and create sample category
@@ -167,3 +195,713 @@ class ProductTests(APITestCase):
 
         # Verify that average_rating has been updated correctly
         self.assertEqual(product_data["average_rating"], 3.0)
+
+    def test_product_listings_query_count(self):
+        """
+        Ensure product listings load their statistics without a query per product
+        """
+        for product_id in range(1, 6):
+            self.test_create_product()
+            self.client.post(f"/products/{product_id}/like")
+            self.client.post(f"/products/{product_id}/rate-product", {"score": 3})
+
+        self.client.delete("/products/5")
+
+        # One windowed query for the category landing page; the token is cached
+        self.test_create_product()
+        self.test_create_product()
+        with self.assertNumQueries(1):
+            response = self.client.get("/products")
+        json_response = json.loads(response.content)
+        self.assertEqual(len(json_response), 1)
+        self.assertEqual(json_response[0]["category"], "Sporting Goods")
+        self.assertEqual(len(json_response[0]["products"]), 5)
+        self.assertEqual(json_response[0]["products"][0]["id"], 7)
+
+        # Products with their annotated statistics
+        with self.assertNumQueries(1):
+            response = self.client.get("/products?category=1")
+        json_response = json.loads(response.content)
+        self.assertEqual(len(json_response["results"]), 6)
+        self.assertTrue(json_response["results"][0]["is_liked"])
+        self.assertEqual(json_response["results"][0]["number_of_likes"], 1)
+        self.assertEqual(json_response["results"][0]["rating_count"], 1)
+        self.assertEqual(json_response["results"][0]["average_rating"], 3.0)
+
+        # Liked products; the customer comes with the token
+        with self.assertNumQueries(1):
+            response = self.client.get("/products/liked")
+        self.assertEqual(len(json.loads(response.content)), 4)
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/products/deleted")
+        self.assertEqual(len(json.loads(response.content)), 1)
+
+    def test_product_stats_follow_likes_and_ratings(self):
+        """
+        Ensure denormalized product statistics stay in sync with likes and ratings
+        """
+        self.test_create_product()
+
+        self.client.post("/products/1/like")
+        self.client.post("/products/1/rate-product", {"score": 5}, format="json")
+        self.client.post("/products/1/rate-product", {"score": 2}, format="json")
+
+        response = self.client.get("/products/1")
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["number_of_likes"], 1)
+        self.assertEqual(json_response["rating_count"], 2)
+        self.assertEqual(json_response["average_rating"], 3.5)
+
+        self.client.delete("/products/1/like")
+        rating = Rating.objects.get(score=2)
+        rating.score = 4
+        rating.save()
+        rating.delete()
+
+        response = self.client.get("/products/1")
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["number_of_likes"], 0)
+        self.assertEqual(json_response["rating_count"], 1)
+        self.assertEqual(json_response["average_rating"], 5.0)
+
+        # Stored statistics match a rebuild from the raw tables
+        call_command("rebuild_product_stats", "--check", stdout=StringIO())
+
+    def test_product_stats_follow_rating_remove(self):
+        """
+        Ensure removing a rating through the many-to-many manager counts it once
+        """
+        self.test_create_product()
+        product = Product.objects.get(pk=1)
+        customer = product.customer
+        high = Rating.objects.create(customer=customer, score=4)
+        low = Rating.objects.create(customer=customer, score=2)
+        product.rating.add(high, low)
+
+        product.rating.remove(high)
+
+        stats = ProductStats.objects.get(product=product)
+        self.assertEqual((stats.ratings_count, stats.ratings_sum), (1, 2))
+        call_command("rebuild_product_stats", "--check", stdout=StringIO())
+
+    def test_search_products(self):
+        """
+        Ensure full-text search ranks matches and skips soft-deleted products
+        """
+        url = "/products"
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        for name, description in [
+            ("Kite", "It flies high"),
+            ("Box kite", "A sturdy frame"),
+            ("Skateboard", "A kite for the street"),
+            ("Kite string", "Plenty of line"),
+        ]:
+            data = {
+                "name": name,
+                "price": 14.99,
+                "quantity": 60,
+                "description": description,
+                "category_id": 1,
+                "location": "Pittsburgh",
+            }
+            self.client.post(url, data, format="json")
+
+        self.client.delete("/products/4")
+        self.client.put(
+            "/products/2",
+            {
+                "name": "Box kite",
+                "price": 14.99,
+                "quantity": 60,
+                "description": "A sturdy frame",
+                "category_id": 1,
+                "created_date": datetime.date.today(),
+                "location": "Chicago",
+            },
+            format="json",
+        )
+
+        response = self.client.get("/products?q=kite")
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([product["id"] for product in json_response["results"]], [1, 2, 3])
+        self.assertIn("<mark>", json_response["results"][0]["snippet"])
+
+        # Seller markup comes back escaped around the highlight
+        self.client.put(
+            "/products/3",
+            {
+                "name": "Stunt kite",
+                "price": 14.99,
+                "quantity": 60,
+                "description": '<img src=x onerror="alert(1)"> Loops <b>fast</b>',
+                "category_id": 1,
+                "created_date": datetime.date.today(),
+                "location": "Pittsburgh",
+            },
+            format="json",
+        )
+        response = self.client.get("/products?q=loops")
+        snippet = json.loads(response.content)["results"][0]["snippet"]
+        self.assertEqual(
+            snippet,
+            "&lt;img src=x onerror=&quot;alert(1)&quot;&gt; <mark>Loops</mark> &lt;b&gt;fast&lt;/b&gt;",
+        )
+
+        response = self.client.get("/products?q=chicago")
+        json_response = json.loads(response.content)
+        self.assertEqual([product["id"] for product in json_response["results"]], [2])
+
+    def test_paginate_products_with_cursor(self):
+        """
+        Ensure filtered products are paged with a stable keyset cursor
+        """
+        url = "/products"
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        for price in [5, 10, 10, 10, 20]:
+            data = {
+                "name": "Kite",
+                "price": price,
+                "quantity": 60,
+                "description": "It flies high",
+                "category_id": 1,
+                "location": "Pittsburgh",
+            }
+            self.client.post(url, data, format="json")
+
+        seen = []
+        next_url = "/products?order_by=price&direction=desc&limit=2"
+        while next_url:
+            response = self.client.get(next_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            json_response = json.loads(response.content)
+            self.assertLessEqual(len(json_response["results"]), 2)
+            seen += [product["id"] for product in json_response["results"]]
+            next_url = json_response["next"]
+
+        self.assertEqual(seen, [5, 4, 3, 2, 1])
+
+        # Foreign keys page by their id column
+        seen = []
+        next_url = "/products?order_by=category&limit=2"
+        while next_url:
+            response = self.client.get(next_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            json_response = json.loads(response.content)
+            seen += [product["id"] for product in json_response["results"]]
+            next_url = json_response["next"]
+        self.assertEqual(seen, [1, 2, 3, 4, 5])
+
+        # Only columns a cursor can hold
+        for order in ("image_path", "deleted", "customer__user__password"):
+            response = self.client.get(f"/products?order_by={order}")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # The newest few, as before paging
+        json_response = json.loads(self.client.get("/products?quantity=2").content)
+        self.assertEqual([product["id"] for product in json_response["results"]], [5, 4])
+        self.assertIsNone(json_response["next"])
+
+        # NULLs page in both directions
+        for pk in (2, 4):
+            Product.objects.get(pk=pk).delete()
+        for ordering, expected in (
+            (("deleted", "id"), [1, 3, 5, 2, 4]),
+            (("-deleted", "-id"), [4, 2, 5, 3, 1]),
+        ):
+            seen = []
+            request = Request(APIRequestFactory().get("/products"))
+            while True:
+                paginator = KeysetPagination(ordering, page_size=2)
+                seen += [product.id for product in paginator.paginate_queryset(
+                    Product.all_objects.all(), request)]
+                if paginator.next_position is None:
+                    break
+                request = Request(APIRequestFactory().get(
+                    "/products", {"cursor": paginator.encode_cursor(paginator.next_position)}))
+            self.assertEqual(seen, expected)
+        for product in Product.deleted_objects.all():
+            product.undelete()
+
+        response = self.client.get("/products?category=1&envelope=legacy&limit=3")
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["header"], "Products matching filters")
+        self.assertEqual(len(json_response["products"]), 3)
+        self.assertIsNotNone(json_response["next"])
+
+        response = self.client.get("/products?category=1&cursor=garbage")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # Other listings keep their bare array, with the next page in a Link header
+        self.client.post("/register", {
+            "username": "ann",
+            "password": "Admin8*",
+            "email": "ann@example.com",
+            "address": "1 Main St",
+            "phone_number": "555-0000",
+            "first_name": "Ann",
+            "last_name": "Lee",
+        }, format="json")
+        response = self.client.get("/customers?envelope=legacy&limit=1")
+        self.assertEqual(len(json.loads(response.content)), 1)
+        self.assertIn('rel="next"', response["Link"])
+
+    def test_anonymous_landing_page_is_cached(self):
+        """
+        Ensure the anonymous landing page and category list are cached until the catalog changes
+        """
+        caches["responses"].clear()
+        self.test_create_product()
+        self.client.credentials()
+
+        response = self.client.get("/products")
+        self.assertEqual(len(json.loads(response.content)[0]["products"]), 1)
+        self.client.get("/productcategories")
+        with self.assertNumQueries(0):
+            response = self.client.get("/products")
+        # The categories' count and last update only
+        with self.assertNumQueries(1):
+            self.client.get("/productcategories")
+        self.assertEqual(len(json.loads(response.content)[0]["products"]), 1)
+
+        # A new product invalidates the cached landing page
+        self.test_create_product()
+        self.client.credentials()
+        response = self.client.get("/products")
+        self.assertEqual(len(json.loads(response.content)[0]["products"]), 2)
+
+        stats = cache.stats()
+        self.assertGreaterEqual(stats["catalog"]["hits"], 1)
+        self.assertGreaterEqual(stats["categories"]["hits"], 1)
+
+    def test_conditional_get_product(self):
+        """
+        Ensure an unchanged product answers If-None-Match with 304 and no serialization
+        """
+        self.test_create_product()
+
+        response = self.client.get("/products/1")
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+
+        # The updated-at lookup only
+        with self.assertNumQueries(1):
+            response = self.client.get("/products/1", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+        # Liking the product changes its statistics and so its ETag
+        self.client.post("/products/1/like")
+        response = self.client.get("/products/1", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertTrue(json.loads(response.content)["is_liked"])
+
+        response = self.client.get("/productcategories")
+        etag = response["ETag"]
+        response = self.client.get("/productcategories", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Without signals, as when another worker wrote it, the list still changes
+        ProductCategory.objects.bulk_create([ProductCategory(name="Kites")])
+        response = self.client.get("/productcategories", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(json.loads(response.content)), 2)
+
+    def test_create_product_with_image(self):
+        """
+        Ensure uploaded images are stored once under their content hash with resized variants
+        """
+        buffer = BytesIO()
+        Image.new("RGB", (800, 400), "red").save(buffer, format="PNG")
+        image = "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+        with tempfile.TemporaryDirectory() as media_root, self.settings(
+            MEDIA_ROOT=media_root, PRODUCT_IMAGE_WORKERS=0
+        ):
+            self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+            products = []
+            for _ in range(2):
+                data = {
+                    "name": "Kite",
+                    "price": 14.99,
+                    "quantity": 60,
+                    "description": "It flies high",
+                    "category_id": 1,
+                    "location": "Pittsburgh",
+                    "image_path": image,
+                }
+                response = self.client.post("/products", data, format="json")
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                products.append(json.loads(response.content))
+
+            # Identical uploads share one file
+            self.assertEqual(products[0]["image_path"], products[1]["image_path"])
+            self.assertNotIn("None", products[0]["image_path"])
+
+            stored = Product.objects.get(pk=1).image_path.name
+            thumbnail = images.variant_names(stored)["thumbnail"]
+            self.assertTrue(products[0]["image_variants"]["thumbnail"].endswith(thumbnail))
+            with Image.open(os.path.join(media_root, thumbnail)) as resized:
+                self.assertEqual(resized.size, (150, 75))
+
+            data["image_path"] = "data:text/plain;base64,aGVsbG8="
+            response = self.client.post("/products", data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_and_update_products(self):
+        """
+        Ensure many products are written at once, or none when any item is invalid
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        items = [
+            {
+                "name": f"Kite {number}",
+                "price": 14.99,
+                "quantity": 60,
+                "description": "It flies high",
+                "category_id": 1,
+                "location": "Pittsburgh",
+            }
+            for number in range(3)
+        ]
+        response = self.client.post("/products/bulk", items, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        created = json.loads(response.content)
+        self.assertEqual(created["created"], 3)
+        self.assertEqual(Product.objects.filter(stats__units_sold=0).count(), 3)
+
+        # The database assigns ids of new products
+        response = self.client.post(
+            "/products/bulk", [dict(items[0], id=created["ids"][0])], format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("id", json.loads(response.content)["errors"][0]["errors"])
+
+        response = self.client.get("/products?q=kite")
+        self.assertEqual(len(json.loads(response.content)["results"]), 3)
+
+        updates = [{"id": pk, "price": 9.99} for pk in created["ids"]]
+        updates.append({"id": created["ids"][0], "category_id": 99})
+        response = self.client.patch("/products/bulk", updates, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = json.loads(response.content)["errors"]
+        self.assertEqual([error["index"] for error in errors], [3])
+        self.assertEqual(Product.objects.filter(price=9.99).count(), 0)
+
+        response = self.client.patch("/products/bulk", [{"price": 9.99}], format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            json.loads(response.content)["errors"][0]["errors"]["id"], ["This field is required."]
+        )
+
+        response = self.client.patch("/products/bulk", updates[:3], format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)["updated"], 3)
+        self.assertEqual(Product.objects.filter(price=9.99).count(), 3)
+
+    def test_export_products(self):
+        """
+        Ensure the export streams every visible product matching the list filters
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        for name in ["Kite", "Box kite", "Skateboard"]:
+            data = {
+                "name": name,
+                "price": 14.99,
+                "quantity": 60,
+                "description": "It flies high",
+                "category_id": 1,
+                "location": "Pittsburgh",
+            }
+            self.client.post("/products", data, format="json")
+        self.client.delete("/products/2")
+
+        response = self.client.get("/products/export?format=ndjson")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], [1, 3])
+
+        response = self.client.get("/products/export?format=csv&name=Skate")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0].split(",")[:2], ["id", "name"])
+        self.assertEqual(rows[1].split(",")[:2], ["3", "Skateboard"])
+        self.assertEqual(len(rows), 2)
+
+    def test_import_catalog(self):
+        """
+        Ensure the import command resolves source ids and skips rows it can't
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            customers = os.path.join(directory, "customers.csv")
+            with open(customers, "w") as source:
+                source.write("id,username,first_name,last_name,email,phone_number,address\n")
+                source.write("c1,ann,Ann,Lee,ann@example.com,555-1212,1 Main St\n")
+            products = os.path.join(directory, "products.ndjson")
+            with open(products, "w") as source:
+                for product_id, customer_id in [(1, "c1"), (2, "c1"), (3, "unknown")]:
+                    row = {
+                        "id": product_id,
+                        "customer_id": customer_id,
+                        "category_id": 1,
+                        "name": f"Kite {product_id}",
+                        "price": 14.99,
+                        "description": "It flies high",
+                        "quantity": 60,
+                        "location": "Pittsburgh",
+                    }
+                    source.write(json.dumps(row) + "\n")
+                source.write("not json\n")
+            orders = os.path.join(directory, "orders.csv")
+            with open(orders, "w") as source:
+                source.write("id,customer_id,created_date\n")
+                source.write("o1,c1,2024-01-02\n")
+            lineitems = os.path.join(directory, "lineitems.csv")
+            with open(lineitems, "w") as source:
+                # The repeated product lands in two batches
+                source.write("order_id,product_id,quantity\n")
+                source.write("o1,1,2\no1,2,1\no1,1,1\n")
+
+            stdout = StringIO()
+            call_command(
+                "import_catalog",
+                customers=customers,
+                products=products,
+                orders=orders,
+                lineitems=lineitems,
+                batch_size=2,
+                stdout=stdout,
+                stderr=StringIO(),
+            )
+
+        self.assertIn("Imported 2 products", stdout.getvalue())
+        imported = Product.objects.filter(customer__user__username="ann")
+        self.assertEqual(imported.filter(stats__units_sold=0).count(), 2)
+        response = self.client.get("/products?q=kite")
+        self.assertEqual(len(json.loads(response.content)["results"]), 2)
+
+        order = Order.objects.get(customer__user__username="ann")
+        self.assertEqual(
+            list(order.lineitems.order_by("product__name").values_list("quantity", flat=True)),
+            [3, 1],
+        )
+        self.assertEqual(order.item_count, 4)
+
+    def test_generate_catalog(self):
+        """
+        Ensure generated sales are skewed and leave consistent statistics
+        """
+        counts = {
+            "customers": 20,
+            "stores": 4,
+            "products": 50,
+            "orders": 30,
+            "lineitems": 200,
+            "likes": 40,
+            "ratings": 20,
+            "favorites": 10,
+            "recommendations": 5,
+        }
+        call_command("generate_catalog", seed=7, stdout=StringIO(), **counts)
+
+        self.assertEqual(Product.objects.count(), 50)
+        self.assertEqual(ProductStats.objects.drift(), [])
+        top_seller = Product.objects.order_by("-stats__units_sold").first()
+        self.assertGreater(top_seller.number_sold, 200 / 50)
+        # Repeated picks are units of one line item
+        self.assertEqual(OrderProduct.objects.aggregate(units=Sum("quantity"))["units"], 200)
+
+    def test_benchmark_baseline(self):
+        """
+        Ensure the benchmark records a baseline and compares later runs with it
+        """
+        call_command("generate_catalog", scale=0.005, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, "baseline.json")
+            options = {
+                "endpoints": ["products_page", "cart"],
+                "requests": 3,
+                "warmup": 0,
+                "host": "testserver",
+                "baseline": baseline,
+                "stdout": StringIO(),
+            }
+            call_command("benchmark", save=True, **options)
+            with open(baseline) as baseline_file:
+                recorded = json.load(baseline_file)["endpoints"]
+            self.assertEqual(set(recorded), {"products_page", "cart"})
+            self.assertEqual(recorded["products_page"]["errors"], 0)
+            self.assertGreater(recorded["products_page"]["queries"], 0)
+
+            stdout = StringIO()
+            call_command("benchmark", threshold=1e9, **dict(options, stdout=stdout))
+            self.assertIn("Compared with baseline", stdout.getvalue())
+
+    def test_query_budgets(self):
+        """
+        Ensure hot product routes stay within their query budgets and overruns surface
+        """
+        self.test_create_product()
+        self.client.post("/products/1/like")
+
+        for url in ["/products", "/products?category=1", "/products/1", "/productcategories"]:
+            response = self.client.get(url)
+            self.assertWithinQueryBudget(response)
+
+        with self.settings(QUERY_BUDGET_ACTION="raise", QUERY_BUDGETS={"GET product-detail": 1}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get("/products/1")
+
+    def test_store_and_profile_query_budgets(self):
+        """
+        Ensure stores and the profile load their products without queries per store or product
+        """
+        steve = Customer.objects.get(user__username="steve")
+        stores = []
+        for number in range(3):
+            user = User.objects.create(username=f"seller{number}")
+            seller = Customer.objects.create(user=user, phone_number="555-0100", address="1 Main St")
+            stores.append(Store.objects.create(customer=seller, name=f"Store {number}"))
+            Favorite.objects.create(customer=steve, store=stores[-1])
+            for _ in range(3):
+                self.test_create_product()
+                product = Product.objects.latest("id")
+                StoreProduct.objects.create(store=stores[-1], product=product)
+                self.client.post(f"/products/{product.id}/like")
+                Recommendation.objects.create(customer=seller, product=product, recommender=steve)
+        self.client.post("/stores", {"name": "Kites", "description": "Kites only"}, format="json")
+
+        # Selling one product of the first store
+        self.client.post("/cart", {"product_id": 1}, format="json")
+        payment = Payment.objects.create(
+            customer=steve, merchant_name="Visa", account_number="0000", expiration_date="2030-01-01"
+        )
+        self.client.put("/orders/1", {"payment_type": payment.id}, format="json")
+
+        response = self.client.get("/stores")
+        self.assertWithinQueryBudget(response)
+        results = json.loads(response.content)["results"]
+        self.assertEqual([len(store["products"]) for store in results], [3, 3, 3, 0])
+        self.assertEqual([product["id"] for product in results[0]["products_sold"]], [1])
+        self.assertTrue(results[0]["products"][0]["is_liked"])
+
+        response = self.client.get(f"/stores/{stores[0].id}")
+        self.assertWithinQueryBudget(response)
+        self.assertEqual(len(json.loads(response.content)["products"]), 3)
+
+        response = self.client.get("/profile")
+        self.assertWithinQueryBudget(response)
+        json_response = json.loads(response.content)
+        self.assertEqual(len(json_response["favorites"]), 3)
+        self.assertEqual(len(json_response["likes"]), 9)
+        self.assertEqual(len(json_response["recommends"]), 9)
+        self.assertEqual(json_response["store"]["name"], "Kites")
+
+    def test_profile_request(self):
+        """
+        Ensure only allowed requests asking with X-Profile are profiled
+        """
+        self.test_create_product()
+        with tempfile.TemporaryDirectory() as directory, self.settings(
+            REQUEST_PROFILE_DIR=directory, REQUEST_PROFILE_TOKENS=[]
+        ):
+            response = self.client.get("/products/1", HTTP_X_PROFILE="1")
+            self.assertNotIn("X-Profile", response)
+
+            with self.settings(REQUEST_PROFILE_TOKENS=[self.token]):
+                response = self.client.get("/products/1", HTTP_X_PROFILE="1")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            name = response["X-Profile"]
+            with open(os.path.join(directory, f"{name}.txt")) as summary:
+                self.assertIn("samples over", summary.read())
+            self.assertTrue(os.path.exists(os.path.join(directory, f"{name}.collapsed")))
+
+    def test_metrics(self):
+        """
+        Ensure /metrics adds up the counters of every worker process
+        """
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            self.client.get("/products/1")
+            self.client.get("/productcategories")
+
+            # Another worker's file
+            other = metrics.ValueFile(os.path.join(directory, "metrics_1.db"))
+            other.add(
+                json.dumps(
+                    [
+                        "bangazon_http_requests",
+                        "bangazon_http_requests_total",
+                        [["method", "GET"], ["route", "productcategory"], ["status", "200"]],
+                    ]
+                ),
+                4,
+            )
+
+            response = self.client.get("/metrics")
+            body = response.content.decode()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            'bangazon_http_requests_total{method="GET",route="productcategory",status="200"} 5.0',
+            body,
+        )
+        self.assertIn(
+            'bangazon_http_request_duration_seconds_bucket{le="+Inf",route="product"} 1.0', body
+        )
+        self.assertIn('bangazon_db_queries_total{route="product"}', body)
+        self.assertIn('bangazon_cache_requests_total{namespace="categories",outcome="miss"}', body)
+
+    def test_token_cache(self):
+        """
+        Ensure resolved tokens are cached until the token, user, customer or store changes
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        self.client.get("/products/liked")
+
+        # Liked products only; token, user and customer come from the cache
+        with self.assertNumQueries(1):
+            response = self.client.get("/products/liked")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # The profile reads the store that came with the cached customer
+        self.client.get("/profile")
+        response = self.client.post(
+            "/stores", {"name": "Kites", "description": "Kites only"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.get("/profile")
+        self.assertEqual(json.loads(response.content)["store"]["name"], "Kites")
+
+        user = User.objects.get(username="steve")
+        user.is_active = False
+        user.save()
+        response = self.client.get("/products/liked")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        user.is_active = True
+        user.save()
+        Token.objects.filter(key=self.token).get().delete()
+        response = self.client.get("/products/liked")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_replica_pin(self):
+        """
+        Ensure users who just wrote keep reading from the primary
+        """
+        user = User.objects.get(username="steve")
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        with self.settings(DATABASE_REPLICAS=["default"]):
+            # Creating the category in setUp pinned the user
+            self.assertTrue(replicas.is_pinned(user))
+            caches["default"].delete(f"replica-pin:{user.pk}")
+
+            self.client.post("/productcategories", {"name": "Kites"}, format="json")
+            self.assertTrue(replicas.is_pinned(user))
+
+            caches["default"].delete(f"replica-pin:{user.pk}")
+            response = self.client.get("/productcategories")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertFalse(replicas.is_pinned(user))